@@ -5,13 +5,7 @@ import re
 import base64
 from collections import Counter
 import numpy as np
-from langchain_community.chat_models import ChatOllama
 from langchain.chains import ConversationChain, ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud
 import pandas as pd
@@ -19,20 +13,142 @@ from langchain.prompts import PromptTemplate
 import datetime
 import glob
 import html
+import uuid
+import time
+from contextlib import contextmanager
 from langchain.callbacks.base import BaseCallbackHandler
-from langchain_openai import ChatOpenAI  # Add this import
+from qa_retrieval import ContextBudgetRetriever, HierarchicalRetriever, get_context_budget
+from qa_hierarchy import build_hierarchy, load_hierarchy
+from qa_index import INDEX_TYPES, build_vectorstore
+from qa_ingest import UnsupportedFileError, clean_documents, load_file
+from chunk_store import ChunkStore, ChunkStoreGroup
+from parsed_cache import PARSED_CACHE_DIR, bytes_hash, read_parsed
+from upload_manifest import build_manifest, diff_manifests, manifest_entry
+from query_embedding import all_query_embedding_stats
+from backend_client import OLLAMA_BASE_URL, backend_stats, chat_model, is_openai_model, ollama_embeddings
+from model_residency import PRELOAD_MODELS, get_model_residency, keep_alive_for
+from ollama_hosts import get_host_pool
+from llm_scheduler import BACKGROUND, CHAT, DRAFT, PRIORITY_NAMES, QA, get_scheduler, model_name
+from completion_cache import cached_predict, get_completion_cache
+from singleflight import singleflight_stats
+from telemetry import load_records, summarize, telemetry_context, telemetry_handler
+from llm_cancel import cancellable
+from length_control import generate_to_length
+from reasoning import THINK_TOKEN_ALLOWANCE, AnswerOnlyMemory, ThinkStreamParser, is_reasoning_model, split_think, strip_think
+from course_library import LIBRARY_DIR, attach_course, list_courses
+from index_bundle import (
+    get_live_bundle, is_versioned_bundle, list_index_bundles, load_bundle_vectorstore,
+    read_bundle_manifest, resolve_bundle_path, save_vectorstore_bundle,
+)
 
 class StreamingCallbackHandler(BaseCallbackHandler):
-    """Callback handler for streaming LLM responses."""
+    """Callback handler for streaming LLM responses.
+    
+    <think> reasoning goes to reasoning_container instead of the answer,
+    redrawn at most every THINK_RENDER_INTERVAL seconds.
+    """
     
-    def __init__(self, container):
+    def __init__(self, container, reasoning_container=None):
         self.container = container
+        self.reasoning_container = reasoning_container
+        self.parser = ThinkStreamParser()
         self.text = ""
+        self._reasoning_drawn = 0.0
+    
+    @property
+    def reasoning(self):
+        return self.parser.reasoning
         
     def on_llm_new_token(self, token: str, **kwargs):
         """Run on new LLM token."""
-        self.text += token
-        self.container.markdown(self.text)
+        self.parser.feed(token)
+        self._draw()
+    
+    def on_llm_end(self, response, **kwargs):
+        self.parser.flush()
+        self._draw(final=True)
+    
+    def _draw(self, final=False):
+        # Drawn from the parser's totals: a late </think> moves the answer so far to the reasoning
+        if self.parser.answer != self.text:
+            self.text = self.parser.answer
+            self.container.markdown(self.text)
+        due = final or time.perf_counter() - self._reasoning_drawn >= THINK_RENDER_INTERVAL
+        if self.reasoning_container is not None and self.parser.reasoning and due:
+            self.reasoning_container.markdown(self.parser.reasoning)
+            self._reasoning_drawn = time.perf_counter()
+
+@contextmanager
+def scheduled_llm_call(priority, llm, operation=None):
+    """Wait for a scheduler slot for the llm's model, showing this session's place in the queue
+
+    The calls made inside are recorded in the telemetry log under the app
+    mode and operation (the priority class name if not given).
+    
+    The call can be cancelled: it updates a progress caption while it waits
+    and streams, and Streamlit stops the script at that update when the user
+    presses Stop, reruns the page or disconnects. The model's stream is then
+    closed so the server stops generating (see llm_cancel).
+    """
+    model = model_name(llm)
+    placeholder = st.empty()
+    stop_button = st.empty()
+    # Any click reruns the script; Stop only records why the answer is missing
+    stop_button.button("Stop", key=f"stop_generation_{uuid.uuid4().hex}", on_click=stop_generation)
+    
+    def on_wait(position):
+        placeholder.caption(f"Waiting for {model}: position {position} in the {PRIORITY_NAMES[priority]} queue")
+    
+    try:
+        with get_scheduler().slot(model, priority, st.session_state.session_id, on_wait=on_wait) as ticket:
+            placeholder.empty()
+            started = time.perf_counter()
+            
+            def still_wanted():
+                placeholder.caption(f"Generating with {model}… {time.perf_counter() - started:.0f}s")
+            
+            with telemetry_context(mode=st.session_state.app_mode, operation=operation or PRIORITY_NAMES[priority],
+                                   queue_wait_s=ticket.wait_seconds), cancellable(still_wanted):
+                yield
+    finally:
+        placeholder.empty()
+        stop_button.empty()
+
+def stop_generation():
+    """Stop button callback; the click's rerun has already cancelled the generation"""
+    st.session_state.generation_stopped = True
+
+def cached_llm_predict(priority, llm, prompt, operation=None, regenerate=False):
+    """llm.predict(prompt) in a scheduler slot, answered from the completion cache when it is enabled
+
+    Returns (completion, hit). regenerate skips the cached completion and
+    stores the new one in its place.
+    """
+    def predict(text):
+        with scheduled_llm_call(priority, llm, operation):
+            return strip_think(llm.predict(text))
+    
+    if not st.session_state.get("use_completion_cache"):
+        return predict(prompt), False
+    return cached_predict(
+        get_completion_cache(), llm, prompt, predict=predict,
+        force=st.session_state.get("cache_sampled_completions", False), regenerate=regenerate
+    )
+
+def generate_draft(llm, prompt, length, operation, plan=""):
+    """Draft text held to the assignment length: token cap, end marker, repetition guard and continuations"""
+    def call(limited_llm, request, stop, callbacks):
+        with scheduled_llm_call(DRAFT, llm, operation):
+            return limited_llm.predict(request, stop=stop, callbacks=callbacks)
+    
+    # Reasoning models think before they write; leave room for it under the token cap
+    extra_tokens = THINK_TOKEN_ALLOWANCE if is_reasoning_model(model_name(llm)) else 0
+    draft, report = generate_to_length(llm, prompt, length, call, plan=plan, extra_tokens=extra_tokens)
+    st.session_state.draft_length_report = report
+    return draft
+
+# Seconds between redraws of a streaming reasoning panel
+THINK_RENDER_INTERVAL = 0.5
 
 # Function to get base64 encoding of an image
 def get_base64_of_image(image_path):
@@ -62,6 +178,9 @@ def add_bg_from_local(image_path, element_selector):
     
     st.markdown(style, unsafe_allow_html=True)
 
+# Directory holding persisted Reading Q&A index bundles
+INDEX_DIR = "./indexes"
+
 # Set page configuration
 st.set_page_config(
     page_title="Assistant to Theology Studies",
@@ -294,9 +413,9 @@ def generate_wordcloud(text):
     
     return wordcloud, top_words
 
-def extract_text_from_documents(documents):
-    """Extract text from document objects"""
-    return " ".join([doc.page_content for doc in documents])
+def extract_text_from_documents(chunk_store):
+    """Extract the full text of the uploaded documents from their chunk store"""
+    return chunk_store.full_text()
 
 def generate_document_summary(text, llm):
     """Generate a concise summary of the document(s)"""
@@ -311,39 +430,39 @@ def generate_document_summary(text, llm):
         
         SUMMARY (less than 150 words):"""
         
-        summary = llm.predict(prompt)
+        # The summary is not shown, so there is no cache notice or Regenerate for it
+        summary, _ = cached_llm_predict(BACKGROUND, llm, prompt, "summary")
         return summary
     except Exception as e:
         return f"Error generating summary: {str(e)}"
 
-def process_document(uploaded_file):
+def process_document(uploaded_file, key=None):
     """Process the uploaded document and return document objects"""
     # Create a temporary file
     temp_file_path = None
     try:
+        # A file parsed before (under any name) is served from the parsed-text cache
+        file_bytes = uploaded_file.getvalue()
+        key = key or bytes_hash(file_bytes)
+        documents = read_parsed(key, source_name=uploaded_file.name, cache_dir=PARSED_CACHE_DIR)
+        if documents is not None:
+            return documents
+        
         # Create a temporary file manually without using context manager
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}")
         temp_file_path = temp_file.name
-        temp_file.write(uploaded_file.getvalue())
+        temp_file.write(file_bytes)
         temp_file.close()  # Close the file handle
         
-        # Select the appropriate loader based on file type
-        file_extension = uploaded_file.name.split('.')[-1].lower()
-        
-        if file_extension == 'pdf':
-            loader = PyPDFLoader(temp_file_path)
-        elif file_extension in ['docx', 'doc']:
-            loader = Docx2txtLoader(temp_file_path)
-        elif file_extension in ['txt', 'md']:
-            loader = TextLoader(temp_file_path)
-        else:
-            st.error(f"Unsupported file format: {file_extension}")
+        # Load the document with the loader for its file type
+        try:
+            documents = load_file(temp_file_path, source_name=uploaded_file.name,
+                                  cache_dir=PARSED_CACHE_DIR, key=key)
+        except UnsupportedFileError as e:
+            st.error(str(e))
             os.unlink(temp_file_path)
             return None
         
-        # Load the document
-        documents = loader.load()
-        
         # Clean up the temporary file
         if temp_file_path and os.path.exists(temp_file_path):
             os.unlink(temp_file_path)
@@ -357,30 +476,206 @@ def process_document(uploaded_file):
             os.unlink(temp_file_path)
         return None
 
-def process_documents_for_qa(documents):
-    """Process documents to create a retriever for QA"""
+def process_documents_for_qa(upload_files):
+    """Process uploaded files to create a retriever for QA
+    
+    upload_files maps content hash -> {"store", "vectors", "embedding_model", ...}.
+    Only files without vectors for the current embedding model are embedded.
+    """
     try:
-        # Split the documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=100
+        # Uploads next to an attached course must share the course's embedding space
+        course = st.session_state.get("course_library")
+        embedding_model = course["embedding_model"] if course else st.session_state.model
+        
+        # Embed new files and reuse the vectors of files embedded before
+        embeddings = ollama_embeddings(embedding_model, keep_alive=keep_alive_for(embedding_model))
+        vectors = []
+        for record in upload_files.values():
+            store = record["store"]
+            if record.get("embedding_model") != embedding_model:
+                record["vectors"] = np.asarray(
+                    embeddings.embed_documents([store.chunk_text(i) for i in range(len(store))]), dtype=np.float32
+                )
+                record["embedding_model"] = embedding_model
+            vectors.append(record["vectors"])
+        
+        # The compact chunk stores double as the FAISS docstore
+        chunks = ChunkStoreGroup(record["store"] for record in upload_files.values())
+        vectorstore, index_info = build_vectorstore(
+            chunks, embeddings, index_type=st.session_state.index_type, vectors=np.vstack(vectors)
         )
-        chunks = text_splitter.split_documents(documents)
+        index_info["embedding_model"] = embedding_model
+        st.session_state.index_info = index_info
         
-        # Create embeddings and vectorstore
-        embeddings = OllamaEmbeddings(model=st.session_state.model)
-        vectorstore = FAISS.from_documents(chunks, embeddings)
+        if course:
+            # Private uploads form an overlay searched together with the shared course index
+            return make_retriever(
+                course["vectorstore"],
+                search_params=course["search_params"],
+                overlay=vectorstore,
+                budget_tokens=get_context_budget(st.session_state.model)
+            )
         
-        return vectorstore.as_retriever()
+        # Section summaries for coarse-to-fine retrieval; sections never span two files
+        sources = [key for key, record in upload_files.items() for _ in range(len(record["store"]))]
+        hierarchy = build_hierarchy(sources, np.vstack(vectors))
+        
+        # MMR + dedup + token budget instead of stuffing every retrieved chunk
+        return make_retriever(
+            vectorstore,
+            hierarchy=hierarchy,
+            budget_tokens=get_context_budget(st.session_state.model)
+        )
     
     except Exception as e:
         st.error(f"Error creating retriever: {str(e)}")
         return None
 
+def make_retriever(vectorstore, hierarchy=None, **kwargs):
+    """Create the flat or coarse-to-fine retriever selected in the sidebar"""
+    st.session_state.hierarchy = hierarchy
+    if st.session_state.retrieval_mode == "Coarse-to-fine":
+        return HierarchicalRetriever(vectorstore=vectorstore, hierarchy=hierarchy, **kwargs)
+    return ContextBudgetRetriever(vectorstore=vectorstore, **kwargs)
+
+def on_retrieval_mode_change():
+    """Swap the current retriever for the other kind, keeping its index and settings"""
+    retriever = st.session_state.get("retriever")
+    if retriever is None or not hasattr(retriever, "budget_tokens"):
+        return
+    settings = {name: getattr(retriever, name) for name in ContextBudgetRetriever.__fields__ if name != "last_stats"}
+    vectorstore = settings.pop("vectorstore")
+    st.session_state.retriever = make_retriever(vectorstore, st.session_state.get("hierarchy"), **settings)
+    # Keep the conversation memory; only the retriever behind the chain changes
+    if st.session_state.get("conversation") is not None and hasattr(st.session_state.conversation, "retriever"):
+        st.session_state.conversation.retriever = st.session_state.retriever
+
+def attach_course_library(course_id):
+    """Attach a student session to a course's prebuilt reading set in the shared library"""
+    try:
+        vectorstore, search_params, embedding_model = attach_course(course_id, LIBRARY_DIR)
+    except Exception as e:
+        st.error(f"Error attaching course library: {str(e)}")
+        return None
+    
+    st.session_state.course_library = {
+        "course_id": course_id,
+        "vectorstore": vectorstore,
+        "search_params": search_params,
+        "embedding_model": embedding_model,
+    }
+    
+    # Re-embed any private uploads into the course's embedding space as an overlay
+    if st.session_state.chunk_store:
+        return process_documents_for_qa(st.session_state.upload_files)
+    
+    return make_retriever(
+        vectorstore,
+        search_params=search_params,
+        budget_tokens=get_context_budget(st.session_state.model)
+    )
+
+def save_current_index(name):
+    """Persist the current Reading Q&A index as a memory-mappable bundle"""
+    retriever = st.session_state.get("retriever")
+    if retriever is None or not hasattr(retriever, "vectorstore"):
+        st.error("No index to save. Upload documents first.")
+        return None
+    sanitized_name = re.sub(r'[^\w-]', '_', name).strip('_')
+    if not sanitized_name:
+        st.error("Please enter a name for the index.")
+        return None
+    try:
+        # Keep upload vectors (and so section summaries) when the index is exactly the uploads
+        upload_vectors = [record["vectors"] for record in st.session_state.upload_files.values() if "vectors" in record]
+        vectors = np.vstack(upload_vectors) if upload_vectors else None
+        if vectors is not None and len(vectors) != retriever.vectorstore.index.ntotal:
+            vectors = None
+        return save_vectorstore_bundle(
+            os.path.join(INDEX_DIR, sanitized_name),
+            retriever.vectorstore,
+            st.session_state.index_info,
+            vectors=vectors
+        )
+    except Exception as e:
+        st.error(f"Error saving index: {str(e)}")
+        return None
+
+def attach_index_bundle(name):
+    """Attach a saved index bundle read-only; the pages are shared with other sessions and processes"""
+    try:
+        path = os.path.join(INDEX_DIR, name)
+        manifest = read_bundle_manifest(path)
+        # Queries must be embedded with the model the bundle was built with
+        embedding_model = manifest["index"].get("embedding_model", st.session_state.model)
+        vectorstore, manifest = load_bundle_vectorstore(
+            path, ollama_embeddings(embedding_model, keep_alive=keep_alive_for(embedding_model))
+        )
+        st.session_state.index_info = manifest["index"]
+        return make_retriever(
+            vectorstore,
+            hierarchy=load_hierarchy(resolve_bundle_path(path)),
+            # Bundles kept up to date by library_watcher.py swap generations live
+            live_bundle=get_live_bundle(path) if is_versioned_bundle(path) else None,
+            budget_tokens=get_context_budget(st.session_state.model)
+        )
+    except Exception as e:
+        st.error(f"Error attaching index: {str(e)}")
+        return None
+
 def on_params_change():
     """Callback when parameters are changed"""
     st.session_state.params_changed = True
 
+def on_model_change():
+    """Callback when a model is selected: load it on this session's Ollama host before the first prompt"""
+    st.session_state.params_changed = True
+    if not is_openai_model(st.session_state.model):
+        host = get_host_pool(OLLAMA_BASE_URL).choose(st.session_state.model, sticky_key=st.session_state.session_id)
+        if host is not None:
+            get_model_residency(host.url).warm_async(st.session_state.model)
+
+@st.cache_resource
+def start_model_residency():
+    """Preload the pinned models on every Ollama host that serves them, once per server process"""
+    pool = get_host_pool(OLLAMA_BASE_URL)
+    pool.check_health()
+    for host in pool.hosts:
+        get_model_residency(host.url).preload([m for m in PRELOAD_MODELS if host.serves(m)])
+    return pool
+
+def show_telemetry_dashboard():
+    """Admin view of the LLM telemetry log: p50/p95 timings per mode, operation and model"""
+    st.header("LLM Telemetry")
+    records = load_records()
+    if not records:
+        st.info("No LLM calls recorded yet.")
+        return
+    
+    calls = pd.DataFrame(records)
+    llm_calls = [r for r in records if r.get("kind") == "llm"]
+    embedding_calls = [r for r in records if r.get("kind") == "embedding"]
+    st.caption(
+        f"{len(llm_calls)} LLM calls and {len(embedding_calls)} embedding calls since {calls['time'].iloc[0][:16]}, "
+        f"{int(calls['error'].notna().sum()) if 'error' in calls else 0} errors, "
+        f"{sum(1 for r in llm_calls if r.get('cancelled'))} cancelled "
+        f"(about {sum(r.get('saved_s') or 0.0 for r in llm_calls):.0f} s of generation saved)"
+    )
+    
+    for by in ("mode", "operation", "model"):
+        st.subheader(f"LLM calls per {by}")
+        st.dataframe(pd.DataFrame(summarize(llm_calls, by)).round(2), hide_index=True, use_container_width=True)
+    if embedding_calls:
+        st.subheader("Embedding calls per model")
+        st.dataframe(pd.DataFrame(summarize(embedding_calls, "model")).round(3), hide_index=True,
+                     use_container_width=True)
+    
+    errors = calls[calls["error"].notna()] if "error" in calls else calls.iloc[0:0]
+    if not errors.empty:
+        st.subheader("Recent errors")
+        columns = [c for c in ("time", "mode", "operation", "model", "error") if c in errors]
+        st.dataframe(errors[columns].tail(20), hide_index=True, use_container_width=True)
+
 def show_parameter_info():
     """Show information about temperature and top-p parameters"""
     with st.expander("🧠 Understanding Model Parameters", expanded=False):
@@ -423,6 +718,7 @@ def ensure_directories():
     """Ensure all required directories exist"""
     os.makedirs("./draftplan", exist_ok=True)
     os.makedirs("./draftwriting", exist_ok=True)
+    os.makedirs(INDEX_DIR, exist_ok=True)
     
 # Functions for draft management
 def save_draft_to_file(draft, topic):
@@ -538,6 +834,7 @@ def show_draft_editor(draft_content, is_new_draft=True):
                 
                 if filename:
                     st.session_state.assignment_draft = edited_draft
+                    st.session_state.draft_length_report = None
                     st.session_state.draft_filename = filename
                     st.success(f"Draft saved to {os.path.basename(filename)}")
                     
@@ -599,6 +896,10 @@ def highlight_changes(original_text, new_text):
 
 def initialize_session_state():
     """Initialize session state variables if they don't exist"""
+    # Identifies this session to the LLM scheduler's fair queueing
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    
     # Initialize mode
     if "app_mode" not in st.session_state:
         st.session_state.app_mode = "Simple Chat"
@@ -619,17 +920,41 @@ def initialize_session_state():
     if "top_p" not in st.session_state:
         st.session_state.top_p = 0.9
     
+    # Completion cache is opt-in; sampled (temperature > 0) completions are only cached when forced
+    if "use_completion_cache" not in st.session_state:
+        st.session_state.use_completion_cache = False
+    if "cache_sampled_completions" not in st.session_state:
+        st.session_state.cache_sampled_completions = False
+    
     # Initialize flags
     if "params_changed" not in st.session_state:
         st.session_state.params_changed = False
     if "retriever_changed" not in st.session_state:
         st.session_state.retriever_changed = False
-    if "documents" not in st.session_state:
-        st.session_state.documents = []
+    if "chunk_store" not in st.session_state:
+        st.session_state.chunk_store = None
     if "document_summary" not in st.session_state:
         st.session_state.document_summary = ""
     if "uploaded_doc_names" not in st.session_state:
         st.session_state.uploaded_doc_names = []
+    if "cleaning_stats" not in st.session_state:
+        st.session_state.cleaning_stats = {}
+    if "upload_manifest" not in st.session_state:
+        st.session_state.upload_manifest = {}
+    if "upload_files" not in st.session_state:
+        st.session_state.upload_files = {}
+    if "compress_context" not in st.session_state:
+        st.session_state.compress_context = True
+    if "index_type" not in st.session_state:
+        st.session_state.index_type = "auto"
+    if "retrieval_mode" not in st.session_state:
+        st.session_state.retrieval_mode = "Flat"
+    if "hierarchy" not in st.session_state:
+        st.session_state.hierarchy = None
+    if "index_info" not in st.session_state:
+        st.session_state.index_info = {}
+    if "course_library" not in st.session_state:
+        st.session_state.course_library = None
     
     # Initialize assignment assistant variables (renamed from course design)
     if "assignment_topic" not in st.session_state:
@@ -648,6 +973,10 @@ def initialize_session_state():
         st.session_state.assignment_draft = ""
     if "assignment_critique" not in st.session_state:
         st.session_state.assignment_critique = ""
+    if "plan_from_cache" not in st.session_state:
+        st.session_state.plan_from_cache = False
+    if "critique_from_cache" not in st.session_state:
+        st.session_state.critique_from_cache = False
     if "revision_number" not in st.session_state:
         st.session_state.revision_number = 0
     if "max_revisions" not in st.session_state:
@@ -692,46 +1021,28 @@ def initialize_session_state():
         temperature = st.session_state.temperature
         top_p = st.session_state.top_p
 
-        # Initialize the language model with parameters
-        if ("gpt" in model) or ("o3-mini" in model):
+        # Initialize the language model with parameters (on the shared connection pools)
+        if is_openai_model(model):
             # Check if API key is available
             if "openai_api_key" in st.session_state and st.session_state.openai_api_key:
                 os.environ["OPENAI_API_KEY"] = st.session_state.openai_api_key
-                if "gpt" in model:
-                    llm = ChatOpenAI(
-                        model=model,
-                        temperature=temperature,
-                        streaming=True
-                    )
-                else:
-                    llm = ChatOpenAI(
-                        model=model,
-                        streaming=True
-                    )
+                llm = chat_model(model, temperature=temperature)
             else:
                 # Instead of setting to None, provide a message but keep the previous LLM
                 if "llm" not in st.session_state:
                     st.error("OpenAI API key is required for GPT models")
                     # Default to a safe model option
                     model = "llama3.3"  # Fallback to a default model
-                    llm = ChatOllama(
-                        model=model,
-                        temperature=temperature,
-                        top_p=top_p,
-                        streaming=True
-                    )
+                    llm = chat_model(model, temperature=temperature, top_p=top_p, keep_alive=keep_alive_for(model),
+                                     sticky_key=st.session_state.session_id)
                 else:
                     # Keep the existing LLM
                     llm = st.session_state.llm
                     st.error("OpenAI API key is required for GPT models. Using previous model.")
         else:
             # Use Ollama for other models
-            llm = ChatOllama(
-                model=model,
-                temperature=temperature,
-                top_p=top_p,
-                streaming=True
-            )
+            llm = chat_model(model, temperature=temperature, top_p=top_p, keep_alive=keep_alive_for(model),
+                             sticky_key=st.session_state.session_id)
 
         # Store the LLM in session state for use in generating summaries
         st.session_state.llm = llm
@@ -739,8 +1050,12 @@ def initialize_session_state():
         
         # Handle different modes (add this check before creating the conversation)
         if st.session_state.app_mode == "Reading Q&A" and "retriever" in st.session_state and st.session_state.retriever:
+            # Keep the context budget in line with the currently selected model
+            if hasattr(st.session_state.retriever, "budget_tokens"):
+                st.session_state.retriever.budget_tokens = get_context_budget(model)
+            
             # Initialize memory for persistent chat history
-            memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+            memory = AnswerOnlyMemory(memory_key="chat_history", return_messages=True)
             
             # Custom prompt template for reading Q&A
             custom_prompt_template = """You are a helpful theological assistant that answers questions based on the provided theological texts.
@@ -775,7 +1090,7 @@ def initialize_session_state():
             )
         else:
             # Initialize memory for persistent chat history
-            memory = ConversationBufferMemory(return_messages=True)
+            memory = AnswerOnlyMemory(return_messages=True)
             
             # Initialize the conversation chain
             st.session_state.conversation = ConversationChain(
@@ -827,7 +1142,7 @@ def get_saved_plans():
     plans = glob.glob("./draftplan/plan_*.md")
     return sorted(plans, reverse=True)  # Most recent first
 
-def create_assignment_plan(topic, area, level, length, tone):
+def create_assignment_plan(topic, area, level, length, tone, regenerate=False):
     """Generate an assignment plan based on topic, area, level, length and tone"""
     llm = st.session_state.llm
     
@@ -853,7 +1168,10 @@ def create_assignment_plan(topic, area, level, length, tone):
     
     try:
         with st.spinner("Creating assignment plan..."):
-            plan = llm.predict(prompt)
+            # Callers rerun at once, so the cache notice is shown on the next run
+            plan, st.session_state.plan_from_cache = cached_llm_predict(
+                DRAFT, llm, prompt, "plan", regenerate=regenerate
+            )
             st.session_state.assignment_plan = plan
             st.session_state.assignment_stage = "plan"
             st.session_state.revision_number = 1
@@ -897,6 +1215,7 @@ def show_plan_editor(plan_content, is_new_plan=True):
                 
                 if filename:
                     st.session_state.assignment_plan = edited_plan
+                    st.session_state.plan_from_cache = False
                     st.session_state.plan_filename = filename
                     st.success(f"Plan saved to {os.path.basename(filename)}")
                     
@@ -956,6 +1275,7 @@ def enhanced_plan_stage():
                             
                             if loaded_plan:
                                 st.session_state.assignment_plan = loaded_plan
+                                st.session_state.plan_from_cache = False
                                 st.session_state.plan_filename = selected_path
                                 st.success(f"Loaded plan: {os.path.basename(selected_path)}")
                                 st.rerun()
@@ -1034,7 +1354,7 @@ def load_plan_from_file(filename):
         st.error(f"Error loading plan from file: {str(e)}")
         return None
 
-def create_assignment_plan(topic, area, level, length, tone):
+def create_assignment_plan(topic, area, level, length, tone, regenerate=False):
     """Generate an assignment plan based on topic, area, level, length and tone"""
     llm = st.session_state.llm
     
@@ -1060,7 +1380,10 @@ def create_assignment_plan(topic, area, level, length, tone):
     
     try:
         with st.spinner("Creating assignment plan..."):
-            plan = llm.predict(prompt)
+            # Callers rerun at once, so the cache notice is shown on the next run
+            plan, st.session_state.plan_from_cache = cached_llm_predict(
+                DRAFT, llm, prompt, "plan", regenerate=regenerate
+            )
             st.session_state.assignment_plan = plan
             st.session_state.assignment_stage = "plan"
             st.session_state.revision_number = 1
@@ -1112,7 +1435,7 @@ def update_create_assignment_draft():
         
         try:
             with st.spinner("Creating assignment draft..."):
-                draft = llm.predict(prompt)
+                draft = generate_draft(llm, prompt, length, "draft", plan=plan)
                 st.session_state.assignment_draft = draft
                 st.session_state.assignment_stage = "draft"
                 
@@ -1151,6 +1474,7 @@ def handle_return_from_advanced_chat():
             # If there was temporary draft content, update it
             if st.session_state.temp_draft_content:
                 st.session_state.assignment_draft = st.session_state.temp_draft_content
+                st.session_state.draft_length_report = None
                 st.session_state.temp_draft_content = ""
             
             # Show the draft editor
@@ -1184,6 +1508,19 @@ def draft_stage_section():
         st.markdown(st.session_state.assignment_draft)
         st.markdown("</div>", unsafe_allow_html=True)
         
+        # How the last generated draft was held to the requested length
+        report = st.session_state.get("draft_length_report")
+        if report:
+            details = []
+            if report["continuations"]:
+                details.append(f"{report['continuations']} continuation call{'s' if report['continuations'] > 1 else ''}")
+            if report["repetition_stops"]:
+                details.append(f"stopped {report['repetition_stops']}× on repeating output")
+            st.caption(
+                f"{report['words']:,} words (target {report['min_words']:,}-{report['max_words']:,})"
+                + (f", {', '.join(details)}" if details else "")
+            )
+        
         # Buttons for draft management and next steps
         col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
         
@@ -1215,6 +1552,7 @@ def draft_stage_section():
                             
                             if loaded_draft:
                                 st.session_state.assignment_draft = loaded_draft
+                                st.session_state.draft_length_report = None
                                 st.session_state.draft_filename = selected_path
                                 st.success(f"Loaded draft: {os.path.basename(selected_path)}")
                                 st.rerun()
@@ -1237,7 +1575,7 @@ def draft_stage_section():
                 if critique:
                     st.rerun()
                     
-def create_assignment_critique(draft, level, length, tone):
+def create_assignment_critique(draft, level, length, tone, regenerate=False):
     """Generate a critique of the assignment draft with consideration for length and tone"""
     llm = st.session_state.llm
     
@@ -1266,7 +1604,9 @@ def create_assignment_critique(draft, level, length, tone):
     
     try:
         with st.spinner("Creating assignment critique..."):
-            critique = llm.predict(prompt)
+            critique, st.session_state.critique_from_cache = cached_llm_predict(
+                DRAFT, llm, prompt, "critique", regenerate=regenerate
+            )
             st.session_state.assignment_critique = critique
             st.session_state.assignment_stage = "critique"
             return critique
@@ -1307,7 +1647,7 @@ def revise_assignment_draft(topic, area, level, length, tone, plan, draft, criti
     
     try:
         with st.spinner(f"Revising assignment draft (Revision #{st.session_state.revision_number})..."):
-            revised_draft = llm.predict(prompt)
+            revised_draft = generate_draft(llm, prompt, length, "revise", plan=plan)
             st.session_state.assignment_draft = revised_draft
             st.session_state.revision_number += 1
             st.session_state.assignment_stage = "draft"
@@ -1321,6 +1661,7 @@ def main():
     
     # Initialize session state
     initialize_session_state()
+    start_model_residency()
     
     # Handle returning from Advanced Chat mode
     handle_return_from_advanced_chat()
@@ -1335,6 +1676,10 @@ def main():
     st.markdown("<h1 class='main-title'>Assistant to Theology Studies</h1>", unsafe_allow_html=True)
     st.markdown("<p class='theology-subtitle'>Exploring faith, scripture, and theological understanding through conversation</p>", unsafe_allow_html=True)
     
+    if st.session_state.get("generation_stopped"):
+        st.info("Generation stopped.")
+        st.session_state.generation_stopped = False
+    
     # Display alert if images are missing
     if not nineveh_exists or not bible_exists:
         st.warning(f"""
@@ -1369,11 +1714,11 @@ def main():
             model_options,
             index=model_options.index(st.session_state.model) if st.session_state.model in model_options else 0,
             key="model",
-            on_change=on_params_change
+            on_change=on_model_change
         )
         
         # Add OpenAI API Key input if an OpenAI model is selected
-        if ("gpt" in st.session_state.model) or ("o3-mini" in st.session_state.model):
+        if is_openai_model(st.session_state.model):
             openai_api_key = st.sidebar.text_input(
                 "OpenAI API Key",
                 type="password",
@@ -1394,6 +1739,106 @@ def main():
             # No API key needed for non-GPT models
             st.session_state.api_key_missing = False
         
+        # Models loaded on each Ollama host, with the load time of each warm-up
+        with st.expander("Resident Models", expanded=False):
+            hosts = get_host_pool(OLLAMA_BASE_URL).hosts
+            for host in hosts:
+                residency = get_model_residency(host.url)
+                resident = residency.resident()
+                prefix = f"{host.url} · " if len(hosts) > 1 else ""
+                if resident is None:
+                    st.caption(f"{prefix}Ollama server not reachable.")
+                elif not resident:
+                    st.caption(f"{prefix}No models loaded.")
+                for entry in resident or []:
+                    load = f", loaded in {entry['load_seconds']:.1f}s" if entry["load_seconds"] else ""
+                    st.caption(
+                        f"{prefix}{entry['name']}: {entry['vram_gb']:.1f} GB VRAM, "
+                        f"{entry['expires'] or 'no expiry'}{load}"
+                    )
+                for loading_model in residency.loading():
+                    st.caption(f"{prefix}{loading_model}: loading…")
+                for failed_model, error in residency.failures().items():
+                    st.caption(f"{prefix}{failed_model}: warm-up failed ({error})")
+        
+        # Connection reuse on the shared backend pools (all sessions in this server process)
+        with st.expander("Backend Connections", expanded=False):
+            connection_stats = backend_stats()
+            if not connection_stats:
+                st.caption("No backend requests yet.")
+            for backend_name, stats in connection_stats.items():
+                st.caption(
+                    f"{backend_name}: {stats['requests']} requests over {stats['connections']} connections "
+                    f"({stats['reuse_rate']:.0%} reused), {stats['connect_ms']:.0f} ms connecting "
+                    f"(mean {stats['mean_connect_ms']:.1f} ms), {stats['in_flight']} in flight, "
+                    f"{stats['slot_wait_ms']:.0f} ms waiting for a slot"
+                )
+            # Generations stopped part way, and the server time that saved
+            cancellations = telemetry_handler.cancellation_stats()
+            if cancellations["cancelled"]:
+                st.caption(
+                    f"{cancellations['cancelled']} generations cancelled, about "
+                    f"{cancellations['saved_seconds']:.0f} s of generation saved"
+                )
+            # Identical requests that attached to one already in flight
+            for group_name, flights in singleflight_stats().items():
+                st.caption(
+                    f"{group_name}: {flights['coalesced']} of {flights['requests']} requests coalesced "
+                    f"({flights['hit_rate']:.0%}), {flights['in_flight']} in flight"
+                )
+            # Ollama hosts: load, errors and circuit breaker state
+            host_pool = get_host_pool(OLLAMA_BASE_URL).snapshot()
+            if len(host_pool["hosts"]) > 1:
+                for host in host_pool["hosts"]:
+                    health = "healthy" if host["healthy"] else "unhealthy"
+                    st.caption(
+                        f"{host['url']}: {health}, breaker {host['breaker']}, {host['in_flight']} in flight, "
+                        f"{host['requests']} requests, {host['errors']} errors"
+                    )
+                st.caption(
+                    f"{host_pool['failovers']} failovers, {host_pool['hedges']} hedged requests "
+                    f"({host_pool['hedge_wins']} won by the hedge)"
+                )
+            # Calls running and queued per model in the cross-session scheduler
+            schedule = get_scheduler().snapshot()
+            for queue_model, queue in schedule["models"].items():
+                waiting = ", ".join(f"{n} {name}" for name, n in queue["waiting"].items() if n) or "none"
+                st.caption(f"{queue_model}: {queue['running']}/{queue['limit']} running, waiting: {waiting}")
+            for class_name, waits in schedule["waits"].items():
+                if waits["calls"]:
+                    st.caption(
+                        f"{class_name} calls: {waits['calls']}, mean wait {waits['mean_wait']:.1f}s, "
+                        f"max {waits['max_wait']:.1f}s"
+                    )
+        
+        # Reuse completions for repeated plan, critique and summary prompts
+        with st.expander("Completion Cache", expanded=False):
+            st.checkbox(
+                "Cache completions",
+                key="use_completion_cache",
+                help="Answer a repeated plan, critique or document summary prompt with the stored completion "
+                     "instead of calling the model again."
+            )
+            st.checkbox(
+                "Cache even when temperature > 0",
+                key="cache_sampled_completions",
+                disabled=not st.session_state.use_completion_cache,
+                help="With a temperature above 0 each call gives a different answer, so these are not cached "
+                     "unless this is checked."
+            )
+            cache_stats = get_completion_cache().stats()
+            st.caption(
+                f"{cache_stats['entries']} completions ({cache_stats['bytes'] / 1024:.0f} KB), "
+                f"{cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                f"({cache_stats['hit_rate']:.0%}), {cache_stats['bypassed']} bypassed"
+            )
+            if st.button("Clear Completion Cache", key="clear_completion_cache_btn"):
+                get_completion_cache().clear()
+                st.rerun()
+        
+        # Admin view of per-call timings in place of the mode's page
+        st.checkbox("Show LLM telemetry dashboard", key="show_telemetry_dashboard")
+        
         # Only show parameters in Advanced Chat mode
         if st.session_state.app_mode == "Advanced Chat":
             # Add parameter information
@@ -1438,6 +1883,39 @@ def main():
         
         # Document upload section (only in Reading Q&A mode)
         if st.session_state.app_mode == "Reading Q&A":
+            # Course reading library shared by every student session
+            st.header("Course Library")
+            courses = list_courses(LIBRARY_DIR)
+            if st.session_state.course_library:
+                st.caption(f"Attached course: {st.session_state.course_library['course_id']}")
+                if st.button("Detach Course", key="detach_course_btn"):
+                    st.session_state.course_library = None
+                    st.session_state.retriever = (
+                        process_documents_for_qa(st.session_state.upload_files)
+                        if st.session_state.chunk_store else None
+                    )
+                    st.session_state.retriever_changed = True
+                    st.session_state.messages = []
+                    st.rerun()
+            elif courses:
+                course_id = st.selectbox(
+                    "Course",
+                    list(courses),
+                    format_func=lambda c: f"{c} ({courses[c]} passages)",
+                    key="course_selector"
+                )
+                if st.button("Attach Course", key="attach_course_btn"):
+                    with st.spinner(f"Attaching {course_id}..."):
+                        retriever = attach_course_library(course_id)
+                    if retriever:
+                        st.session_state.retriever = retriever
+                        st.session_state.retriever_changed = True
+                        st.session_state.attached_index = None
+                        st.session_state.messages = []
+                        st.success(f"Attached course library: {course_id}")
+            else:
+                st.caption("No course libraries have been ingested yet.")
+            
             st.header("Upload Documents")
             
             # Multi-document upload
@@ -1447,32 +1925,58 @@ def main():
                 accept_multiple_files=True
             )
             
-            if uploaded_files and (len(uploaded_files) != len(st.session_state.uploaded_doc_names)):
-                st.info("Processing documents...")
+            # Diff the uploads by content hash; only added files are processed
+            manifest = build_manifest(uploaded_files, st.session_state.upload_manifest)
+            added, removed = diff_manifests(st.session_state.upload_manifest, manifest)
+            
+            if added or removed:
+                upload_files = st.session_state.upload_files
+                for key in removed:
+                    upload_files.pop(key, None)
                 
-                # Reset document state
-                st.session_state.documents = []
-                st.session_state.uploaded_doc_names = []
+                if added:
+                    st.info(f"Processing {len(added)} new documents...")
+                uploads_by_hash = {}
+                for uploaded_file in uploaded_files or []:
+                    uploads_by_hash.setdefault(manifest_entry(uploaded_file, manifest)["hash"], uploaded_file)
                 
-                # Process each uploaded file
-                for uploaded_file in uploaded_files:
-                    file_docs = process_document(uploaded_file)
+                # Process each new file
+                for key in added:
+                    uploaded_file = uploads_by_hash[key]
+                    file_docs = process_document(uploaded_file, key=key)
+                    
+                    if file_docs:
+                        # Strip running headers, footers and page numbers before chunking
+                        file_docs, cleaning = clean_documents(file_docs)
                     
                     if file_docs:
-                        st.session_state.documents.extend(file_docs)
-                        st.session_state.uploaded_doc_names.append(uploaded_file.name)
+                        upload_files[key] = {
+                            "name": uploaded_file.name,
+                            "store": ChunkStore.from_documents(file_docs),
+                            "cleaning": cleaning,
+                        }
+                
+                # Failed files stay in the manifest so they are not retried on every rerun
+                st.session_state.upload_manifest = manifest
+                kept = [key for key in manifest if key in upload_files]
+                st.session_state.upload_files = upload_files = {key: upload_files[key] for key in kept}
+                st.session_state.chunk_store = ChunkStoreGroup(record["store"] for record in upload_files.values()) if kept else None
+                st.session_state.uploaded_doc_names = [manifest[key]["name"] for key in kept]
+                st.session_state.cleaning_stats = {manifest[key]["name"]: upload_files[key]["cleaning"] for key in kept}
                 
-                if st.session_state.documents:
-                    # Create retriever from all documents
-                    retriever = process_documents_for_qa(st.session_state.documents)
+                if st.session_state.chunk_store:
+                    # Create retriever from all documents, embedding only the new ones
+                    with telemetry_context(mode=st.session_state.app_mode, operation="index"):
+                        retriever = process_documents_for_qa(upload_files)
                     
                     if retriever:
                         st.success(f"Processed {len(st.session_state.uploaded_doc_names)} documents successfully!")
                         st.session_state.retriever = retriever
                         st.session_state.retriever_changed = True
+                        st.session_state.attached_index = None
                         
                         # Generate document summary
-                        full_text = extract_text_from_documents(st.session_state.documents)
+                        full_text = extract_text_from_documents(st.session_state.chunk_store)
                         with st.spinner("Generating document summary..."):
                             st.session_state.document_summary = generate_document_summary(
                                 full_text, 
@@ -1483,8 +1987,88 @@ def main():
                         st.session_state.messages = []
                     else:
                         st.error("Failed to create retriever from documents.")
-                else:
+                elif added:
                     st.error("Failed to process any documents.")
+                else:
+                    # Every upload was removed; keep an attached index or course without the overlay
+                    st.session_state.document_summary = ""
+                    if not st.session_state.get("attached_index"):
+                        course = st.session_state.course_library
+                        st.session_state.retriever = attach_course_library(course["course_id"]) if course else None
+                        st.session_state.retriever_changed = True
+                        st.session_state.messages = []
+            
+            # Vector index type used when documents are (re)processed
+            st.selectbox(
+                "Index Type",
+                ["auto"] + INDEX_TYPES,
+                key="index_type",
+                help="'auto' chooses exact search for small uploads and compressed indexes for large libraries"
+            )
+            if st.session_state.index_info:
+                info = st.session_state.index_info
+                st.caption(f"Index: {info['index_type']} ({info['factory']}) over {info['n_vectors']} chunks")
+            
+            # Flat search over every chunk, or section summaries first and then their chunks
+            st.selectbox(
+                "Retrieval",
+                ["Flat", "Coarse-to-fine"],
+                key="retrieval_mode",
+                on_change=on_retrieval_mode_change,
+                help="Coarse-to-fine picks the best sections by their summary vectors, then searches only their chunks"
+            )
+            
+            # Saved index bundles (memory-mapped, shared read-only between sessions)
+            with st.expander("Saved Indexes", expanded=False):
+                saved_indexes = list_index_bundles(INDEX_DIR)
+                if saved_indexes:
+                    selected_index = st.selectbox("Available Indexes", saved_indexes, key="index_bundle_selector")
+                    if st.button("Attach Index", key="attach_index_btn"):
+                        retriever = attach_index_bundle(selected_index)
+                        if retriever:
+                            st.session_state.retriever = retriever
+                            st.session_state.retriever_changed = True
+                            st.session_state.attached_index = selected_index
+                            st.session_state.course_library = None
+                            st.session_state.messages = []
+                            st.success(f"Attached index: {selected_index}")
+                else:
+                    st.info("No saved indexes found.")
+                
+                index_name = st.text_input("Save current index as", key="index_bundle_name")
+                if st.button("Save Index", key="save_index_btn"):
+                    saved_path = save_current_index(index_name)
+                    if saved_path:
+                        st.success(f"Index saved to {os.path.basename(saved_path)}")
+            
+            if st.session_state.get("attached_index"):
+                st.caption(f"Attached index: {st.session_state.attached_index}")
+            
+            # Query embeddings are shared by every session in this server process
+            with st.expander("Query Embedding", expanded=False):
+                embedding_stats = all_query_embedding_stats()
+                if not embedding_stats:
+                    st.caption("No questions embedded yet.")
+                for query_model, stats in embedding_stats.items():
+                    st.caption(
+                        f"{query_model}: {stats['requests']} queries, {stats['hit_rate']:.0%} cache hits, "
+                        f"{stats['coalesced']} coalesced, {stats['batches']} batches "
+                        f"(mean size {stats['mean_batch_size']:.1f}, mean wait {stats['mean_queue_wait_ms']:.1f} ms)"
+                    )
+                    if stats["batches"]:
+                        st.caption("Batch size")
+                        st.bar_chart(pd.DataFrame(stats["batch_sizes"], columns=["size", "batches"]).set_index("size"))
+                        st.caption("Queue wait (ms)")
+                        st.bar_chart(pd.DataFrame(stats["queue_wait_ms"], columns=["ms", "queries"]).set_index("ms"))
+            
+            # Sentence-level compression of retrieved passages
+            st.checkbox(
+                "Compress retrieved passages",
+                key="compress_context",
+                help="Keep only the sentences of each passage that best match the question"
+            )
+            if st.session_state.get("retriever") is not None and hasattr(st.session_state.retriever, "compress"):
+                st.session_state.retriever.compress = st.session_state.compress_context
             
             # Show list of uploaded documents
             if st.session_state.uploaded_doc_names:
@@ -1492,6 +2076,13 @@ def main():
                 st.subheader("Uploaded Documents:")
                 for i, doc_name in enumerate(st.session_state.uploaded_doc_names):
                     st.markdown(f"{i+1}. {doc_name}")
+                    cleaning = st.session_state.cleaning_stats.get(doc_name)
+                    if cleaning and cleaning["chars_removed"]:
+                        st.caption(
+                            f"Boilerplate removed: {cleaning['chars_removed']:,} characters "
+                            f"({cleaning['chars_removed'] / max(cleaning['chars_before'], 1):.1%}), "
+                            f"{cleaning['chunks_removed']} chunks, {cleaning['lines_removed']} lines"
+                        )
                 st.markdown("</div>", unsafe_allow_html=True)
         
         # Clear conversation button
@@ -1507,11 +2098,17 @@ def main():
                 st.session_state.assignment_plan = ""
                 st.session_state.assignment_draft = ""
                 st.session_state.assignment_critique = ""
+                st.session_state.plan_from_cache = False
+                st.session_state.critique_from_cache = False
                 st.session_state.revision_number = 0
                 st.session_state.assignment_stage = "input"
     
+    if st.session_state.get("show_telemetry_dashboard"):
+        show_telemetry_dashboard()
+        return
+    
     # Main content area
-    cols = st.columns([3, 1]) if st.session_state.app_mode == "Reading Q&A" and st.session_state.documents else [st.columns([1])[0], None]
+    cols = st.columns([3, 1]) if st.session_state.app_mode == "Reading Q&A" and st.session_state.chunk_store else [st.columns([1])[0], None]
     
     with cols[0]:
         if st.session_state.app_mode == "Simple Chat":
@@ -1531,6 +2128,15 @@ def main():
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+                if message.get("reasoning"):
+                    with st.expander("Reasoning", expanded=False):
+                        st.markdown(message["reasoning"])
+                if "context_tokens" in message:
+                    tokens_in, tokens_out = message.get("compression", (0, 0))
+                    st.caption(f"Context: {message['context_tokens']} tokens (compressed {tokens_in} → {tokens_out})")
+                if "prompt_tokens" in message:
+                    with_reasoning, sent = message["prompt_tokens"]
+                    st.caption(f"Prompt: {sent:,} tokens of history and question ({with_reasoning:,} with reasoning kept)")
         
         # Chat input
         if prompt := st.chat_input("What theology topic would you like to explore?", disabled=st.session_state.get("api_key_missing", False)):
@@ -1547,8 +2153,18 @@ def main():
                     st.error("Please configure a valid API key for the selected model")
                 return
             
+            # History plus question as sent, and as it would be if replies kept their reasoning
+            memory = getattr(st.session_state.conversation, "memory", None)
+            prompt_tokens = memory.prompt_tokens(prompt) if isinstance(memory, AnswerOnlyMemory) else None
+            reasoning = ""
+            
             # Generate and display assistant response
             with st.chat_message("assistant"):
+                # Reasoning models' <think> output goes to a collapsed panel above the answer
+                reasoning_container = None
+                if is_reasoning_model(st.session_state.model):
+                    reasoning_container = st.expander("Reasoning", expanded=False).empty()
+                
                 # Create an empty container for the streaming response
                 response_container = st.empty()
                 full_response = ""
@@ -1556,36 +2172,62 @@ def main():
                 # For Reading Q&A mode, which may not support streaming easily
                 if st.session_state.app_mode == "Reading Q&A" and "retriever" in st.session_state and st.session_state.retriever:
                     with st.spinner(f"Thinking using {st.session_state.model}..."):
-                        response = st.session_state.conversation({"question": prompt})
-                        response_text = response.get("answer", "I couldn't find an answer in the document.")
+                        with scheduled_llm_call(QA, st.session_state.llm, "qa"):
+                            response = st.session_state.conversation({"question": prompt})
+                        reasoning, response_text = split_think(
+                            response.get("answer", "I couldn't find an answer in the document.")
+                        )
+                        if reasoning and reasoning_container is not None:
+                            reasoning_container.markdown(reasoning)
                         response_container.markdown(response_text)
                         full_response = response_text
+                    
+                    # Record how much retrieved context this answer consumed
+                    context_stats = getattr(st.session_state.retriever, "last_stats", {})
+                    if context_stats:
+                        st.caption(
+                            f"Context: {context_stats['context_tokens']} / {context_stats['budget_tokens']} tokens "
+                            f"from {context_stats['packed']} of {context_stats['candidates']} passages "
+                            f"(compressed {context_stats['tokens_in']} → {context_stats['tokens_out']} tokens)"
+                        )
                 else:
                     # For regular chat modes that can use streaming
-                    streaming_handler = StreamingCallbackHandler(response_container)
+                    streaming_handler = StreamingCallbackHandler(response_container, reasoning_container)
                     
                     with st.spinner(f"Thinking using {st.session_state.model}..."):
                         try:
-                            response_text = st.session_state.conversation.predict(
-                                input=prompt,
-                                callbacks=[streaming_handler]
-                            )
-                            full_response = streaming_handler.text or response_text
+                            with scheduled_llm_call(CHAT, st.session_state.llm, "chat"):
+                                response_text = st.session_state.conversation.predict(
+                                    input=prompt,
+                                    callbacks=[streaming_handler]
+                                )
+                            full_response = streaming_handler.text or strip_think(response_text)
+                            reasoning = streaming_handler.reasoning
                         except Exception as e:
                             error_message = f"Error generating response: {str(e)}"
                             response_container.error(error_message)
                             full_response = error_message
             
             # Add assistant response to chat history
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
+            assistant_message = {"role": "assistant", "content": full_response}
+            if reasoning:
+                assistant_message["reasoning"] = reasoning
+            if prompt_tokens and is_reasoning_model(st.session_state.model):
+                assistant_message["prompt_tokens"] = prompt_tokens
+            if st.session_state.app_mode == "Reading Q&A" and st.session_state.get("retriever"):
+                context_stats = getattr(st.session_state.retriever, "last_stats", {})
+                if context_stats:
+                    assistant_message["context_tokens"] = context_stats["context_tokens"]
+                    assistant_message["compression"] = (context_stats["tokens_in"], context_stats["tokens_out"])
+            st.session_state.messages.append(assistant_message)
     
     # Display word cloud and document analysis for Document Q&A mode
-    if st.session_state.app_mode == "Reading Q&A" and st.session_state.documents and cols[1] is not None:
+    if st.session_state.app_mode == "Reading Q&A" and st.session_state.chunk_store and cols[1] is not None:
         with cols[1]:
             st.header("Document Analysis")
             
             # Extract text from documents
-            full_text = extract_text_from_documents(st.session_state.documents)
+            full_text = extract_text_from_documents(st.session_state.chunk_store)
             
             # Generate word cloud
             wordcloud, top_words = generate_wordcloud(full_text)
@@ -1712,6 +2354,7 @@ def main():
                             
                             if filename:
                                 st.session_state.assignment_plan = edited_plan
+                                st.session_state.plan_from_cache = False
                                 st.session_state.plan_filename = filename
                                 st.success(f"Plan saved to {os.path.basename(filename)}")
                                 
@@ -1736,7 +2379,7 @@ def main():
                 st.markdown("</div>", unsafe_allow_html=True)
                 
                 # Buttons for plan management and next steps
-                col1, col2, col3 = st.columns([1, 1, 1])
+                col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
                 
                 with col1:
                     if st.button("Edit Plan", key="edit_plan_btn"):
@@ -1764,6 +2407,7 @@ def main():
                                     
                                     if loaded_plan:
                                         st.session_state.assignment_plan = loaded_plan
+                                        st.session_state.plan_from_cache = False
                                         st.session_state.plan_filename = selected_path
                                         st.success(f"Loaded plan: {os.path.basename(selected_path)}")
                                         st.rerun()
@@ -1771,6 +2415,22 @@ def main():
                             st.info("No saved plans found.")
                 
                 with col3:
+                    if st.button("Regenerate Plan", key="regenerate_plan_btn",
+                                 help="Ask the model for a new plan instead of the cached one"):
+                        plan = create_assignment_plan(
+                            st.session_state.assignment_topic,
+                            st.session_state.theology_area,
+                            st.session_state.academic_level,
+                            st.session_state.assignment_length,
+                            st.session_state.assignment_tone,
+                            regenerate=True
+                        )
+                        if plan:
+                            st.rerun()
+                    if st.session_state.plan_from_cache:
+                        st.caption("This plan was served from the completion cache.")
+                
+                with col4:
                     if st.button("Create Assignment Draft", key="create_draft_btn"):
                         draft = create_assignment_draft(
                             st.session_state.assignment_topic,
@@ -1810,7 +2470,7 @@ def main():
             st.markdown("</div>", unsafe_allow_html=True)
             
             # Buttons for next steps
-            col1, col2, col3 = st.columns([1, 1, 1])
+            col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
             
             with col1:
                 if st.button("Back to Draft"):
@@ -1823,6 +2483,21 @@ def main():
                     st.rerun()
             
             with col3:
+                if st.button("Regenerate Critique", key="regenerate_critique_btn",
+                             help="Ask the model for a new critique instead of the cached one"):
+                    critique = create_assignment_critique(
+                        st.session_state.assignment_draft,
+                        st.session_state.academic_level,
+                        st.session_state.assignment_length,
+                        st.session_state.assignment_tone,
+                        regenerate=True
+                    )
+                    if critique:
+                        st.rerun()
+                if st.session_state.critique_from_cache:
+                    st.caption("This critique was served from the completion cache.")
+            
+            with col4:
                 # Only show revise button if under max revisions
                 if st.session_state.revision_number <= st.session_state.max_revisions:
                     if st.button("Revise Draft"):
@@ -1885,6 +2560,8 @@ def main():
                 st.session_state.assignment_plan = ""
                 st.session_state.assignment_draft = ""
                 st.session_state.assignment_critique = ""
+                st.session_state.plan_from_cache = False
+                st.session_state.critique_from_cache = False
                 st.session_state.revision_number = 0
                 st.session_state.assignment_stage = "input"
                 st.rerun()
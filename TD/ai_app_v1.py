@@ -2,8 +2,10 @@ import gradio as gr
 import langgraph
 from langchain.chat_models import ChatOpenAI
 
-# Initialize GPT-4o model
-gpt4o = ChatOpenAI(model_name="gpt-4o")
+from backend_client import openai_chat_model
+
+# Initialize GPT-4o model on the shared OpenAI connection pool
+gpt4o = openai_chat_model("gpt-4o", chat_class=ChatOpenAI)
 
 # Agent Definitions
 def planning_agent(topic):
@@ -0,0 +1,487 @@
+"""Shared HTTP client layer for the Ollama and OpenAI backends.
+
+LangChain's Ollama classes call requests.post directly, which opens a new
+TCP connection for every chat turn and for every embedded chunk. ChatOpenAI
+builds its own client per instance. Here each backend gets one process-wide
+connection pool with HTTP keep-alive, connect/read timeouts and a limit on
+concurrent requests. Each backend also records how many connections it
+opened, the time spent opening them, and how many requests reused one.
+
+Create models through chat_model(), ollama_embeddings() and
+openai_chat_model() instead of constructing ChatOllama, OllamaEmbeddings or
+ChatOpenAI directly.
+"""
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from typing import Optional, Union
+
+import requests
+from langchain_community.chat_models import ChatOllama
+from langchain_community.embeddings import OllamaEmbeddings
+from langchain_community.embeddings import ollama as ollama_embeddings_module
+from langchain_community.llms import ollama as ollama_llm_module
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from ollama_hosts import get_host_pool
+from singleflight import get_singleflight, request_key
+from llm_cancel import GenerationCancelled, current_check
+from telemetry import current_context, estimate_tokens, record_call, telemetry_handler
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+
+# Seconds to open a connection and to wait between streamed bytes
+# (a 32B model can think for minutes before its first token)
+BACKEND_TIMEOUTS = {
+    "ollama": (float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", 5)), float(os.environ.get("OLLAMA_READ_TIMEOUT", 600))),
+    "openai": (float(os.environ.get("OPENAI_CONNECT_TIMEOUT", 5)), float(os.environ.get("OPENAI_READ_TIMEOUT", 120))),
+}
+# Requests in flight per backend; the rest wait for a slot
+BACKEND_CONCURRENCY = {
+    "ollama": int(os.environ.get("OLLAMA_MAX_CONCURRENCY", 4)),
+    "openai": int(os.environ.get("OPENAI_MAX_CONCURRENCY", 16)),
+}
+
+
+class BackendStats:
+    """Request, connection and wait counters for one backend"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.connect_seconds = 0.0
+        self.slot_wait_seconds = 0.0
+        self.in_flight = 0
+
+    def add(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "reused": max(self.requests - self.connections, 0),
+                "reuse_rate": max(self.requests - self.connections, 0) / self.requests if self.requests else 0.0,
+                "connect_ms": self.connect_seconds * 1000,
+                "mean_connect_ms": self.connect_seconds * 1000 / self.connections if self.connections else 0.0,
+                "slot_wait_ms": self.slot_wait_seconds * 1000,
+                "in_flight": self.in_flight,
+            }
+
+
+# Per thread: the callback told about each request sent (see watch_connections)
+_connection_watch = threading.local()
+
+
+@contextmanager
+def watch_connections(callback):
+    """Call callback(connection) for each pooled request this thread sends inside the block
+
+    The callback runs once the request is sent, before the response
+    arrives. Ollama only sends its response headers with the first token,
+    so until then the connection is the only handle on the request.
+    """
+    previous = getattr(_connection_watch, "callback", None)
+    _connection_watch.callback = callback
+    try:
+        yield
+    finally:
+        _connection_watch.callback = previous
+
+
+def _counting_pool_classes(stats):
+    """urllib3 pool classes whose connections report their setup time to stats"""
+    def timed_connect(base):
+        def connect(self):
+            start = time.perf_counter()
+            base.connect(self)
+            stats.add(connections=1, connect_seconds=time.perf_counter() - start)
+        return connect
+
+    def watched_request(base):
+        def request(self, *args, **kwargs):
+            base.request(self, *args, **kwargs)
+            callback = getattr(_connection_watch, "callback", None)
+            if callback is not None:
+                callback(self)
+        return request
+
+    def connection_class(name, base):
+        return type(name, (base,), {"connect": timed_connect(base), "request": watched_request(base)})
+
+    http_connection = connection_class("CountingHTTPConnection", HTTPConnection)
+    https_connection = connection_class("CountingHTTPSConnection", HTTPSConnection)
+    return {
+        "http": type("CountingHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": http_connection}),
+        "https": type("CountingHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": https_connection}),
+    }
+
+
+class _CountingAdapter(HTTPAdapter):
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _counting_pool_classes(self.stats)
+
+
+class Backend:
+    """One backend's keep-alive connection pool, timeouts and concurrency limit"""
+
+    def __init__(self, name, timeout, max_concurrency):
+        self.name = name
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.stats = BackendStats()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.session = requests.Session()
+        adapter = _CountingAdapter(self.stats, pool_connections=4, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._http_client = None
+        self._local = threading.local()
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the backend's concurrent request slots; yields the seconds spent waiting for it"""
+        start = time.perf_counter()
+        self._slots.acquire()
+        wait = time.perf_counter() - start
+        self.stats.add(slot_wait_seconds=wait, in_flight=1)
+        try:
+            yield wait
+        finally:
+            self.stats.add(in_flight=-1)
+            self._slots.release()
+
+    def post(self, url, **kwargs):
+        """requests.post over the pooled session, with the backend's timeouts as the default"""
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        self.stats.add(requests=1)
+        response = self.session.post(url, **kwargs)
+        self._local.response = response
+        return response
+
+    def last_response(self):
+        """The response of this thread's most recent post (LangChain keeps only its line iterator)"""
+        return getattr(self._local, "response", None)
+
+    def get(self, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        self.stats.add(requests=1)
+        return self.session.get(url, **kwargs)
+
+    @property
+    def http_client(self):
+        """A shared httpx.Client for SDKs that take one (the OpenAI client)"""
+        if self._http_client is None:
+            import httpx
+
+            stats = self.stats
+
+            def on_request(request):
+                stats.add(requests=1)
+                started = {}
+
+                # httpcore reports the TCP and TLS phases of each new connection
+                def trace(event, info):
+                    if event in ("connection.connect_tcp.started", "connection.start_tls.started"):
+                        started[event] = time.perf_counter()
+                    elif event == "connection.connect_tcp.complete":
+                        elapsed = time.perf_counter() - started.pop("connection.connect_tcp.started")
+                        stats.add(connections=1, connect_seconds=elapsed)
+                    elif event == "connection.start_tls.complete":
+                        stats.add(connect_seconds=time.perf_counter() - started.pop("connection.start_tls.started"))
+
+                request.extensions["trace"] = trace
+
+            connect, read = self.timeout
+            self._http_client = httpx.Client(
+                timeout=httpx.Timeout(read, connect=connect, pool=None),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+                event_hooks={"request": [on_request]},
+            )
+        return self._http_client
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name):
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = Backend(name, BACKEND_TIMEOUTS[name], BACKEND_CONCURRENCY[name])
+        return _backends[name]
+
+
+def backend_stats():
+    """{backend name: stats snapshot} for every backend used in this process"""
+    with _backends_lock:
+        backends = dict(_backends)
+    return {name: backend.stats.snapshot() for name, backend in backends.items()}
+
+
+class _PooledRequests:
+    """Stands in for the requests module inside LangChain's Ollama modules"""
+
+    exceptions = requests.exceptions
+
+    def post(self, url, **kwargs):
+        return get_backend("ollama").post(url, **kwargs)
+
+
+# LangChain's Ollama classes call requests.post; send those calls through the pool
+ollama_llm_module.requests = _PooledRequests()
+ollama_embeddings_module.requests = _PooledRequests()
+
+
+def abort_connection(connection):
+    """Cut a request off from another thread
+
+    Closing the response would wait for the read in progress, which can
+    take minutes while a model reads a long prompt, and before the response
+    arrives there is nothing to close. Shutting the socket down ends the
+    read at once; the reading thread then sees a connection error.
+    """
+    sock = getattr(connection, "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _StreamAborter:
+    """The connections a stream's requests are using, shut down when every reader has gone"""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def _watch(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+        if self.cancelled.is_set():
+            abort_connection(connection)
+
+    def forget(self, connections):
+        """Stop watching connections that are going back to the pool"""
+        with self._lock:
+            self._connections.difference_update(connections)
+
+    @contextmanager
+    def sending(self):
+        """Watch the requests this thread sends inside the block; yields their connections
+
+        A request that fails is forgotten, since its connection may be
+        reused by an unrelated request.
+        """
+        connections = []
+
+        def watch(connection):
+            connections.append(connection)
+            self._watch(connection)
+
+        try:
+            with watch_connections(watch):
+                yield connections
+        except BaseException:
+            self.forget(connections)
+            raise
+
+    def abort(self):
+        self.cancelled.set()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            abort_connection(connection)
+
+
+class PooledChatOllama(ChatOllama):
+    """ChatOllama that holds an Ollama concurrency slot until its stream is consumed or closed
+
+    With routed set, each request goes to a host chosen by the Ollama host
+    pool (see ollama_hosts) instead of base_url; sticky_key keeps a
+    conversation on one host. Identical requests in flight at the same time
+    share one generation (see singleflight).
+    """
+
+    routed: bool = False
+    sticky_key: Optional[str] = None
+
+    def _create_stream(self, api_url, payload, stop=None, **kwargs):
+        key = request_key(api_url, payload, self._default_params, stop, kwargs)
+        return get_singleflight("ollama-chat").stream(
+            key, lambda on_abandon: self._pooled_stream(on_abandon, api_url, payload, stop, **kwargs),
+            poll=current_check(),
+        )
+
+    def _pooled_stream(self, on_abandon, api_url, payload, stop=None, **kwargs):
+        # Registered before the request is sent, so a stop while the model
+        # reads the prompt (before any response) also closes the request
+        aborter = _StreamAborter()
+        on_abandon(aborter.abort)
+        cancelled = aborter.cancelled
+
+        with get_backend("ollama").slot():
+            if not self.routed:
+                try:
+                    with aborter.sending() as connections:
+                        lines = super()._create_stream(api_url, payload, stop, **kwargs)
+                    yield from lines
+                except Exception:
+                    if not cancelled.is_set():
+                        raise
+                finally:
+                    aborter.forget(connections)
+                return
+
+            path = api_url[len(self.base_url):]
+            create_stream = super()._create_stream
+
+            def attempt(host):
+                try:
+                    with aborter.sending() as connections:
+                        lines = create_stream(host.url + path, payload, stop, **kwargs)
+                        response = get_backend("ollama").last_response()
+                        # The first line arrives with the first token; hedging races on it
+                        first = next(lines, None)
+                except Exception:
+                    if cancelled.is_set():
+                        raise GenerationCancelled() from None
+                    raise
+
+                def close():
+                    aborter.forget(connections)
+                    response.close()
+                return (first, lines, connections), close
+
+            try:
+                routed = get_host_pool(OLLAMA_BASE_URL).call(self.model, attempt, self.sticky_key)
+            except GenerationCancelled:
+                return
+            first, lines, connections = routed.value
+            try:
+                if first is not None:
+                    yield first
+                yield from lines
+            except Exception as e:
+                # A stream closed by cancellation is not the host's fault
+                routed.finish(error=None if cancelled.is_set() else e)
+                if not cancelled.is_set():
+                    raise
+            finally:
+                # Also reached when the caller stops reading: close the stream so Ollama stops generating
+                aborter.forget(connections)
+                routed.close()
+                routed.finish()
+
+
+class PooledOllamaEmbeddings(OllamaEmbeddings):
+    """OllamaEmbeddings whose requests share the Ollama pool and concurrency limit
+
+    Identical texts embedded at the same time share one request.
+    """
+
+    # Sent with every request, like ChatOllama.keep_alive; None uses the server default
+    keep_alive: Optional[Union[int, str]] = None
+
+    @property
+    def _default_params(self):
+        params = super()._default_params
+        if self.keep_alive is not None:
+            params["keep_alive"] = self.keep_alive
+        return params
+
+    routed: bool = False
+
+    def _process_emb_response(self, input):
+        key = request_key(self.base_url, self._default_params, input)
+        return get_singleflight("ollama-embeddings").call(key, lambda: self._pooled_emb_response(input))
+
+    def _pooled_emb_response(self, input):
+        start = time.perf_counter()
+        slot_wait = 0.0
+        error = None
+        try:
+            with get_backend("ollama").slot() as slot_wait:
+                if not self.routed:
+                    return super()._process_emb_response(input)
+
+                def attempt(host):
+                    embedding = OllamaEmbeddings._process_emb_response(self.copy(update={"base_url": host.url}), input)
+                    return embedding, lambda: None
+
+                routed = get_host_pool(OLLAMA_BASE_URL).call(self.model, attempt)
+                routed.finish()
+                return routed.value
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            fields = {**current_context(), "queue_wait_s": slot_wait}
+            record_call(kind="embedding", model=self.model, prompt_tokens=estimate_tokens(input),
+                        duration_s=time.perf_counter() - start - slot_wait, error=error, **fields)
+
+
+def is_openai_model(model):
+    return "gpt" in model or "o3-mini" in model
+
+
+def ollama_chat_model(model, temperature=None, top_p=None, streaming=True, **kwargs):
+    # An explicit base_url pins the model to that server; otherwise the host pool routes
+    kwargs.setdefault("routed", "base_url" not in kwargs)
+    kwargs.setdefault("base_url", OLLAMA_BASE_URL)
+    return PooledChatOllama(model=model, temperature=temperature, top_p=top_p, streaming=streaming, **kwargs)
+
+
+def ollama_embeddings(model, **kwargs):
+    kwargs.setdefault("routed", "base_url" not in kwargs)
+    kwargs.setdefault("base_url", OLLAMA_BASE_URL)
+    return PooledOllamaEmbeddings(model=model, **kwargs)
+
+
+def openai_chat_model(model, chat_class=None, **kwargs):
+    """ChatOpenAI on the shared OpenAI connection pool
+
+    chat_class defaults to langchain_openai.ChatOpenAI; any ChatOpenAI that
+    accepts http_client works.
+    """
+    if chat_class is None:
+        from langchain_openai import ChatOpenAI as chat_class
+    backend = get_backend("openai")
+    return chat_class(model=model, http_client=backend.http_client, max_retries=2, **kwargs)
+
+
+def chat_model(model, temperature=None, top_p=None, streaming=True, keep_alive=None, sticky_key=None):
+    """Chat model for a model name: ChatOpenAI for OpenAI models, ChatOllama otherwise
+
+    keep_alive and sticky_key only apply to Ollama models (see
+    model_residency.keep_alive_for and ollama_hosts). Every call is recorded
+    by the telemetry handler.
+    """
+    callbacks = [telemetry_handler]
+    if is_openai_model(model):
+        # o3-mini takes no temperature
+        if "gpt" in model and temperature is not None:
+            return openai_chat_model(model, temperature=temperature, streaming=streaming, callbacks=callbacks)
+        return openai_chat_model(model, streaming=streaming, callbacks=callbacks)
+    return ollama_chat_model(model, temperature=temperature, top_p=top_p, streaming=streaming,
+                             keep_alive=keep_alive, sticky_key=sticky_key, callbacks=callbacks)
@@ -0,0 +1,273 @@
+"""Headless batch indexer: build a Reading Q&A index bundle from a folder of documents.
+
+Usage:
+    python batch_indexer.py readings/ --name systematic_theology --model llama3.3 --workers 4
+
+Runs the same load -> split -> embed pipeline as the Streamlit app, without
+Streamlit. Embedded files are checkpointed under <bundle>/.work, so an
+interrupted run resumes where it stopped. The result is published as a new
+generation of ./indexes/<name>, which the app lists under "Saved Indexes".
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import numpy as np
+from langchain.schema import Document
+
+from backend_client import ollama_embeddings
+from index_bundle import publish_bundle_generation
+from parsed_cache import PARSED_CACHE_DIR, file_hash
+from qa_index import INDEX_TYPES, build_index
+from qa_ingest import (
+    CHUNK_OVERLAP, CHUNK_SIZE, clean_documents, find_document_files, load_file, split_documents,
+)
+
+INDEX_DIR = "./indexes"
+WORK_DIR_NAME = ".work"
+
+
+def file_key(path):
+    """Checkpoint key for a file: the SHA-256 of its content
+
+    Renaming or touching a file keeps its key, so it is never re-embedded.
+    The same key addresses the file in the parsed-text cache.
+    """
+    return file_hash(path)
+
+
+def _checkpoint_paths(work_dir, key):
+    return os.path.join(work_dir, f"{key}.json"), os.path.join(work_dir, f"{key}.npy")
+
+
+def has_checkpoint(work_dir, key):
+    chunks_path, vectors_path = _checkpoint_paths(work_dir, key)
+    return os.path.exists(chunks_path) and os.path.exists(vectors_path)
+
+
+def write_checkpoint(work_dir, key, record, vectors):
+    """Save one file's chunks and vectors; the .json is written last and marks completion"""
+    chunks_path, vectors_path = _checkpoint_paths(work_dir, key)
+    tmp_vectors = vectors_path + ".tmp.npy"
+    np.save(tmp_vectors, np.asarray(vectors, dtype=np.float32))
+    os.replace(tmp_vectors, vectors_path)
+
+    tmp_chunks = chunks_path + ".tmp"
+    with open(tmp_chunks, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, default=str)
+    os.replace(tmp_chunks, chunks_path)
+
+
+def read_checkpoint(work_dir, key):
+    chunks_path, vectors_path = _checkpoint_paths(work_dir, key)
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        record = json.load(f)
+    return record, np.load(vectors_path)
+
+
+def prune_checkpoints(work_dir, live_keys):
+    """Delete checkpoints of files that are no longer in the folder"""
+    removed = 0
+    for name in os.listdir(work_dir):
+        key = name.split(".", 1)[0]
+        if key not in live_keys:
+            os.remove(os.path.join(work_dir, name))
+            removed += name.endswith(".json")
+    return removed
+
+
+def _load_worker(path, folder, key, cache_dir):
+    """Process-pool worker: load one file and return plain data (Documents pickle poorly)"""
+    source_name = os.path.relpath(path, folder)
+    documents = load_file(path, source_name=source_name, cache_dir=cache_dir, key=key)
+    return [(doc.page_content, doc.metadata) for doc in documents]
+
+
+def _embed_batches(embeddings, texts, batch_size, pool):
+    """Embed texts in batches on a thread pool, preserving order"""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    futures = [pool.submit(embeddings.embed_documents, batch) for batch in batches]
+    vectors = []
+    for future in futures:
+        vectors.extend(future.result())
+    return vectors
+
+
+def index_folder(folder, bundle_root, embeddings, embedding_model, workers=4, batch_size=32,
+                 index_type="auto", log=print, keys=None, parsed_cache_dir=PARSED_CACHE_DIR):
+    """Index every supported file under folder and publish a bundle generation
+
+    Files whose content hash already has a checkpoint are reused without
+    parsing or embedding; checkpoints of removed files are pruned. keys may
+    pass precomputed {path: content hash}. Parsed pages are reused from
+    parsed_cache_dir, so files that must be re-embedded are not re-parsed.
+    Returns a stats dict with per-stage counts and timings.
+    """
+    files = find_document_files(folder)
+    if not files:
+        raise ValueError(f"No supported documents found in {folder}")
+
+    work_dir = os.path.join(bundle_root, WORK_DIR_NAME)
+    os.makedirs(work_dir, exist_ok=True)
+
+    keys = {path: (keys or {}).get(path) or file_key(path) for path in files}
+    pending = []
+    pending_keys = set()
+    for path in files:
+        # Two copies of the same file only need to be processed once
+        if not has_checkpoint(work_dir, keys[path]) and keys[path] not in pending_keys:
+            pending.append(path)
+            pending_keys.add(keys[path])
+    pruned = prune_checkpoints(work_dir, set(keys.values()))
+    log(f"{len(files)} files, {len(files) - len(pending)} already indexed, {len(pending)} to process"
+        + (f", {pruned} removed" if pruned else ""))
+
+    stats = {"files": len(files), "resumed": len(files) - len(pending), "failed": [],
+             "pages": 0, "chunks": 0, "embeddings": 0, "chars_removed": 0, "chunks_removed": 0,
+             "load_seconds": 0.0, "split_seconds": 0.0, "embed_seconds": 0.0, "index_seconds": 0.0}
+
+    # Stage 1: load files in parallel processes (PDF parsing is CPU-bound)
+    start = time.perf_counter()
+    loaded = {}
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_load_worker, path, folder, keys[path], parsed_cache_dir): path for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    loaded[path] = [Document(page_content=text, metadata=meta) for text, meta in future.result()]
+                    stats["pages"] += len(loaded[path])
+                except Exception as e:
+                    stats["failed"].append(path)
+                    log(f"  failed to load {path}: {e}")
+    stats["load_seconds"] = time.perf_counter() - start
+
+    # Stage 2: strip boilerplate and split into chunks
+    start = time.perf_counter()
+    chunked = {}
+    cleaning = {}
+    for path, documents in loaded.items():
+        cleaned, cleaning[path] = clean_documents(documents)
+        stats["chars_removed"] += cleaning[path]["chars_removed"]
+        stats["chunks_removed"] += cleaning[path]["chunks_removed"]
+        chunked[path] = split_documents(cleaned)
+    stats["split_seconds"] = time.perf_counter() - start
+    stats["chunks"] = sum(len(chunks) for chunks in chunked.values())
+
+    # Stage 3: embed on a thread pool (requests to Ollama are I/O-bound), checkpointing per file
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for n, path in enumerate(pending, 1):
+            if path not in chunked:
+                continue
+            chunks = chunked[path]
+            vectors = _embed_batches(embeddings, [c.page_content for c in chunks], batch_size, pool)
+            record = {
+                "path": os.path.relpath(path, folder),
+                "pages": len(loaded[path]),
+                "cleaning": cleaning[path],
+                "chunks": [{"text": c.page_content, "metadata": c.metadata} for c in chunks],
+            }
+            write_checkpoint(work_dir, keys[path], record, vectors)
+            stats["embeddings"] += len(vectors)
+            log(f"  [{n}/{len(pending)}] {record['path']}: {len(chunks)} chunks "
+                f"({cleaning[path]['chars_removed']:,} boilerplate characters, "
+                f"{cleaning[path]['chunks_removed']} chunks removed)")
+    stats["embed_seconds"] = time.perf_counter() - start
+
+    # Stage 4: assemble every checkpoint and build the index
+    start = time.perf_counter()
+    all_chunks = []
+    all_vectors = []
+    indexed_files = []
+    for path in files:
+        if not has_checkpoint(work_dir, keys[path]):
+            continue
+        record, vectors = read_checkpoint(work_dir, keys[path])
+        if len(record["chunks"]) == 0:
+            continue
+        # Cite the file's current location, which may differ from where it was first indexed
+        source_name = os.path.relpath(path, folder)
+        for c in record["chunks"]:
+            metadata = dict(c["metadata"])
+            metadata["source"] = source_name
+            all_chunks.append(Document(page_content=c["text"], metadata=metadata))
+        all_vectors.append(vectors)
+        indexed_files.append({"path": source_name, "key": keys[path], "chunks": len(record["chunks"])})
+
+    if not all_chunks:
+        raise ValueError("No chunks were produced; nothing to index")
+
+    vectors = np.vstack(all_vectors)
+    index, info = build_index(vectors, index_type=index_type)
+    info["embedding_model"] = embedding_model
+    generation_path = publish_bundle_generation(
+        bundle_root, index, all_chunks, info,
+        extra={
+            "embedding_model": embedding_model,
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "files": indexed_files,
+        },
+        vectors=vectors
+    )
+    stats["index_seconds"] = time.perf_counter() - start
+    stats["generation_path"] = generation_path
+    stats["index"] = info
+    return stats
+
+
+def _rate(count, seconds):
+    return f"{count / seconds:,.1f}/s" if seconds > 0 else "n/a"
+
+
+def print_stats(stats):
+    print()
+    print(f"Published {stats['generation_path']} ({stats['index']['index_type']}, {stats['index']['n_vectors']} chunks)")
+    print(f"  load:  {stats['pages']:>7} pages       in {stats['load_seconds']:7.1f}s  {_rate(stats['pages'], stats['load_seconds'])} pages")
+    print(f"  split: {stats['chunks']:>7} chunks      in {stats['split_seconds']:7.1f}s  {_rate(stats['chunks'], stats['split_seconds'])} chunks")
+    if stats["chars_removed"]:
+        print(f"  clean: removed {stats['chars_removed']:,} boilerplate characters, {stats['chunks_removed']} chunks")
+    print(f"  embed: {stats['embeddings']:>7} embeddings  in {stats['embed_seconds']:7.1f}s  {_rate(stats['embeddings'], stats['embed_seconds'])} embeddings")
+    print(f"  index: built in {stats['index_seconds']:.1f}s")
+    if stats["resumed"]:
+        print(f"  resumed {stats['resumed']} files from checkpoints")
+    if stats["failed"]:
+        print(f"  {len(stats['failed'])} files failed to load")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", help="Folder of PDF/DOCX/TXT/MD files")
+    parser.add_argument("--name", help="Bundle name (defaults to the folder name)")
+    parser.add_argument("--out-dir", default=INDEX_DIR, help="Directory holding index bundles")
+    parser.add_argument("--model", default="llama3.3", help="Ollama embedding model")
+    parser.add_argument("--index-type", default="auto", choices=["auto"] + INDEX_TYPES)
+    parser.add_argument("--workers", type=int, default=4, help="Parallel load and embedding workers")
+    parser.add_argument("--batch-size", type=int, default=32, help="Chunks per embedding request")
+    args = parser.parse_args()
+
+    name = args.name or os.path.basename(os.path.normpath(args.folder))
+    bundle_root = os.path.join(args.out_dir, name)
+
+    try:
+        stats = index_folder(
+            args.folder, bundle_root, ollama_embeddings(args.model), args.model,
+            workers=args.workers, batch_size=args.batch_size, index_type=args.index_type
+        )
+    except KeyboardInterrupt:
+        print("\nInterrupted. Re-run the same command to resume from the last indexed file.")
+        sys.exit(130)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print_stats(stats)
+
+
+if __name__ == "__main__":
+    main()
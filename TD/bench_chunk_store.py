@@ -0,0 +1,79 @@
+"""Measure session memory per 1,000 pages: Document lists versus the compact ChunkStore.
+
+Usage:
+    python bench_chunk_store.py                   # generated pages
+    python bench_chunk_store.py readings/*.pdf    # real files through the ingest pipeline
+"""
+import argparse
+import gc
+import tracemalloc
+
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema import Document
+
+from bench_pdf import SAMPLE_PARAGRAPHS
+from chunk_store import ChunkStore
+from qa_ingest import clean_documents, load_file, split_documents
+
+
+def sample_pages(n_pages, source="sample.pdf"):
+    """Pages of roughly 2,500 characters, like a typical book page"""
+    pages = []
+    for p in range(n_pages):
+        paragraphs = [SAMPLE_PARAGRAPHS[(p + i) % len(SAMPLE_PARAGRAPHS)] for i in range(18)]
+        pages.append(Document(page_content=f"[{p}] " + "\n".join(paragraphs), metadata={"source": source, "page": p}))
+    return pages
+
+
+def measure(build):
+    """Bytes still allocated by the object build() returns"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def document_session(pages):
+    """What a session held before: the page Documents plus the chunk Documents in the docstore"""
+    # Copy the page strings so their memory is counted, as it is for the ChunkStore buffer
+    documents = [Document(page_content=p.page_content.encode("utf-8").decode("utf-8"), metadata=dict(p.metadata))
+                 for p in pages]
+    chunks = split_documents(documents)
+    docstore = InMemoryDocstore({str(i): chunk for i, chunk in enumerate(chunks)})
+    return documents, chunks, docstore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="Documents to load (default: generated pages)")
+    parser.add_argument("--pages", type=int, default=1000, help="Number of generated pages")
+    args = parser.parse_args()
+
+    if args.files:
+        pages = []
+        for path in args.files:
+            pages.extend(clean_documents(load_file(path))[0])
+    else:
+        pages = sample_pages(args.pages)
+
+    (_, chunks, _), before = measure(lambda: document_session(pages))
+    store, after = measure(lambda: ChunkStore.from_documents(pages))
+
+    mismatched = sum(store.chunk_text(i) != chunk.page_content for i, chunk in enumerate(chunks))
+    per_1000 = 1000 / len(pages)
+    text_mb = sum(len(p.page_content.encode("utf-8")) for p in pages) / 1e6
+
+    print(f"{len(pages)} pages, {len(chunks)} chunks, {text_mb:.1f} MB of page text")
+    print(f"  Documents + docstore: {before * per_1000 / 1e6:8.2f} MB per 1,000 pages")
+    print(f"  ChunkStore:           {after * per_1000 / 1e6:8.2f} MB per 1,000 pages "
+          f"({store.memory_bytes() * per_1000 / 1e6:.2f} MB in buffers and arrays)")
+    print(f"  reduction:            {before / max(after, 1):8.1f}x")
+    if mismatched:
+        print(f"  warning: {mismatched} chunks differ from split_documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Compare flat and coarse-to-fine retrieval: query latency and recall@10.
+
+Usage:
+    python bench_hierarchy.py                         # 300 synthetic books
+    python bench_hierarchy.py --books 1000 --dim 1024
+    python bench_hierarchy.py --index-type hnsw --top-sections 4 8 16 32
+
+Recall is measured against exact search over every chunk.
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from bench_index import recall_at_k
+from qa_hierarchy import build_hierarchy, fine_search
+from qa_index import INDEX_TYPES, build_index
+
+
+def synthetic_library(books, sections_per_book, chunks_per_section, dim, noise=1.0, seed=0):
+    """Chunk vectors clustered by book and by section, with each chunk's book as its source"""
+    rng = np.random.default_rng(seed)
+    book_centers = rng.normal(size=(books, dim)).astype(np.float32)
+    section_offsets = rng.normal(scale=0.5, size=(books * sections_per_book, dim)).astype(np.float32)
+    section_centers = np.repeat(book_centers, sections_per_book, axis=0) + section_offsets
+    vectors = np.repeat(section_centers, chunks_per_section, axis=0)
+    vectors += rng.normal(scale=noise, size=vectors.shape).astype(np.float32)
+    sources = np.repeat(np.arange(books), sections_per_book * chunks_per_section).tolist()
+    return vectors, sources
+
+
+def time_queries(search, queries):
+    start = time.perf_counter()
+    found = [search(q) for q in queries]
+    return found, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=300)
+    parser.add_argument("--sections", type=int, default=20, help="Sections per book")
+    parser.add_argument("--chunks", type=int, default=16, help="Chunks per section")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--noise", type=float, default=1.0, help="Chunk spread around its section (higher = harder)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES)
+    parser.add_argument("--top-sections", type=int, nargs="+", default=[4, 8, 16, 32])
+    args = parser.parse_args()
+
+    vectors, sources = synthetic_library(args.books, args.sections, args.chunks, args.dim, args.noise)
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), size=args.queries, replace=False)
+    # Questions sit between a chunk and its section's topic
+    queries = vectors[picks] + rng.normal(scale=0.5 * args.noise, size=(args.queries, args.dim)).astype(np.float32)
+    k = 10
+
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, k)
+
+    index, info = build_index(vectors, index_type=args.index_type)
+    start = time.perf_counter()
+    hierarchy = build_hierarchy(sources, vectors, section_chunks=args.chunks)
+    build_seconds = time.perf_counter() - start
+
+    print(f"{len(vectors)} chunks x {args.dim} dims in {args.books} books, {len(hierarchy)} sections "
+          f"(hierarchy built in {build_seconds:.2f}s), {info['index_type']} index\n")
+    header = f"{'retriever':<22} {'query ms':>9} {'recall@10':>10} {'chunks scored':>14}"
+    print(header)
+    print("-" * len(header))
+
+    found, latency = time_queries(lambda q: index.search(q.reshape(1, -1), k)[1][0], queries)
+    print(f"{'flat':<22} {latency:>9.3f} {recall_at_k(ground_truth, found, k):>10.3f} {len(vectors):>14}")
+
+    for top_sections in args.top_sections:
+        def search(q):
+            ids = hierarchy.chunk_ids(hierarchy.top_sections(q, top_sections))
+            return fine_search(index, q, ids, k)[0]
+        found, latency = time_queries(search, queries)
+        label = f"coarse-to-fine top {top_sections}"
+        print(f"{label:<22} {latency:>9.3f} {recall_at_k(ground_truth, found, k):>10.3f} "
+              f"{top_sections * args.chunks:>14}")
+
+
+if __name__ == "__main__":
+    main()
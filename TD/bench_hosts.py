@@ -0,0 +1,93 @@
+"""Exercise multi-host Ollama routing against local stand-in servers.
+
+Usage:
+    python bench_hosts.py
+    python bench_hosts.py --conversations 12 --turns 5 --hedge-after 0.3
+
+Starts three stand-ins: a fast host, a host whose first token is sometimes
+very late, and a host that fails every request. Conversations chat through
+the routed ChatOllama, once without hedging and once with it. Reported per
+run: time to first token, how often a conversation stayed on one host, and
+each host's requests, errors and breaker ejections.
+"""
+import argparse
+import random
+import threading
+import time
+
+import numpy as np
+
+from backend_client import ollama_chat_model
+from ollama_hosts import Host, HostPool, set_host_pool
+from standin_ollama import start_standin
+
+
+class SlowSometimes:
+    """first_token that is late for a share of requests"""
+
+    def __init__(self, fast, slow, share, seed=0):
+        self.fast, self.slow, self.share = fast, slow, share
+        self.rng = random.Random(seed)
+
+    def __float__(self):
+        return self.slow if self.rng.random() < self.share else self.fast
+
+
+def run(servers, args, hedge_after):
+    pool = HostPool([Host(server.url, ["llama3.3"]) for server in servers], hedge_after_seconds=hedge_after)
+    set_host_pool(pool)
+    first_tokens = []
+    stayed = []
+
+    def conversation(i):
+        llm = ollama_chat_model("llama3.3", sticky_key=f"conversation-{i}")
+        hosts = []
+        for turn in range(args.turns):
+            start = time.perf_counter()
+            try:
+                # Distinct prompts, so identical in-flight requests are not coalesced
+                for n, _ in enumerate(llm.stream(f"Question {turn} from conversation {i}")):
+                    if n == 0:
+                        first_tokens.append(time.perf_counter() - start)
+            except Exception:
+                continue
+            hosts.append(pool.sticky.get((f"conversation-{i}", "llama3.3")))
+        stayed.append(len(set(hosts)) == 1)
+
+    threads = [threading.Thread(target=conversation, args=(i,)) for i in range(args.conversations)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.asarray(first_tokens), np.mean(stayed) if stayed else 0.0, pool.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--hedge-after", type=float, default=0.3, help="Seconds before a hedged request")
+    args = parser.parse_args()
+
+    servers = [
+        start_standin(models=["llama3.3"], first_token=0.05, token_delay=0.002),
+        start_standin(models=["llama3.3"], token_delay=0.002),
+        start_standin(models=["llama3.3"], fail_rate=1.0),
+    ]
+    labels = {servers[0].url: "fast", servers[1].url: "slow at times", servers[2].url: "failing"}
+
+    for hedge_after in (None, args.hedge_after):
+        servers[1].first_token = SlowSometimes(0.05, 1.5, 0.3)
+        first_tokens, stayed, snapshot = run(servers, args, hedge_after)
+        p50, p95 = np.percentile(first_tokens, [50, 95]) if len(first_tokens) else (0.0, 0.0)
+        print(f"hedging {'off' if hedge_after is None else f'after {hedge_after}s'}: "
+              f"{len(first_tokens)} turns, first token p50 {p50:.3f}s p95 {p95:.3f}s, "
+              f"{stayed:.0%} of conversations stayed on one host, "
+              f"{snapshot['hedges']} hedges ({snapshot['hedge_wins']} won), {snapshot['failovers']} failovers")
+        for host in snapshot["hosts"]:
+            print(f"  {labels[host['url']]:<14} requests {host['requests']:>3}  errors {host['errors']:>3}  "
+                  f"ejections {host['ejections']}  breaker {host['breaker']}")
+
+
+if __name__ == "__main__":
+    main()
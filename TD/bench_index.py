@@ -0,0 +1,95 @@
+"""Benchmark the Reading Q&A index modes: memory, build time, query latency and recall@10.
+
+Usage:
+    python bench_index.py                      # synthetic clustered vectors
+    python bench_index.py --n 50000 --dim 4096
+    python bench_index.py --vectors chunks.npy # real embeddings saved with np.save
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from qa_index import INDEX_TYPES, build_index, index_memory_bytes
+
+
+def synthetic_vectors(n, dim, clusters=200, seed=0):
+    """Clustered vectors that loosely resemble topic-grouped chunk embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    noise = rng.normal(scale=0.35, size=(n, dim)).astype(np.float32)
+    return centers[labels] + noise
+
+
+def recall_at_k(ground_truth, found, k=10):
+    """Mean fraction of the true top-k neighbours that were returned"""
+    hits = [len(set(gt[:k]) & set(f[:k])) / k for gt, f in zip(ground_truth, found)]
+    return float(np.mean(hits))
+
+
+def run_benchmark(vectors, queries, k=10, index_types=None):
+    """Build every index type over vectors and measure it against exact search"""
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, k)
+
+    results = []
+    for index_type in index_types or INDEX_TYPES:
+        start = time.perf_counter()
+        index, info = build_index(vectors, index_type=index_type)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in queries:
+            index.search(query.reshape(1, -1), k)
+        latency_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        _, found = index.search(queries, k)
+        results.append({
+            "mode": index_type,
+            "built_as": info["index_type"],
+            "factory": info["factory"],
+            "memory_mb": index_memory_bytes(index) / 1e6,
+            "build_s": build_seconds,
+            "query_ms": latency_ms,
+            "recall@10": recall_at_k(ground_truth, found, k),
+        })
+    return results
+
+
+def print_results(results):
+    header = f"{'mode':<7} {'built as':<8} {'factory':<18} {'memory MB':>10} {'build s':>9} {'query ms':>9} {'recall@10':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['mode']:<7} {r['built_as']:<8} {r['factory']:<18} {r['memory_mb']:>10.1f} "
+              f"{r['build_s']:>9.2f} {r['query_ms']:>9.3f} {r['recall@10']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=20000, help="Number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=1024, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--vectors", help="Path to a .npy file of real embeddings")
+    parser.add_argument("--modes", nargs="+", choices=INDEX_TYPES, help="Only benchmark these modes")
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+    else:
+        vectors = synthetic_vectors(args.n, args.dim)
+
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    # Perturbed copies of stored vectors stand in for questions about the corpus
+    queries = vectors[picks] + rng.normal(scale=0.1, size=(len(picks), vectors.shape[1])).astype(np.float32)
+
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries\n")
+    print_results(run_benchmark(vectors, queries, index_types=args.modes))
+
+
+if __name__ == "__main__":
+    main()
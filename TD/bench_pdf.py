@@ -0,0 +1,168 @@
+"""Benchmark the PDF extraction backends: pages/sec and extraction fidelity.
+
+Usage:
+    python bench_pdf.py                        # generated sample books with known text
+    python bench_pdf.py readings/*.pdf         # real PDFs, scored against pypdf
+    python bench_pdf.py --pages 300 --repeat 3
+
+Fidelity is word-level F1 against a reference text: the known source text
+for generated samples, or pypdf's output for real files.
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+from collections import Counter
+
+from pdf_backends import PDF_BACKENDS, available_backends
+
+SAMPLE_PARAGRAPHS = [
+    "The doctrine of the Trinity confesses one God in three persons, Father, Son and Holy Spirit, "
+    "equal in glory and coeternal in majesty.",
+    "Augustine wrote that our heart is restless until it rests in God, a theme that shaped "
+    "medieval spirituality and later Reformation piety.",
+    "The councils of Nicaea and Chalcedon defined the person of Christ against Arian and "
+    "Nestorian teaching, affirming one person in two natures.",
+    "Luther's reading of Romans placed justification by faith at the centre of the gospel, "
+    "while Calvin stressed union with Christ and sanctification.",
+    "Early Christian worship gathered around Scripture, prayer and the Eucharist, and the "
+    "catechumenate prepared converts for baptism at Easter.",
+    "Monastic communities preserved learning through the copying of manuscripts and the "
+    "daily rhythm of the divine office.",
+]
+WORD = re.compile(r"[A-Za-z']+")
+
+
+def _wrap(text, width=80):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    return lines + ([line] if line else [])
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_sample_pdf(path, n_pages, title="Readings in Historical Theology"):
+    """Write a text-only book PDF with running headers and page numbers; return its body text"""
+    body_pages = []
+    objects = []  # object bodies, numbered from 3 (1 = catalog, 2 = page tree)
+    page_ids = []
+    for p in range(n_pages):
+        paragraphs = [SAMPLE_PARAGRAPHS[(p + i) % len(SAMPLE_PARAGRAPHS)] for i in range(4)]
+        body_pages.append(" ".join(paragraphs))
+        lines = [title, ""] + [l for para in paragraphs for l in _wrap(para) + [""]] + [str(p + 1)]
+        stream = "BT /F1 10 Tf 14 TL 60 780 Td " + " ".join(f"({_pdf_escape(l)}) '" for l in lines) + " ET"
+        content_id = 3 + len(objects)
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        page_ids.append(3 + len(objects))
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Contents {content_id} 0 R /Resources << /Font << /F1 FONT 0 R >> >> >>")
+    font_id = 3 + len(objects)
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    bodies = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {n_pages} >>",
+    ] + [o.replace("FONT", str(font_id)) for o in objects]
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(bodies, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(bodies) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(bodies) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+    return "\n".join(body_pages)
+
+
+def word_f1(reference, candidate):
+    """Word-level F1 of candidate against reference (order-insensitive)"""
+    ref = Counter(w.lower() for w in WORD.findall(reference))
+    cand = Counter(w.lower() for w in WORD.findall(candidate))
+    overlap = sum((ref & cand).values())
+    if not ref or not cand or not overlap:
+        return 0.0
+    precision = overlap / sum(cand.values())
+    recall = overlap / sum(ref.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def run_benchmark(files, backends, repeat=1):
+    """files: [(path, reference text or None)]; returns one result row per backend"""
+    results = []
+    outputs = {}
+    for name in backends:
+        extract = PDF_BACKENDS[name][1]
+        pages = 0
+        seconds = 0.0
+        outputs[name] = {}
+        for path, _ in files:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                texts = extract(path)
+                seconds += time.perf_counter() - start
+            pages += len(texts) * repeat
+            outputs[name][path] = "\n".join(texts)
+        results.append({"backend": name, "pages": pages, "seconds": seconds})
+
+    for row in results:
+        scores = []
+        for path, reference in files:
+            if reference is None:
+                reference = outputs.get("pypdf", {}).get(path)
+            if reference is not None:
+                scores.append(word_f1(reference, outputs[row["backend"]][path]))
+        row["pages_per_s"] = row["pages"] / row["seconds"] if row["seconds"] > 0 else 0.0
+        row["fidelity"] = sum(scores) / len(scores) if scores else None
+    return results
+
+
+def print_results(results):
+    header = f"{'backend':<10} {'pages':>7} {'seconds':>9} {'pages/s':>9} {'fidelity':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        fidelity = f"{r['fidelity']:.3f}" if r["fidelity"] is not None else "n/a"
+        print(f"{r['backend']:<10} {r['pages']:>7} {r['seconds']:>9.2f} {r['pages_per_s']:>9.1f} {fidelity:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", help="PDF files to benchmark (default: generated samples)")
+    parser.add_argument("--pages", type=int, default=200, help="Pages per generated sample")
+    parser.add_argument("--samples", type=int, default=3, help="Number of generated samples")
+    parser.add_argument("--repeat", type=int, default=1, help="Extract each file this many times")
+    parser.add_argument("--backends", nargs="+", choices=list(PDF_BACKENDS), help="Only benchmark these backends")
+    args = parser.parse_args()
+
+    backends = args.backends or available_backends()
+    if not backends:
+        print("No PDF backends installed (pip install pypdf pymupdf pypdfium2)")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.pdfs:
+            files = [(path, None) for path in args.pdfs]
+        else:
+            files = []
+            for i in range(args.samples):
+                path = os.path.join(tmp, f"sample_{i}.pdf")
+                files.append((path, write_sample_pdf(path, args.pages)))
+
+        print(f"{len(files)} files, backends: {', '.join(backends)}\n")
+        print_results(run_benchmark(files, backends, repeat=args.repeat))
+
+
+if __name__ == "__main__":
+    main()
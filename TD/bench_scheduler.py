@@ -0,0 +1,81 @@
+"""Simulate a classroom against a mock model to compare FIFO and scheduled LLM calls.
+
+Usage:
+    python bench_scheduler.py                          # 3 drafting and 10 chatting sessions
+    python bench_scheduler.py --drafters 6 --chatters 20 --slots 2 --seconds 20
+
+Each drafting session asks for long generations back to back, and each chat
+session asks a short question every few seconds. The mock model only
+sleeps, so the numbers show queueing alone. "fifo" serves every call in
+one class (sessions still take turns) with the same number of slots;
+"scheduled" uses the priorities and reserved slot of llm_scheduler.
+"""
+import argparse
+import random
+import threading
+import time
+
+import numpy as np
+
+from llm_scheduler import CHAT, DRAFT, LLMScheduler
+
+
+def mock_generate(tokens, seconds_per_token):
+    time.sleep(tokens * seconds_per_token)
+
+
+def run(scheduler, args, chat_priority, draft_priority):
+    chat_waits = []
+    drafts_done = []
+    stop = time.perf_counter() + args.seconds
+
+    def drafter(session_id):
+        while time.perf_counter() < stop:
+            with scheduler.slot("mock", draft_priority, session_id):
+                mock_generate(args.draft_tokens, args.seconds_per_token)
+            drafts_done.append(session_id)
+
+    def chatter(session_id, seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < stop:
+            time.sleep(rng.expovariate(1 / args.think_seconds))
+            with scheduler.slot("mock", chat_priority, session_id) as ticket:
+                chat_waits.append(ticket.wait_seconds)
+                mock_generate(args.chat_tokens, args.seconds_per_token)
+
+    threads = [threading.Thread(target=drafter, args=(f"draft-{i}",)) for i in range(args.drafters)]
+    threads += [threading.Thread(target=chatter, args=(f"chat-{i}", i)) for i in range(args.chatters)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.asarray(chat_waits), len(drafts_done)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drafters", type=int, default=3)
+    parser.add_argument("--chatters", type=int, default=10)
+    parser.add_argument("--slots", type=int, default=2, help="Concurrent calls the mock model serves")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--draft-tokens", type=int, default=400)
+    parser.add_argument("--chat-tokens", type=int, default=40)
+    parser.add_argument("--seconds-per-token", type=float, default=0.005)
+    parser.add_argument("--think-seconds", type=float, default=2.0, help="Mean pause between chat questions")
+    args = parser.parse_args()
+
+    print(f"{args.drafters} drafting and {args.chatters} chat sessions, {args.slots} slots, "
+          f"{args.seconds:.0f}s per run\n")
+    header = f"{'policy':<10} {'chat calls':>10} {'wait p50 s':>11} {'wait p95 s':>11} {'wait max s':>11} {'drafts':>7}"
+    print(header)
+    print("-" * len(header))
+    # "fifo" puts every call in one class, so nothing is reserved or jumps the queue
+    for policy, draft_priority in (("fifo", CHAT), ("scheduled", DRAFT)):
+        waits, drafts = run(LLMScheduler({"mock": args.slots}), args, CHAT, draft_priority)
+        p50, p95 = (np.percentile(waits, [50, 95]) if len(waits) else (0.0, 0.0))
+        print(f"{policy:<10} {len(waits):>10} {p50:>11.3f} {p95:>11.3f} "
+              f"{waits.max() if len(waits) else 0.0:>11.3f} {drafts:>7}")
+
+
+if __name__ == "__main__":
+    main()
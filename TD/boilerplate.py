@@ -0,0 +1,94 @@
+"""Ingest-time cleaning of book boilerplate: running headers, footers and page numbers.
+
+Runs on the pages of one file after parsing and before chunking. A line near
+the top or bottom of a page is treated as boilerplate when the same line
+(ignoring digits) appears on a large share of the file's pages, or when it
+is just a page number (digits, or a lower-case roman numeral). Line-break
+hyphenation is joined and runs of spaces are collapsed.
+"""
+import re
+from collections import Counter
+
+from langchain.schema import Document
+
+# Lines at each end of a page that are checked for headers and footers
+EDGE_LINES = 3
+# A line counts as running when it is on at least this share of pages...
+REPEAT_FRACTION = 0.4
+# ...and on at least this many pages
+MIN_REPEATS = 3
+
+DIGITS = re.compile(r"\d+")
+# A well-formed lower-case roman numeral, as front matter is numbered. Upper or
+# mixed case is left alone: "I", "Civil" or a chapter "II" are content.
+ROMAN_NUMERAL = r"(?=[ivxlcdm])m{0,3}(?:cm|cd|d?c{0,3})(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})"
+PAGE_NUMBER = re.compile(
+    rf"^(?i:page\s*)?[-–—\s]*(\d{{1,4}}|{ROMAN_NUMERAL})[-–—\s]*(?i:of\s+\d+)?$"
+)
+HYPHENATED_BREAK = re.compile(r"(\w)-\n(?=[a-z])")
+SPACES = re.compile(r"[ \t\u00a0]+")
+BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def _line_key(line):
+    """Comparison key that ignores case, spacing and changing page numbers"""
+    return DIGITS.sub("#", " ".join(line.lower().split()))
+
+
+def _edge_indexes(lines):
+    """Indexes of the first and last EDGE_LINES non-empty lines of a page"""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+
+def find_running_lines(pages):
+    """Return the keys of lines repeated at the edges of many pages"""
+    counts = Counter()
+    for lines in pages:
+        counts.update({_line_key(lines[i]) for i in _edge_indexes(lines)})
+    threshold = max(MIN_REPEATS, REPEAT_FRACTION * len(pages))
+    return {key for key, count in counts.items() if count >= threshold and key.strip("# ")}
+
+
+def clean_text(text):
+    """Join hyphenated line breaks and collapse whitespace"""
+    text, joined = HYPHENATED_BREAK.subn(r"\1", text)
+    text = SPACES.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return BLANK_LINES.sub("\n\n", text).strip(), joined
+
+
+def strip_boilerplate(documents):
+    """Clean the pages of one file
+
+    Returns (cleaned documents, stats) where stats counts characters,
+    lines removed and hyphenations joined. Pages that end up empty are dropped.
+    """
+    pages = [doc.page_content.split("\n") for doc in documents]
+    running = find_running_lines(pages) if len(pages) >= MIN_REPEATS else set()
+
+    cleaned = []
+    lines_removed = 0
+    hyphens_joined = 0
+    for doc, lines in zip(documents, pages):
+        edges = _edge_indexes(lines) if len(pages) > 1 else set()
+        kept = []
+        for i, line in enumerate(lines):
+            if i in edges and (_line_key(line) in running or PAGE_NUMBER.match(line.strip())):
+                lines_removed += 1
+                continue
+            kept.append(line)
+        text, joined = clean_text("\n".join(kept))
+        hyphens_joined += joined
+        if text:
+            cleaned.append(Document(page_content=text, metadata=dict(doc.metadata)))
+
+    stats = {
+        "source": documents[0].metadata.get("source", "") if documents else "",
+        "pages": len(documents),
+        "chars_before": sum(len(doc.page_content) for doc in documents),
+        "chars_after": sum(len(doc.page_content) for doc in cleaned),
+        "lines_removed": lines_removed,
+        "hyphens_joined": hyphens_joined,
+    }
+    return cleaned, stats
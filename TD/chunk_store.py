@@ -0,0 +1,229 @@
+"""Compact in-memory chunk store for Reading Q&A uploads.
+
+A session used to hold every upload three times as Python objects: the page
+Documents, the chunk Documents in the FAISS docstore, and the joined full
+text rebuilt for analytics on each rerun. ChunkStore keeps one UTF-8 buffer
+of page texts. Chunks are (start, end) byte offsets into that buffer and
+page metadata is held in typed columns. Documents are only created when a
+chunk is retrieved.
+"""
+import numpy as np
+from langchain.docstore.base import Docstore
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from qa_ingest import CHUNK_OVERLAP, CHUNK_SIZE
+
+# Pages are separated by this byte, so the page region decodes as the joined full text
+PAGE_SEPARATOR = b" "
+
+
+class MetadataColumns:
+    """Per-page metadata as columns
+
+    Integer fields become int64 arrays. Other fields are dictionary-encoded
+    as int32 codes into a list of distinct values, with -1 for missing.
+    """
+
+    __slots__ = ("names", "int_columns", "coded_columns", "values")
+
+    def __init__(self, records):
+        self.names = list(dict.fromkeys(key for record in records for key in record))
+        self.int_columns = {}
+        self.coded_columns = {}
+        self.values = {}
+        for name in self.names:
+            column = [record.get(name) for record in records]
+            if all(type(v) is int for v in column):
+                self.int_columns[name] = np.asarray(column, dtype=np.int64)
+                continue
+            distinct = {}
+            codes = np.full(len(column), -1, dtype=np.int32)
+            for i, v in enumerate(column):
+                if name in records[i]:
+                    codes[i] = distinct.setdefault(v, len(distinct))
+            self.coded_columns[name] = codes
+            self.values[name] = list(distinct)
+
+    def get(self, i):
+        metadata = {}
+        for name in self.names:
+            if name in self.int_columns:
+                metadata[name] = int(self.int_columns[name][i])
+            elif self.coded_columns[name][i] >= 0:
+                metadata[name] = self.values[name][self.coded_columns[name][i]]
+        return metadata
+
+    def nbytes(self):
+        arrays = list(self.int_columns.values()) + list(self.coded_columns.values())
+        return sum(a.nbytes for a in arrays)
+
+
+class ChunkStore(Docstore):
+    """Pages and chunks of one file in a single text buffer
+
+    Also acts as the LangChain docstore: ids are the chunk positions as strings.
+    """
+
+    def __init__(self, buffer, page_offsets, page_metadata, chunk_offsets, chunk_pages, chunk_starts):
+        self.buffer = buffer
+        self.page_offsets = page_offsets
+        self.page_metadata_columns = page_metadata
+        self.chunk_offsets = chunk_offsets
+        self.chunk_pages = chunk_pages
+        # Character offset of each chunk in its page (-1 if unknown), as split_documents' start_index
+        self.chunk_starts = chunk_starts
+
+    @classmethod
+    def from_documents(cls, documents, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+        """Split page Documents into chunks, keeping chunk text as offsets into the page text"""
+        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        parts = []
+        page_offsets = []
+        chunk_offsets = []
+        chunk_pages = []
+        chunk_starts = []
+        unmatched = []
+        position = 0
+        for page, doc in enumerate(documents):
+            text = doc.page_content
+            data = text.encode("utf-8")
+            search_from = 0
+            for chunk in splitter.split_text(text):
+                # Chunks are substrings of the page; find each after the previous one
+                at = text.find(chunk, search_from)
+                if at < 0:
+                    unmatched.append((len(chunk_offsets), chunk.encode("utf-8")))
+                    chunk_offsets.append((0, 0))
+                else:
+                    start = position + len(text[:at].encode("utf-8"))
+                    chunk_offsets.append((start, start + len(chunk.encode("utf-8"))))
+                    search_from = at + 1
+                chunk_pages.append(page)
+                chunk_starts.append(at)
+            page_offsets.append((position, position + len(data)))
+            parts.extend([data, PAGE_SEPARATOR])
+            position += len(data) + len(PAGE_SEPARATOR)
+
+        # Chunks the splitter altered are stored verbatim after the pages
+        for i, data in unmatched:
+            chunk_offsets[i] = (position, position + len(data))
+            parts.append(data)
+            position += len(data)
+
+        return cls(
+            b"".join(parts),
+            np.asarray(page_offsets, dtype=np.int64).reshape(-1, 2),
+            MetadataColumns([doc.metadata for doc in documents]),
+            np.asarray(chunk_offsets, dtype=np.int64).reshape(-1, 2),
+            np.asarray(chunk_pages, dtype=np.int32),
+            np.asarray(chunk_starts, dtype=np.int64),
+        )
+
+    def __len__(self):
+        return len(self.chunk_offsets)
+
+    @property
+    def page_count(self):
+        return len(self.page_offsets)
+
+    def page_text(self, i):
+        start, end = self.page_offsets[i]
+        return self.buffer[start:end].decode("utf-8")
+
+    def page_metadata(self, i):
+        return self.page_metadata_columns.get(i)
+
+    def chunk_text(self, i):
+        start, end = self.chunk_offsets[i]
+        return self.buffer[start:end].decode("utf-8")
+
+    def chunk_metadata(self, i):
+        metadata = self.page_metadata(int(self.chunk_pages[i]))
+        if self.chunk_starts[i] >= 0:
+            metadata["start_index"] = int(self.chunk_starts[i])
+        return metadata
+
+    def get(self, i):
+        return Document(page_content=self.chunk_text(i), metadata=self.chunk_metadata(i))
+
+    def search(self, search):
+        try:
+            i = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= i < len(self):
+            return f"ID {search} not found."
+        return self.get(i)
+
+    def add(self, texts):
+        raise NotImplementedError("ChunkStore is built once per file")
+
+    def delete(self, ids):
+        raise NotImplementedError("ChunkStore is built once per file")
+
+    def iter_pages(self):
+        for i in range(self.page_count):
+            yield Document(page_content=self.page_text(i), metadata=self.page_metadata(i))
+
+    def full_text(self):
+        """All page texts joined by spaces, decoded from the buffer in one pass"""
+        if not self.page_count:
+            return ""
+        return self.buffer[:self.page_offsets[-1][1]].decode("utf-8")
+
+    def memory_bytes(self):
+        return (len(self.buffer) + self.page_offsets.nbytes + self.chunk_offsets.nbytes
+                + self.chunk_pages.nbytes + self.chunk_starts.nbytes + self.page_metadata_columns.nbytes())
+
+
+class ChunkStoreGroup(Docstore):
+    """Several files' ChunkStores addressed as one docstore, without copying their buffers"""
+
+    def __init__(self, stores):
+        self.stores = list(stores)
+        self._ends = np.cumsum([len(store) for store in self.stores], dtype=np.int64)
+
+    def __len__(self):
+        return int(self._ends[-1]) if len(self._ends) else 0
+
+    @property
+    def page_count(self):
+        return sum(store.page_count for store in self.stores)
+
+    def _locate(self, i):
+        n = int(np.searchsorted(self._ends, i, side="right"))
+        return self.stores[n], i - (int(self._ends[n - 1]) if n else 0)
+
+    def chunk_text(self, i):
+        store, local = self._locate(i)
+        return store.chunk_text(local)
+
+    def get(self, i):
+        store, local = self._locate(i)
+        return store.get(local)
+
+    def search(self, search):
+        try:
+            i = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= i < len(self):
+            return f"ID {search} not found."
+        return self.get(i)
+
+    def add(self, texts):
+        raise NotImplementedError("ChunkStoreGroup is read-only")
+
+    def delete(self, ids):
+        raise NotImplementedError("ChunkStoreGroup is read-only")
+
+    def iter_pages(self):
+        for store in self.stores:
+            yield from store.iter_pages()
+
+    def full_text(self):
+        return PAGE_SEPARATOR.decode().join(store.full_text() for store in self.stores)
+
+    def memory_bytes(self):
+        return sum(store.memory_bytes() for store in self.stores) + self._ends.nbytes
@@ -0,0 +1,172 @@
+"""Persistent cache of LLM completions for repeated deterministic prompts.
+
+Entries are keyed by model, sampling parameters and prompt hash, and kept
+in one SQLite file shared by every session and process. A temperature above
+zero makes a completion a sample rather than the answer, so those calls
+bypass the cache unless forced. Entries expire after CACHE_TTL_SECONDS;
+beyond CACHE_MAX_BYTES of completion text, the least recently used entries
+are evicted.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+COMPLETION_CACHE_PATH = os.environ.get("COMPLETION_CACHE_PATH", "./completion_cache.sqlite3")
+CACHE_TTL_SECONDS = 30 * 24 * 3600
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    params TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    completion TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed);
+"""
+
+
+def sampling_params(llm):
+    """Model name and the parameters that shape a completion, from a LangChain LLM
+
+    ChatOllama reports its options (temperature, top_p, num_predict, stop, ...);
+    ChatOpenAI its temperature, max_tokens and the like.
+    """
+    params = dict(getattr(llm, "_identifying_params", {}) or {})
+    model = params.pop("model", None) or params.pop("model_name", None) or getattr(llm, "model", "")
+    # Connection details don't change the completion
+    for name in ("base_url", "headers", "keep_alive", "timeout", "http_client", "openai_api_base", "openai_proxy"):
+        params.pop(name, None)
+    return model, json.loads(json.dumps(params, sort_keys=True, default=str))
+
+
+def is_deterministic(llm):
+    """True when the model samples greedily (temperature 0)
+
+    An unset temperature means the server default, which is not zero.
+    """
+    temperature = getattr(llm, "temperature", None)
+    return temperature is not None and float(temperature) == 0.0
+
+
+def cache_key(model, params, prompt):
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    key = hashlib.sha256(
+        json.dumps([model, params, prompt_hash], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return key, prompt_hash
+
+
+class CompletionCache:
+    """SQLite-backed completion store with TTL and size-bounded LRU eviction"""
+
+    def __init__(self, path=COMPLETION_CACHE_PATH, ttl_seconds=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL lets other app processes read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def get(self, model, params, prompt):
+        key, _ = cache_key(model, params, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT completion, created FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE completions SET accessed = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, model, params, prompt, completion):
+        key, prompt_hash = cache_key(model, params, prompt)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions "
+                "(key, model, params, prompt_hash, completion, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, json.dumps(params, sort_keys=True), prompt_hash, completion,
+                 len(completion.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM completions WHERE created < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the text fits again
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM completions ORDER BY accessed"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM completions WHERE key = ?", victims)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions").fetchone()
+        lookups = self.hits + self.misses
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses,
+                "bypassed": self.bypassed, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+def cached_predict(cache, llm, prompt, predict=None, force=False, regenerate=False):
+    """Completion for prompt, from the cache when allowed; returns (text, hit)
+
+    predict(prompt) makes the model call (default llm.predict). Calls with a
+    non-zero temperature skip the cache unless force is set. regenerate
+    always calls the model and replaces the cached completion.
+    """
+    predict = predict or llm.predict
+    if cache is None or not (force or is_deterministic(llm)):
+        if cache is not None:
+            cache.bypassed += 1
+        return predict(prompt), False
+
+    model, params = sampling_params(llm)
+    if not regenerate:
+        completion = cache.get(model, params, prompt)
+        if completion is not None:
+            return completion, True
+    completion = predict(prompt)
+    cache.put(model, params, prompt, completion)
+    return completion, False
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_completion_cache(path=COMPLETION_CACHE_PATH):
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = CompletionCache(path)
+        return _caches[path]
@@ -0,0 +1,190 @@
+"""Course-wide persistent reading library: one shared index bundle with a namespace per course.
+
+Instructors ingest a course's reading set once, offline:
+    python course_library.py ingest HIST101 readings/*.pdf --model llama3.3
+    python course_library.py list
+    python course_library.py remove HIST101
+
+Each course's chunks occupy one contiguous id range of the library index, so
+a student session attached to a course searches only that range inside FAISS
+(IDSelectorRange) instead of post-filtering results from every course.
+"""
+import argparse
+import os
+
+import faiss
+import numpy as np
+
+from backend_client import ollama_embeddings
+from index_bundle import (
+    BUNDLE_FILE, load_bundle_vectors, load_bundle_vectorstore, open_index_bundle,
+    read_bundle_manifest, resolve_bundle_path, save_index_bundle,
+)
+from qa_index import build_index
+from qa_ingest import clean_documents, load_file, split_documents
+
+LIBRARY_DIR = "./library"
+
+
+def library_exists(library_path=LIBRARY_DIR):
+    # A library that has been updated is a versioned root; its bundle is the CURRENT generation
+    return os.path.isfile(os.path.join(resolve_bundle_path(library_path), BUNDLE_FILE))
+
+
+def list_courses(library_path=LIBRARY_DIR):
+    """Return {course_id: number of chunks} for the courses in the library"""
+    if not library_exists(library_path):
+        return {}
+    namespaces = read_bundle_manifest(library_path).get("namespaces", {})
+    return {course_id: end - start for course_id, (start, end) in namespaces.items()}
+
+
+def _existing_courses(library_path, skip_course_id):
+    """Read the chunks and vectors of every course except skip_course_id"""
+    if not library_exists(library_path):
+        return [], None, None
+
+    index, store, manifest = open_index_bundle(library_path)
+    vectors = load_bundle_vectors(library_path)
+    if vectors is None:
+        raise ValueError("Library bundle has no stored vectors and cannot be updated")
+
+    courses = []
+    for course_id, (start, end) in sorted(manifest.get("namespaces", {}).items(), key=lambda item: item[1][0]):
+        if course_id == skip_course_id:
+            continue
+        chunks = [store.get(i) for i in range(start, end)]
+        courses.append((course_id, chunks, np.asarray(vectors[start:end])))
+    return courses, manifest.get("embedding_model"), manifest.get("index", {}).get("index_type")
+
+
+def _write_library(library_path, courses, embedding_model, index_type):
+    """Lay out courses contiguously, rebuild the index and publish the bundle"""
+    all_chunks = []
+    all_vectors = []
+    namespaces = {}
+    for course_id, chunks, vectors in courses:
+        start = len(all_chunks)
+        all_chunks.extend(chunks)
+        all_vectors.append(vectors)
+        namespaces[course_id] = [start, len(all_chunks)]
+
+    if not all_chunks:
+        raise ValueError("The library would be empty")
+
+    vectors = np.vstack(all_vectors).astype(np.float32)
+    index, info = build_index(vectors, index_type=index_type)
+    info["embedding_model"] = embedding_model
+
+    save_index_bundle(
+        library_path, index, all_chunks, info,
+        extra={"namespaces": namespaces, "embedding_model": embedding_model},
+        vectors=vectors
+    )
+    return namespaces
+
+
+def ingest_course(course_id, chunks, embeddings, embedding_model, library_path=LIBRARY_DIR, index_type="auto"):
+    """Add or replace a course's reading set in the shared library
+
+    Other courses keep their stored vectors, so only the new chunks are embedded.
+    """
+    courses, library_model, _ = _existing_courses(library_path, course_id)
+    if library_model and library_model != embedding_model:
+        raise ValueError(
+            f"Library was built with embedding model '{library_model}', not '{embedding_model}'"
+        )
+
+    for chunk in chunks:
+        chunk.metadata["course_id"] = course_id
+    vectors = np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32)
+    courses.append((course_id, chunks, vectors))
+
+    return _write_library(library_path, courses, embedding_model, index_type)
+
+
+def remove_course(course_id, library_path=LIBRARY_DIR, index_type="auto"):
+    """Remove a course from the shared library"""
+    courses, library_model, _ = _existing_courses(library_path, course_id)
+    return _write_library(library_path, courses, library_model, index_type)
+
+
+def namespace_search_params(index, start, end):
+    """faiss.SearchParameters that restrict a search to ids [start, end)"""
+    selector = faiss.IDSelectorRange(start, end)
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+
+    if ivf is not None:
+        # A course's chunks cluster in a few lists that may be far from the query's
+        # nearest centroids. Probe every list: the range check runs before any
+        # distance computation, so the cost is O(library) id checks plus
+        # O(course) distances.
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=max(index.hnsw.efSearch, 128))
+    return faiss.SearchParameters(sel=selector)
+
+
+def attach_course(course_id, library_path=LIBRARY_DIR, embeddings=None):
+    """Open the shared library read-only for one course
+
+    Returns (vectorstore, search_params, embedding_model). The vectorstore is
+    the memory-mapped library shared by every session; search_params keeps
+    queries inside the course namespace.
+    """
+    manifest = read_bundle_manifest(library_path)
+    namespaces = manifest.get("namespaces", {})
+    if course_id not in namespaces:
+        raise KeyError(f"Course '{course_id}' is not in the library")
+
+    embedding_model = manifest.get("embedding_model")
+    if embeddings is None:
+        embeddings = ollama_embeddings(embedding_model)
+    vectorstore, _ = load_bundle_vectorstore(library_path, embeddings)
+    start, end = namespaces[course_id]
+    return vectorstore, namespace_search_params(vectorstore.index, start, end), embedding_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the shared course reading library")
+    parser.add_argument("--library", default=LIBRARY_DIR, help="Library bundle directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="Add or replace a course's reading set")
+    ingest.add_argument("course_id")
+    ingest.add_argument("files", nargs="+")
+    ingest.add_argument("--model", default="llama3.3", help="Ollama embedding model")
+    ingest.add_argument("--index-type", default="auto")
+
+    subparsers.add_parser("list", help="List courses in the library")
+
+    remove = subparsers.add_parser("remove", help="Remove a course from the library")
+    remove.add_argument("course_id")
+
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        documents = []
+        for path in args.files:
+            cleaned, _ = clean_documents(load_file(path, source_name=os.path.basename(path)))
+            documents.extend(cleaned)
+        chunks = split_documents(documents)
+        print(f"Embedding {len(chunks)} chunks from {len(args.files)} files for {args.course_id}...")
+        namespaces = ingest_course(
+            args.course_id, chunks, ollama_embeddings(args.model), args.model,
+            library_path=args.library, index_type=args.index_type
+        )
+        print(f"Library now holds {len(namespaces)} courses")
+    elif args.command == "remove":
+        remove_course(args.course_id, library_path=args.library)
+        print(f"Removed {args.course_id}")
+
+    for course_id, n_chunks in list_courses(args.library).items():
+        print(f"{course_id}: {n_chunks} chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""Persisted, memory-mapped Reading Q&A index bundles shared read-only across processes.
+
+A bundle is a directory holding:
+    index.faiss        FAISS index (opened with mmap flags)
+    bundle.json        format version, index metadata and counts
+plus the chunk table written by qa_columns: texts.bin with text offsets,
+one .npy file per metadata column, scripture references and the optional
+vectors.npy that lets the index be rebuilt. Bundles with vectors also hold
+the section and document summary vectors of qa_hierarchy. Format 1 bundles, which stored
+metadata as JSON in meta.bin/meta_offsets.npy, are still readable.
+
+A versioned bundle root holds generations v000001/, v000002/, ... plus a
+CURRENT file naming the live one. Publishing a generation writes it in full
+and then replaces CURRENT atomically, so readers switch between complete
+generations only. Saving over an existing plain bundle turns it into a
+versioned root the same way.
+
+Every server process opens the same files with mmap, so the OS page cache
+holds one physical copy and only pages touched by queries are read in.
+"""
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+
+import faiss
+import numpy as np
+from langchain.docstore.base import Docstore
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+
+from qa_columns import (
+    TEXT_OFFSETS_FILE, TEXTS_FILE, VECTORS_FILE, ColumnReader, has_columns, write_columns,
+)
+from qa_hierarchy import build_hierarchy, save_hierarchy
+
+BUNDLE_FORMAT_VERSION = 2
+READABLE_FORMAT_VERSIONS = (1, 2)
+
+INDEX_FILE = "index.faiss"
+# Format 1 chunk metadata
+META_FILE = "meta.bin"
+META_OFFSETS_FILE = "meta_offsets.npy"
+BUNDLE_FILE = "bundle.json"
+CURRENT_FILE = "CURRENT"
+
+# Generations kept on disk after publishing (older ones are pruned)
+KEEP_GENERATIONS = 2
+
+# Map inverted lists (IVF) or flat codes (everything else) instead of copying them onto the heap.
+# The two flags cannot be combined: the flat-code reader is not a plain file reader.
+IVF_MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+FLAT_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+_open_bundles = {}
+_open_bundles_lock = threading.Lock()
+
+
+def save_index_bundle(path, index, chunks, index_info, extra=None, vectors=None):
+    """Write an index and its chunks as a bundle directory
+
+    A new bundle is written to a sibling temporary directory and renamed
+    into place, so readers never observe a half-written bundle. An existing
+    bundle is replaced by publishing a new generation under it: a directory
+    cannot be swapped for another atomically, but CURRENT can, so the path
+    always holds a complete bundle, even after a crash.
+    """
+    path = os.path.abspath(path)
+    if os.path.exists(path):
+        _replace_bundle(path, index, chunks, index_info, extra=extra, vectors=vectors)
+        return path
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    faiss.write_index(index, os.path.join(tmp_path, INDEX_FILE))
+    write_columns(tmp_path, chunks, vectors=vectors, embedding_model=index_info.get("embedding_model"))
+    if vectors is not None and len(chunks):
+        # Section and document summary vectors for coarse-to-fine retrieval
+        sources = [(c.metadata.get("course_id"), c.metadata.get("source")) for c in chunks]
+        save_hierarchy(tmp_path, build_hierarchy(sources, vectors))
+
+    manifest = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "n_chunks": len(chunks),
+        "index": index_info,
+    }
+    if extra:
+        manifest.update(extra)
+    with open(os.path.join(tmp_path, BUNDLE_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.rename(tmp_path, path)
+    return path
+
+
+def _replace_bundle(path, index, chunks, index_info, extra=None, vectors=None):
+    """Replace a bundle by publishing a new generation, converting a plain bundle into a versioned root"""
+    # A plain bundle's own files, served until CURRENT exists and then no longer read
+    plain_files = [] if is_versioned_bundle(path) else [
+        name for name in os.listdir(path) if not (name.startswith("v") and name[1:].isdigit())
+    ]
+    publish_bundle_generation(path, index, chunks, index_info, extra=extra, vectors=vectors)
+    # Processes that opened the plain bundle keep their open mappings
+    for name in plain_files:
+        old = os.path.join(path, name)
+        if os.path.isdir(old):
+            shutil.rmtree(old, ignore_errors=True)
+        elif os.path.exists(old):
+            os.remove(old)
+
+
+def resolve_bundle_path(path):
+    """Return the live generation directory of a versioned root, or path itself"""
+    current_path = os.path.join(path, CURRENT_FILE)
+    if os.path.isfile(current_path):
+        with open(current_path, "r", encoding="utf-8") as f:
+            return os.path.join(path, f.read().strip())
+    return path
+
+
+def _generation_numbers(root):
+    numbers = []
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            if name.startswith("v") and name[1:].isdigit():
+                numbers.append(int(name[1:]))
+    return sorted(numbers)
+
+
+def publish_bundle_generation(root, index, chunks, index_info, extra=None, vectors=None, keep=KEEP_GENERATIONS):
+    """Write a new generation under a versioned root and make it the live one
+
+    Returns the generation directory.
+    """
+    os.makedirs(root, exist_ok=True)
+    numbers = _generation_numbers(root)
+    generation = (numbers[-1] + 1) if numbers else 1
+    name = f"v{generation:06d}"
+
+    extra = dict(extra or {})
+    extra["generation"] = generation
+    path = save_index_bundle(os.path.join(root, name), index, chunks, index_info, extra=extra, vectors=vectors)
+
+    # os.replace is atomic, so a reader sees either the old or the new generation
+    tmp_current = os.path.join(root, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+    with open(tmp_current, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(tmp_current, os.path.join(root, CURRENT_FILE))
+
+    # Processes still reading a pruned generation keep their open mappings
+    for old in _generation_numbers(root)[:-keep]:
+        shutil.rmtree(os.path.join(root, f"v{old:06d}"), ignore_errors=True)
+    return path
+
+
+def read_bundle_manifest(path):
+    """Read bundle.json without opening the index"""
+    with open(os.path.join(resolve_bundle_path(path), BUNDLE_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class MappedChunkStore(Docstore):
+    """Read-only chunk texts and metadata served straight from memory-mapped files
+
+    Also acts as the LangChain docstore: ids are the chunk positions as strings.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Format 2 bundles hold a columnar chunk table; format 1 stored JSON metadata per chunk
+        self.columns = ColumnReader(path) if has_columns(path) else None
+        if self.columns is None:
+            self._texts_file = open(os.path.join(path, TEXTS_FILE), "rb")
+            self._meta_file = open(os.path.join(path, META_FILE), "rb")
+            self._texts = self._map(self._texts_file)
+            self._meta = self._map(self._meta_file)
+            self._text_offsets = np.load(os.path.join(path, TEXT_OFFSETS_FILE), mmap_mode="r")
+            self._meta_offsets = np.load(os.path.join(path, META_OFFSETS_FILE), mmap_mode="r")
+
+    @staticmethod
+    def _map(f):
+        # mmap refuses zero-length files
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        if self.columns is not None:
+            return len(self.columns)
+        return len(self._text_offsets) - 1
+
+    def text(self, i):
+        if self.columns is not None:
+            return self.columns.text(i)
+        start, end = int(self._text_offsets[i]), int(self._text_offsets[i + 1])
+        return self._texts[start:end].decode("utf-8")
+
+    def metadata(self, i):
+        if self.columns is not None:
+            return self.columns.metadata(i)
+        start, end = int(self._meta_offsets[i]), int(self._meta_offsets[i + 1])
+        return json.loads(self._meta[start:end].decode("utf-8"))
+
+    def get(self, i):
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    def search(self, search):
+        try:
+            i = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= i < len(self):
+            return f"ID {search} not found."
+        return self.get(i)
+
+    def add(self, texts):
+        raise NotImplementedError("Index bundles are read-only")
+
+    def delete(self, ids):
+        raise NotImplementedError("Index bundles are read-only")
+
+    def close(self):
+        if self.columns is not None:
+            self.columns.close()
+            return
+        for mapped in (self._texts, self._meta):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        self._texts_file.close()
+        self._meta_file.close()
+
+
+class PositionalIds:
+    """index_to_docstore_id for bundles: FAISS row i maps to docstore id str(i)"""
+
+    def __init__(self, n):
+        self.n = n
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.n:
+            raise KeyError(i)
+        return str(i)
+
+    def __len__(self):
+        return self.n
+
+    def get(self, i, default=None):
+        return self[i] if 0 <= i < self.n else default
+
+
+def _open_bundle(path):
+    manifest = read_bundle_manifest(path)
+    if manifest.get("format_version") not in READABLE_FORMAT_VERSIONS:
+        raise ValueError(f"Unsupported index bundle format: {manifest.get('format_version')}")
+
+    index_type = manifest.get("index", {}).get("index_type", "flat")
+    flags = IVF_MMAP_FLAGS if index_type in ("ivf", "ivfpq") else FLAT_MMAP_FLAGS
+    index = faiss.read_index(os.path.join(path, INDEX_FILE), flags)
+    store = MappedChunkStore(path)
+    if index.ntotal != len(store):
+        raise ValueError(f"Index has {index.ntotal} vectors but bundle has {len(store)} chunks")
+    return index, store, manifest
+
+
+def open_index_bundle(path):
+    """Open a bundle read-only, sharing one mapping per bundle within this process
+
+    Reopening after the bundle was replaced on disk, or after a new generation
+    was published, returns the new version. Sessions still holding the old
+    one keep using it until they reopen.
+    """
+    root = os.path.abspath(path)
+    path = resolve_bundle_path(root)
+    version = (path, os.stat(os.path.join(path, BUNDLE_FILE)).st_mtime_ns)
+    with _open_bundles_lock:
+        cached = _open_bundles.get(root)
+        if cached and cached[0] == version:
+            return cached[1]
+        opened = _open_bundle(path)
+        _open_bundles[root] = (version, opened)
+        return opened
+
+
+class LiveBundle:
+    """Follows the CURRENT generation of a versioned bundle root
+
+    A daemon thread polls CURRENT and opens each new generation in the
+    background; snapshot() then returns it immediately. Queries never wait
+    for a generation to open, and in-flight queries finish on the
+    generation they started with.
+    """
+
+    def __init__(self, root, poll_interval=2.0):
+        self.root = os.path.abspath(root)
+        self.poll_interval = poll_interval
+        self._snapshot = open_index_bundle(self.root)
+        self._path = resolve_bundle_path(self.root)
+        self.swapped_at = time.time()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._poll, name=f"live-bundle:{self.root}", daemon=True)
+        self._thread.start()
+
+    def _poll(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                path = resolve_bundle_path(self.root)
+                if path != self._path:
+                    # Assigning the tuple is atomic, so readers see old or new, never a mix
+                    self._snapshot = open_index_bundle(self.root)
+                    self._path = path
+                    self.swapped_at = time.time()
+            except (OSError, ValueError, RuntimeError):
+                # A generation being pruned or half-visible; keep serving the current one
+                continue
+
+    def snapshot(self):
+        """Return (index, store, manifest) of the live generation"""
+        return self._snapshot
+
+    def stop(self):
+        self._stopped.set()
+
+
+_live_bundles = {}
+
+
+def get_live_bundle(root):
+    """Return the process-wide LiveBundle for root (one polling thread per bundle)"""
+    root = os.path.abspath(root)
+    with _open_bundles_lock:
+        live = _live_bundles.get(root)
+    if live is None:
+        created = LiveBundle(root)
+        with _open_bundles_lock:
+            live = _live_bundles.setdefault(root, created)
+        if live is not created:
+            created.stop()
+    return live
+
+
+def is_versioned_bundle(path):
+    """True for a bundle root that publishes generations through CURRENT"""
+    return os.path.isfile(os.path.join(path, CURRENT_FILE))
+
+
+def load_bundle_vectors(path):
+    """Memory-map the stored embeddings of a bundle, or None if it has none"""
+    vectors_path = os.path.join(resolve_bundle_path(path), VECTORS_FILE)
+    if not os.path.exists(vectors_path):
+        return None
+    return np.load(vectors_path, mmap_mode="r")
+
+
+def load_bundle_vectorstore(path, embeddings):
+    """Wrap a memory-mapped bundle in a LangChain FAISS vectorstore
+
+    Returns (vectorstore, manifest). The vectorstore is read-only.
+    """
+    index, store, manifest = open_index_bundle(path)
+    vectorstore = FAISS(embeddings, index, store, PositionalIds(index.ntotal))
+    return vectorstore, manifest
+
+
+def save_vectorstore_bundle(path, vectorstore, index_info, vectors=None):
+    """Persist an in-memory LangChain FAISS vectorstore as a bundle
+
+    Pass the chunk vectors to keep them, so the bundle can be rebuilt later.
+    """
+    chunks = [vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+              for i in range(vectorstore.index.ntotal)]
+    return save_index_bundle(path, vectorstore.index, chunks, index_info, vectors=vectors)
+
+
+def list_index_bundles(root):
+    """Return the names of the bundle directories under root"""
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if os.path.isfile(os.path.join(resolve_bundle_path(os.path.join(root, name)), BUNDLE_FILE))
+    )
@@ -0,0 +1,195 @@
+"""Keep assignment drafts near their requested length.
+
+The draft prompts only ask for "approximately 1500-2000 words", and local
+models sometimes run far past the target or loop on a paragraph, holding
+the server for minutes. Generation is bounded here instead:
+  * a token cap from the upper word count plus HEADROOM (num_predict for
+    Ollama, max_tokens for OpenAI);
+  * an end marker the model is asked to write when it is done, used as a
+    stop sequence;
+  * RepetitionGuard, which ends the stream as soon as the output starts
+    repeating itself (the stream is closed, so the server stops too);
+  * continuation calls when the draft is still short of the lower word
+    count. A continuation gets the plan, the headings written so far and
+    the end of the draft, not the whole draft again.
+"""
+import re
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from llm_cancel import GenerationCancelled
+from reasoning import strip_think
+
+# Tokens per English word in markdown prose, and the margin above the upper word count
+TOKENS_PER_WORD = 1.4
+HEADROOM = 1.3
+END_MARKER = "[END OF DRAFT]"
+DRAFT_STOP_SEQUENCES = [END_MARKER]
+MAX_CONTINUATIONS = 2
+# Words of the draft's end shown to a continuation call
+CONTINUATION_TAIL_WORDS = 600
+# A span this long appearing twice means the model is looping
+REPEAT_WINDOW = 240
+REPEAT_CHECK_EVERY = 80
+DEFAULT_LENGTH = (1500, 2000)
+
+
+def parse_length(length):
+    """(min words, max words) from an assignment length such as "1500-2000 words" """
+    numbers = [int(n.replace(",", "")) for n in re.findall(r"\d[\d,]*", length or "")]
+    if not numbers:
+        return DEFAULT_LENGTH
+    return min(numbers), max(numbers)
+
+
+def word_count(text):
+    return len(re.findall(r"\b\w[\w'’-]*\b", text))
+
+
+def token_cap(words):
+    return int(words * TOKENS_PER_WORD * HEADROOM)
+
+
+def limited_llm(llm, max_tokens):
+    """A copy of a chat model that generates at most max_tokens tokens"""
+    if hasattr(llm, "num_predict"):
+        name = "num_predict"
+    elif hasattr(llm, "max_tokens"):
+        name = "max_tokens"
+    else:
+        return llm
+    # copy() leaves out fields marked exclude, among them the callbacks (telemetry)
+    update = {field: getattr(llm, field) for field, info in llm.__fields__.items() if info.field_info.exclude}
+    update[name] = max_tokens
+    return llm.copy(update=update)
+
+
+def length_instructions(min_words, max_words):
+    return (
+        f"\n    Write between {min_words} and {max_words} words. Do not restate these instructions, "
+        f"and do not add a word count.\n"
+        f"    When the assignment is complete, write {END_MARKER} on its own line and stop.\n"
+    )
+
+
+def find_repetition(text, window=REPEAT_WINDOW):
+    """Where to cut text that has started repeating itself, or None
+
+    The output is looping when its last window characters already appeared
+    earlier. The cut keeps one copy of the repeated passage.
+    """
+    if len(text) < 2 * window:
+        return None
+    tail = text[-window:]
+    if not tail.strip(" \n-*#|"):
+        return None
+    # Latest earlier occurrence; the distance to it is the length of the loop
+    previous = text.rfind(tail, 0, len(text) - 1)
+    if previous == -1:
+        return None
+    period = len(text) - window - previous
+    start = previous
+    while start > 0 and text[start - 1] == text[start - 1 + period]:
+        start -= 1
+    return start + period
+
+
+class RepetitionDetected(GenerationCancelled):
+    """The model started repeating itself; the text up to the repetition is RepetitionGuard.kept_text"""
+
+
+class RepetitionGuard(BaseCallbackHandler):
+    """Ends a streaming call when its output starts to loop"""
+
+    # Let the exception through LangChain so the stream is abandoned and closed
+    raise_error = True
+
+    def __init__(self, window=REPEAT_WINDOW):
+        self.window = window
+        self.text = ""
+        self.cut = None
+        self._checked = 0
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.text += token
+        if len(self.text) - self._checked < REPEAT_CHECK_EVERY:
+            return
+        self._checked = len(self.text)
+        cut = find_repetition(self.text, self.window)
+        if cut is not None:
+            self.cut = cut
+            raise RepetitionDetected(f"Output started repeating after {word_count(self.text[:cut])} words")
+
+    @property
+    def kept_text(self):
+        return self.text[:self.cut] if self.cut is not None else self.text
+
+
+def clean_part(text):
+    """Remove the end marker, and a sentence cut off by the token cap"""
+    text = text.replace(END_MARKER, "").rstrip()
+    if text and text[-1] not in ".!?\"'”’)*]:":
+        end = max(text.rfind(mark) for mark in (". ", ".\n", "? ", "! ", ".\"", ".”"))
+        if end > len(text) // 2:
+            text = text[:end + 1]
+    return text
+
+
+def headings(text):
+    return [line.strip() for line in text.splitlines() if line.lstrip().startswith("#")]
+
+
+def continuation_prompt(draft, plan, words_needed, words_allowed):
+    tail = " ".join(draft.split()[-CONTINUATION_TAIL_WORDS:])
+    written = "\n".join(headings(draft)) or "(no headings)"
+    return f"""You are continuing a theology assignment draft that stopped before it was finished.
+
+    The plan for the assignment:
+    {plan}
+
+    Headings already written:
+    {written}
+
+    The draft currently ends with:
+    ...{tail}
+
+    Continue the assignment from exactly where it ends, in the same style and tone. Cover the parts of the plan
+    that are missing or thin, and finish with the conclusion if it has not been written yet. Do not repeat or
+    summarise text that is already written, and do not start over with a new introduction.
+    Write about {words_needed} more words, and no more than {words_allowed}.
+    When the assignment is complete, write {END_MARKER} on its own line and stop.
+    """
+
+
+def generate_to_length(llm, prompt, length, call, plan="", extra_tokens=0):
+    """Generate a draft within the word range of length; returns (text, report)
+
+    call(llm, prompt, stop, callbacks) makes one model call and returns its
+    text. The report counts calls, continuations and repetition stops.
+    extra_tokens raises each call's token cap, for output that is not part of
+    the draft (a reasoning model's <think> section, which is removed).
+    """
+    min_words, max_words = parse_length(length)
+    report = {"min_words": min_words, "max_words": max_words, "calls": 0, "continuations": 0,
+              "repetition_stops": 0}
+    request = prompt + length_instructions(min_words, max_words)
+    allowed = max_words
+    text = ""
+    for attempt in range(MAX_CONTINUATIONS + 1):
+        guard = RepetitionGuard()
+        try:
+            part = call(limited_llm(llm, token_cap(allowed) + extra_tokens), request, DRAFT_STOP_SEQUENCES, [guard])
+        except RepetitionDetected:
+            part = guard.kept_text
+            report["repetition_stops"] += 1
+        report["calls"] += 1
+        part = clean_part(strip_think(part))
+        text = f"{text}\n\n{part.lstrip()}" if text else part
+        words = word_count(text)
+        if words >= min_words or attempt == MAX_CONTINUATIONS or not part:
+            break
+        report["continuations"] += 1
+        allowed = max_words - words
+        request = continuation_prompt(text, plan, min_words - words, allowed)
+    report["words"] = word_count(text)
+    return text, report
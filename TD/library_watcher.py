@@ -0,0 +1,165 @@
+"""Watch a reading-library folder and keep its index bundle up to date.
+
+Usage:
+    python library_watcher.py readings/ --name library --model llama3.3 --interval 10
+
+Instructors drop, replace or delete files in the folder during the semester.
+The watcher polls the folder, identifies added, changed and removed files by
+content hash, and re-indexes in a background worker. Unchanged files are
+served from the indexer's checkpoints, so only new or changed files are
+parsed and embedded. Each update is published as a new bundle generation;
+sessions attached to the bundle swap to it on their next query.
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+
+from backend_client import ollama_embeddings
+from batch_indexer import INDEX_DIR, file_key, index_folder
+from index_bundle import read_bundle_manifest
+from qa_index import INDEX_TYPES
+from qa_ingest import find_document_files
+
+
+class LibraryWatcher:
+    """Polls a folder and republishes its bundle whenever the set of file contents changes"""
+
+    def __init__(self, folder, bundle_root, embeddings, embedding_model, poll_interval=10.0,
+                 workers=4, index_type="auto", log=print):
+        self.folder = folder
+        self.bundle_root = bundle_root
+        self.embeddings = embeddings
+        self.embedding_model = embedding_model
+        self.poll_interval = poll_interval
+        self.workers = workers
+        self.index_type = index_type
+        self.log = log
+
+        # (size, mtime_ns) -> hash cache so unchanged files are not re-read every poll
+        self._stat_cache = {}
+        self._published = self._load_published()
+        self._queued = None
+        self._jobs = queue.Queue(maxsize=1)
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._work, name="library-indexer", daemon=True)
+
+    def _load_published(self):
+        """File hashes of the live generation, so a restarted watcher does not republish"""
+        try:
+            manifest = read_bundle_manifest(self.bundle_root)
+        except (OSError, ValueError):
+            return None
+        return {os.path.join(self.folder, f["path"]): f["key"] for f in manifest.get("files", [])}
+
+    def scan(self):
+        """Return {path: content hash} for every supported file in the folder"""
+        hashes = {}
+        for path in find_document_files(self.folder):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            cached = self._stat_cache.get(path)
+            if cached and cached[0] == signature:
+                hashes[path] = cached[1]
+            else:
+                hashes[path] = file_key(path)
+                self._stat_cache[path] = (signature, hashes[path])
+        for path in set(self._stat_cache) - set(hashes):
+            del self._stat_cache[path]
+        return hashes
+
+    @staticmethod
+    def diff(old, new):
+        """Return (added, changed, removed) paths between two scans"""
+        old = old or {}
+        added = sorted(set(new) - set(old))
+        removed = sorted(set(old) - set(new))
+        changed = sorted(p for p in set(new) & set(old) if new[p] != old[p])
+        return added, changed, removed
+
+    def _work(self):
+        while not self._stopped.is_set():
+            try:
+                hashes = self._jobs.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                stats = index_folder(
+                    self.folder, self.bundle_root, self.embeddings, self.embedding_model,
+                    workers=self.workers, index_type=self.index_type, log=self.log, keys=hashes
+                )
+                self._published = hashes
+                self.log(f"Published {stats['generation_path']}: {stats['index']['n_vectors']} chunks, "
+                         f"{stats['embeddings']} new embeddings")
+            except ValueError as e:
+                self.log(f"Skipped update: {e}")
+                self._published = hashes
+            except Exception as e:
+                # Leave _published unchanged and forget the queued state so the next stable poll requeues it
+                self._queued = None
+                self.log(f"Indexing failed, will retry: {e}")
+
+    def poll_once(self, previous_scan):
+        """Scan the folder and queue an update once it has been stable for one interval
+
+        Waiting for two identical scans avoids indexing files that are still
+        being copied in. Returns the scan for the next call.
+        """
+        current = self.scan()
+        if current == previous_scan and current != self._published and current != self._queued:
+            added, changed, removed = self.diff(self._published, current)
+            self.log(f"Changes detected: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+            # Set before queueing, so a failure reported by the worker is not overwritten
+            self._queued = current
+            try:
+                self._jobs.put_nowait(current)
+            except queue.Full:
+                # An older state is still waiting; this one is picked up on a later poll
+                self._queued = None
+        return current
+
+    def run(self):
+        self._worker.start()
+        self.log(f"Watching {self.folder} -> {self.bundle_root} every {self.poll_interval:g}s")
+        previous = None
+        try:
+            while not self._stopped.is_set():
+                previous = self.poll_once(previous)
+                self._stopped.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            self.log("Stopping watcher")
+        finally:
+            self._stopped.set()
+
+    def stop(self):
+        self._stopped.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", help="Library folder to watch")
+    parser.add_argument("--name", help="Bundle name (defaults to the folder name)")
+    parser.add_argument("--out-dir", default=INDEX_DIR, help="Directory holding index bundles")
+    parser.add_argument("--model", default="llama3.3", help="Ollama embedding model")
+    parser.add_argument("--index-type", default="auto", choices=["auto"] + INDEX_TYPES)
+    parser.add_argument("--interval", type=float, default=10.0, help="Polling interval in seconds")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel load and embedding workers")
+    args = parser.parse_args()
+
+    name = args.name or os.path.basename(os.path.normpath(args.folder))
+
+    def log(message):
+        print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+    LibraryWatcher(
+        args.folder, os.path.join(args.out_dir, name), ollama_embeddings(args.model), args.model,
+        poll_interval=args.interval, workers=args.workers, index_type=args.index_type, log=log
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
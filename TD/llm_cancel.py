@@ -0,0 +1,47 @@
+"""Cooperative cancellation of streaming LLM calls.
+
+A generation nobody is waiting for keeps the model busy until it finishes,
+unless its HTTP stream is closed: Ollama stops generating as soon as the
+client goes away. Calls made inside cancellable(check) call check() every
+POLL_INTERVAL seconds while waiting for the next streamed line, and after
+each line. To cancel, check raises. In the Streamlit app it updates a
+progress caption, and Streamlit raises from there when the user pressed
+Stop, reran the page or disconnected. The exception unwinds through the
+stream reader, which closes the stream so the server frees the slot.
+"""
+import threading
+from contextlib import contextmanager
+
+POLL_INTERVAL = 0.5
+
+
+class GenerationCancelled(Exception):
+    """Every reader of a generation stopped reading before it finished"""
+
+
+_local = threading.local()
+
+
+@contextmanager
+def cancellable(check):
+    """Poll check() during the streaming calls this thread makes inside the block"""
+    previous = getattr(_local, "check", None)
+    _local.check = check
+    try:
+        yield
+    finally:
+        _local.check = previous
+
+
+def current_check():
+    """The check installed by the innermost cancellable() in this thread, or None"""
+    return getattr(_local, "check", None)
+
+
+def is_cancellation(error):
+    """True for errors that mean the caller went away rather than that the call failed
+
+    Besides GenerationCancelled this covers BaseExceptions that are not
+    Exceptions: Streamlit's rerun/stop signals, KeyboardInterrupt, GeneratorExit.
+    """
+    return isinstance(error, GenerationCancelled) or not isinstance(error, Exception)
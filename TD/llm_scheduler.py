@@ -0,0 +1,223 @@
+"""Cross-session scheduler for LLM calls: per-model concurrency, priorities and fair queueing.
+
+Every session used to call the model directly, so a few students
+generating 8,000-word drafts could keep the Ollama server busy while Simple
+Chat users waited behind them. Calls now take a slot from the scheduler
+first:
+  * each model has a bounded number of concurrent calls (MODEL_CONCURRENCY);
+  * waiting calls are served by priority class: CHAT, then QA, then DRAFT,
+    then BACKGROUND;
+  * within a class, sessions with fewer calls running go first and then
+    take turns (round robin), so one session's burst of calls doesn't get
+    ahead of everyone else's single call;
+  * when a model has more than one slot, RESERVED_INTERACTIVE_SLOTS of them
+    are kept free of DRAFT and BACKGROUND work, so a chat turn never waits
+    behind a full slate of drafts.
+
+The scheduler only hands out slots; it knows nothing about the backend,
+so it can be exercised with any stand-in (see bench_scheduler.py).
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+CHAT, QA, DRAFT, BACKGROUND = range(4)
+PRIORITY_NAMES = {CHAT: "chat", QA: "Q&A", DRAFT: "draft", BACKGROUND: "background"}
+
+# Concurrent calls per model; a 32B model on one GPU gains little from more than one or two
+MODEL_CONCURRENCY = {
+    "llama3.3": 2,
+    "deepseek-r1:32b": 1,
+    "qwq": 1,
+    "openthinker:32b": 1,
+    "mistral-small:24b": 2,
+    "gemma3:27b": 1,
+    "gpt-4o": 8,
+    "o3-mini": 8,
+}
+DEFAULT_MODEL_CONCURRENCY = 2
+RESERVED_INTERACTIVE_SLOTS = 1
+# Seconds between queue-position updates while waiting
+POSITION_INTERVAL = 0.5
+
+
+class Ticket:
+    """One call waiting for, or holding, a slot"""
+
+    _ids = itertools.count()
+
+    def __init__(self, model, priority, session_id):
+        self.id = next(self._ids)
+        self.model = model
+        self.priority = priority
+        self.session_id = session_id
+        self.submitted = time.perf_counter()
+        self.granted_at = None
+        self.granted = threading.Event()
+
+    @property
+    def wait_seconds(self):
+        end = self.granted_at if self.granted_at is not None else time.perf_counter()
+        return end - self.submitted
+
+
+class _ModelQueue:
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = []
+        # priority -> {session_id: deque of tickets}
+        self.waiting = {priority: {} for priority in PRIORITY_NAMES}
+        # session_id -> sequence number of its last granted call, for round robin
+        self.last_served = {}
+        self._served = itertools.count()
+
+    def allowed(self, priority):
+        if priority < DRAFT or self.limit <= RESERVED_INTERACTIVE_SLOTS:
+            return len(self.running) < self.limit
+        low = sum(1 for ticket in self.running if ticket.priority >= DRAFT)
+        return len(self.running) < self.limit and low < self.limit - RESERVED_INTERACTIVE_SLOTS
+
+    def _running_count(self, session_id):
+        return sum(1 for ticket in self.running if ticket.session_id == session_id)
+
+    def _turns(self, sessions):
+        """Sessions in serving order: fewest running calls first, then least recently served"""
+        return sorted(sessions, key=lambda s: (self._running_count(s), self.last_served.get(s, -1)))
+
+    def order(self):
+        """Waiting tickets in the order they would be granted if nothing else arrived"""
+        order = []
+        for priority in sorted(self.waiting):
+            sessions = self.waiting[priority]
+            queues = [list(sessions[session_id]) for session_id in self._turns(sessions)]
+            for turn in itertools.zip_longest(*queues):
+                order.extend(ticket for ticket in turn if ticket is not None)
+        return order
+
+    def next_ticket(self):
+        for priority in sorted(self.waiting):
+            sessions = self.waiting[priority]
+            if not sessions or not self.allowed(priority):
+                continue
+            session_id = self._turns(sessions)[0]
+            queue = sessions[session_id]
+            ticket = queue.popleft()
+            if not queue:
+                del sessions[session_id]
+            self.last_served[session_id] = next(self._served)
+            return ticket
+        return None
+
+    def remove(self, ticket):
+        sessions = self.waiting[ticket.priority]
+        queue = sessions.get(ticket.session_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del sessions[ticket.session_id]
+
+
+class LLMScheduler:
+    """Hands out per-model call slots by priority, round robin between sessions"""
+
+    def __init__(self, concurrency=None, default_concurrency=DEFAULT_MODEL_CONCURRENCY):
+        self.concurrency = dict(MODEL_CONCURRENCY if concurrency is None else concurrency)
+        self.default_concurrency = default_concurrency
+        self._models = {}
+        self._lock = threading.Lock()
+        # priority -> [count, total wait seconds, max wait seconds]
+        self.waits = {priority: [0, 0.0, 0.0] for priority in PRIORITY_NAMES}
+
+    def _queue(self, model):
+        if model not in self._models:
+            self._models[model] = _ModelQueue(self.concurrency.get(model, self.default_concurrency))
+        return self._models[model]
+
+    def _dispatch(self, queue):
+        while True:
+            ticket = queue.next_ticket()
+            if ticket is None:
+                return
+            ticket.granted_at = time.perf_counter()
+            queue.running.append(ticket)
+            waits = self.waits[ticket.priority]
+            waits[0] += 1
+            waits[1] += ticket.wait_seconds
+            waits[2] = max(waits[2], ticket.wait_seconds)
+            ticket.granted.set()
+
+    def submit(self, model, priority, session_id):
+        ticket = Ticket(model, priority, session_id)
+        with self._lock:
+            queue = self._queue(model)
+            queue.waiting[priority].setdefault(session_id, deque()).append(ticket)
+            self._dispatch(queue)
+        return ticket
+
+    def position(self, ticket):
+        """Calls ahead of a waiting ticket (0 once granted)"""
+        with self._lock:
+            if ticket.granted.is_set():
+                return 0
+            order = self._queue(ticket.model).order()
+        return order.index(ticket) + 1 if ticket in order else 0
+
+    def release(self, ticket):
+        """Give back a granted slot, or withdraw a ticket that is still waiting"""
+        with self._lock:
+            queue = self._queue(ticket.model)
+            if ticket in queue.running:
+                queue.running.remove(ticket)
+            else:
+                queue.remove(ticket)
+            self._dispatch(queue)
+
+    @contextmanager
+    def slot(self, model, priority, session_id, on_wait=None):
+        """Hold a slot for one call; on_wait(position) is called while queued"""
+        ticket = self.submit(model, priority, session_id)
+        try:
+            while not ticket.granted.wait(POSITION_INTERVAL):
+                if on_wait is not None:
+                    on_wait(self.position(ticket))
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def snapshot(self):
+        """Per-model running and waiting counts by class, plus mean/max wait per class"""
+        with self._lock:
+            models = {
+                model: {
+                    "limit": queue.limit,
+                    "running": len(queue.running),
+                    "waiting": {PRIORITY_NAMES[p]: sum(len(q) for q in sessions.values())
+                                for p, sessions in queue.waiting.items()},
+                }
+                for model, queue in self._models.items()
+            }
+            waits = {
+                PRIORITY_NAMES[p]: {"calls": n, "mean_wait": total / n if n else 0.0, "max_wait": longest}
+                for p, (n, total, longest) in self.waits.items()
+            }
+        return {"models": models, "waits": waits}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """The scheduler shared by every session in this process"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
+
+
+def model_name(llm):
+    """Model name of a LangChain LLM (ChatOllama.model, ChatOpenAI.model_name)"""
+    return getattr(llm, "model", None) or getattr(llm, "model_name", None) or "default"
@@ -0,0 +1,182 @@
+"""Keep the Ollama models the app uses loaded, and warm them before the first prompt.
+
+A 24B-32B model takes seconds, sometimes more than 30, to load into GPU
+memory. Ollama unloads idle models after five minutes, so the first
+question after a pause paid that load again. The residency manager:
+  * preloads PRELOAD_MODELS when the app server starts and pins them
+    (keep_alive -1, never unloaded);
+  * sends keep_alive IN_USE_KEEP_ALIVE with every request for other models,
+    so a model stays loaded while anyone is using it;
+  * warms a model in the background as soon as it is selected;
+  * records each warm-up's load time and lists the resident models (/api/ps,
+    reused for RESIDENT_CACHE_SECONDS).
+"""
+import datetime
+import os
+import re
+import threading
+import time
+
+from backend_client import OLLAMA_BASE_URL, get_backend
+
+# Comma-separated models to load at server start and never unload
+PRELOAD_MODELS = [m.strip() for m in os.environ.get("OLLAMA_PRELOAD_MODELS", "llama3.3").split(",") if m.strip()]
+PINNED_KEEP_ALIVE = -1
+# How long a model stays loaded after its last request
+IN_USE_KEEP_ALIVE = os.environ.get("OLLAMA_IN_USE_KEEP_ALIVE", "30m")
+# Seconds a /api/ps answer is reused; the sidebar asks for it on every rerun of every session
+RESIDENT_CACHE_SECONDS = 5.0
+
+
+def keep_alive_for(model):
+    """keep_alive to send with requests for a model
+
+    Every request resets the model's expiry, so pinned models must keep
+    sending -1 or a chat turn would shorten their pin.
+    """
+    return PINNED_KEEP_ALIVE if model in PRELOAD_MODELS else IN_USE_KEEP_ALIVE
+
+
+class ModelResidency:
+    """Warm-ups and load times for the models on one Ollama server"""
+
+    def __init__(self, base_url=OLLAMA_BASE_URL):
+        self.base_url = base_url
+        # model -> {"state": "loading" | "resident" | "failed", "load_seconds", "wall_seconds", "warmed_at", "error"}
+        self.loads = {}
+        self._lock = threading.Lock()
+        # (time.monotonic() of the fetch, /api/ps models or None if unreachable)
+        self._ps = None
+
+    def warm(self, model, keep_alive=None):
+        """Load a model (no-op if it is resident) and reset its keep_alive; blocks until loaded"""
+        with self._lock:
+            self.loads[model] = {**self.loads.get(model, {}), "state": "loading", "error": None}
+        start = time.perf_counter()
+        try:
+            # An empty prompt loads the model without generating anything
+            response = get_backend("ollama").post(
+                f"{self.base_url}/api/generate",
+                json={"model": model, "prompt": "", "stream": False,
+                      "keep_alive": keep_alive if keep_alive is not None else keep_alive_for(model)},
+            )
+            response.raise_for_status()
+            load_seconds = response.json().get("load_duration", 0) / 1e9
+        except Exception as e:
+            with self._lock:
+                self.loads[model].update(state="failed", error=str(e))
+            return None
+        record = {
+            "state": "resident",
+            "wall_seconds": time.perf_counter() - start,
+            "warmed_at": time.time(),
+        }
+        # A model that was already resident reports a near-zero load; keep the real one
+        if load_seconds > 0.5 or "load_seconds" not in self.loads[model]:
+            record["load_seconds"] = load_seconds
+        with self._lock:
+            self.loads[model].update(record)
+            self._ps = None
+        return self.loads[model]
+
+    def warm_async(self, model, keep_alive=None):
+        """Start warming a model in the background unless a warm-up is already running"""
+        with self._lock:
+            if self.loads.get(model, {}).get("state") == "loading":
+                return
+            self.loads[model] = {**self.loads.get(model, {}), "state": "loading", "error": None}
+        threading.Thread(target=self.warm, args=(model, keep_alive), daemon=True).start()
+
+    def preload(self, models=None):
+        """Warm models one after another in the background, pinned"""
+        models = list(PRELOAD_MODELS if models is None else models)
+
+        def run():
+            for model in models:
+                self.warm(model, keep_alive=PINNED_KEEP_ALIVE)
+
+        threading.Thread(target=run, name="model-preload", daemon=True).start()
+
+    def unload(self, model):
+        get_backend("ollama").post(
+            f"{self.base_url}/api/generate", json={"model": model, "prompt": "", "stream": False, "keep_alive": 0}
+        )
+        with self._lock:
+            self.loads.pop(model, None)
+            self._ps = None
+
+    def _running_models(self):
+        """/api/ps models, reused for RESIDENT_CACHE_SECONDS (a warm-up or unload refreshes it); None if unreachable"""
+        with self._lock:
+            cached = self._ps
+        if cached is not None and time.monotonic() - cached[0] < RESIDENT_CACHE_SECONDS:
+            return cached[1]
+        try:
+            response = get_backend("ollama").get(f"{self.base_url}/api/ps")
+            response.raise_for_status()
+            models = response.json().get("models", [])
+        except Exception:
+            models = None
+        with self._lock:
+            self._ps = (time.monotonic(), models)
+        return models
+
+    def resident(self):
+        """Models loaded on the server with memory use, expiry and recorded load time; None if unreachable"""
+        models = self._running_models()
+        if models is None:
+            return None
+
+        resident = []
+        for entry in models:
+            name = entry.get("name") or entry.get("model")
+            load = self.loads.get(name) or self.loads.get(name.removesuffix(":latest"), {})
+            resident.append({
+                "name": name,
+                "size_gb": entry.get("size", 0) / 1e9,
+                "vram_gb": entry.get("size_vram", 0) / 1e9,
+                "expires": _describe_expiry(entry.get("expires_at")),
+                "load_seconds": load.get("load_seconds"),
+            })
+        return resident
+
+    def loading(self):
+        with self._lock:
+            return [model for model, load in self.loads.items() if load.get("state") == "loading"]
+
+    def failures(self):
+        with self._lock:
+            return {model: load["error"] for model, load in self.loads.items() if load.get("state") == "failed"}
+
+
+# "2024-06-04T14:38:31.83753-07:00" (Ollama prints nanoseconds, fromisoformat takes microseconds)
+EXPIRES_AT = re.compile(r"^([^.]+?)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)$")
+
+
+def _describe_expiry(expires_at):
+    """"pinned", "in 12 min" or "" from Ollama's expires_at"""
+    match = EXPIRES_AT.match(expires_at or "")
+    if not match:
+        return expires_at or ""
+    main, fraction, zone = match.groups()
+    try:
+        expiry = datetime.datetime.fromisoformat(
+            f"{main}.{(fraction or '0')[:6].ljust(6, '0')}{'+00:00' if zone == 'Z' else zone}"
+        )
+    except ValueError:
+        return expires_at
+    if expiry.year > 2100:
+        return "pinned"
+    minutes = (expiry - datetime.datetime.now(datetime.timezone.utc)).total_seconds() / 60
+    return f"in {max(minutes, 0):.0f} min"
+
+
+_residencies = {}
+_residencies_lock = threading.Lock()
+
+
+def get_model_residency(base_url=OLLAMA_BASE_URL):
+    with _residencies_lock:
+        if base_url not in _residencies:
+            _residencies[base_url] = ModelResidency(base_url)
+        return _residencies[base_url]
@@ -0,0 +1,322 @@
+"""Route Ollama requests across several hosts: health checks, least-loaded choice,
+sticky conversations, circuit breaking and optional hedged requests.
+
+Hosts are listed in ollama_hosts.json (or OLLAMA_HOSTS as comma-separated
+URLs) with the models each serves:
+
+    {"hosts": [{"url": "http://box1:11434", "models": ["llama3.3", "qwq"]},
+               {"url": "http://box2:11434"}],
+     "hedge_after_seconds": 8}
+
+A host without "models" serves whatever its /api/tags lists. Without any
+configuration the pool holds the single default host.
+
+Requests go to the healthy host serving the model with the fewest requests
+in flight. A conversation keeps its host while that host stays available,
+so Ollama can reuse the prompt prefix already in its KV cache. After
+BREAKER_FAILURES consecutive failures a host is ejected for
+BREAKER_COOLDOWN seconds, then gets one trial request. With
+hedge_after_seconds set, a request that has not produced its first bytes
+by then is sent to a second host as well, and the first to answer wins.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+import requests
+
+from llm_cancel import GenerationCancelled
+
+HOSTS_FILE = os.environ.get("OLLAMA_HOSTS_FILE", "./ollama_hosts.json")
+HEALTH_INTERVAL = 10
+HEALTH_TIMEOUT = 2
+BREAKER_FAILURES = 3
+BREAKER_COOLDOWN = 30
+# Failed attempts retried on another host before giving up
+MAX_FAILOVERS = 2
+# Conversations remembered for sticky routing
+MAX_STICKY = 10000
+
+
+def _model_tag(model):
+    """"llama3.3" and "llama3.3:latest" name the same model"""
+    return model if ":" in model else f"{model}:latest"
+
+
+class Host:
+    """One Ollama server's health, load and breaker state"""
+
+    def __init__(self, url, models=None):
+        self.url = url.rstrip("/")
+        self.configured_models = {_model_tag(m) for m in models} if models else None
+        self.discovered_models = set()
+        self.healthy = True
+        self.in_flight = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.latency = None
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.last_error = None
+
+    def serves(self, model):
+        models = self.configured_models if self.configured_models is not None else self.discovered_models
+        # Before the first health check an unconfigured host is assumed to serve everything
+        return not models or _model_tag(model) in models
+
+    def available(self, now):
+        if not self.healthy or now < self.open_until:
+            return False
+        # Half-open after a cooldown: one trial request at a time
+        return not (self.failures >= BREAKER_FAILURES and self.in_flight > 0)
+
+    def snapshot(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "breaker": "open" if time.time() < self.open_until else
+                       ("half-open" if self.failures >= BREAKER_FAILURES else "closed"),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "latency_ms": self.latency * 1000 if self.latency is not None else None,
+            "models": sorted(self.configured_models if self.configured_models is not None else self.discovered_models),
+            "last_error": self.last_error,
+        }
+
+
+class HostPool:
+    """Chooses a host per request and keeps the hosts' health and breaker state"""
+
+    def __init__(self, hosts, hedge_after_seconds=None, health_interval=HEALTH_INTERVAL):
+        self.hosts = list(hosts)
+        self.hedge_after_seconds = hedge_after_seconds
+        self.health_interval = health_interval
+        self.sticky = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._session = requests.Session()
+
+    # Health
+
+    def check_health(self):
+        """Ask every host for its model list; unreachable hosts are marked unhealthy"""
+        for host in self.hosts:
+            try:
+                response = self._session.get(f"{host.url}/api/tags", timeout=HEALTH_TIMEOUT)
+                response.raise_for_status()
+                models = {_model_tag(m.get("name") or m.get("model", "")) for m in response.json().get("models", [])}
+                with self._lock:
+                    host.healthy = True
+                    host.discovered_models = models
+            except (requests.RequestException, ValueError) as e:
+                with self._lock:
+                    host.healthy = False
+                    host.last_error = f"health check: {e}"
+
+    def start_health_checks(self):
+        with self._lock:
+            if self._health_thread is not None or len(self.hosts) < 2:
+                return
+            self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            self.check_health()
+            time.sleep(self.health_interval)
+
+    # Routing
+
+    def choose(self, model, sticky_key=None, exclude=()):
+        """The host for a request, or None if no available host serves the model"""
+        now = time.time()
+        with self._lock:
+            candidates = [h for h in self.hosts if h not in exclude and h.serves(model) and h.available(now)]
+            # A lone host is never ejected: there is nowhere else to send the request
+            if not candidates and len(self.hosts) == 1 and self.hosts[0] not in exclude:
+                candidates = self.hosts
+            if not candidates:
+                return None
+            if sticky_key is not None:
+                host = self.sticky.get((sticky_key, model))
+                if host in candidates:
+                    return host
+            host = min(candidates, key=lambda h: (h.in_flight, h.latency or 0.0))
+            if sticky_key is not None:
+                if len(self.sticky) >= MAX_STICKY:
+                    self.sticky.pop(next(iter(self.sticky)))
+                self.sticky[(sticky_key, model)] = host
+            return host
+
+    def started(self, host):
+        with self._lock:
+            host.in_flight += 1
+            host.requests += 1
+
+    def finished(self, host, seconds=None, error=None):
+        """Record the end of a request: latency to first bytes on success, or the error
+
+        A cancelled request (GenerationCancelled) says nothing about the host.
+        """
+        with self._lock:
+            host.in_flight -= 1
+            if isinstance(error, GenerationCancelled):
+                return
+            if error is None:
+                host.failures = 0
+                host.open_until = 0.0
+                if seconds is not None:
+                    host.latency = seconds if host.latency is None else 0.8 * host.latency + 0.2 * seconds
+                return
+            host.errors += 1
+            host.failures += 1
+            host.last_error = str(error)
+            if host.failures >= BREAKER_FAILURES:
+                host.open_until = time.time() + BREAKER_COOLDOWN
+                host.ejections += 1
+
+    def call(self, model, attempt, sticky_key=None):
+        """Run attempt(host) on a chosen host, with failover and optional hedging
+
+        attempt returns (result, close): close() abandons a result that lost a
+        hedge, e.g. by closing its HTTP stream. The host stays "in flight"
+        until finish() is called on the returned handle.
+        """
+        results = queue.Queue()
+        tried = []
+
+        def start(host):
+            tried.append(host)
+            self.started(host)
+
+            def run():
+                begun = time.perf_counter()
+                try:
+                    outcome = attempt(host)
+                except Exception as e:
+                    results.put((host, None, e, 0.0))
+                else:
+                    results.put((host, outcome, None, time.perf_counter() - begun))
+
+            threading.Thread(target=run, daemon=True).start()
+
+        host = self.choose(model, sticky_key)
+        if host is None:
+            raise ConnectionError(f"No available Ollama host serves {model}")
+        start(host)
+        pending = 1
+        hedged = False
+        last_error = None
+        while pending:
+            wait = self.hedge_after_seconds if self.hedge_after_seconds and not hedged else None
+            try:
+                host, outcome, error, seconds = results.get(timeout=wait)
+            except queue.Empty:
+                hedged = True
+                other = self.choose(model, exclude=tried)
+                if other is not None:
+                    with self._lock:
+                        self.hedges += 1
+                    start(other)
+                    pending += 1
+                continue
+            pending -= 1
+
+            if error is not None:
+                self.finished(host, error=error)
+                last_error = error
+                # The caller went away: no point trying another host
+                if not pending and len(tried) <= MAX_FAILOVERS and not isinstance(error, GenerationCancelled):
+                    other = self.choose(model, sticky_key, exclude=tried)
+                    if other is not None:
+                        with self._lock:
+                            self.failovers += 1
+                        start(other)
+                        pending += 1
+                continue
+
+            if hedged and host is not tried[0]:
+                with self._lock:
+                    self.hedge_wins += 1
+                    if sticky_key is not None:
+                        self.sticky[(sticky_key, model)] = host
+            if pending:
+                threading.Thread(target=self._abandon, args=(results, pending), daemon=True).start()
+            return RoutedResult(self, host, outcome[0], outcome[1], seconds)
+        raise last_error
+
+    def _abandon(self, results, pending):
+        """Close the results of hedged attempts that lost"""
+        for _ in range(pending):
+            host, outcome, error, seconds = results.get()
+            if error is not None:
+                self.finished(host, error=error)
+                continue
+            try:
+                outcome[1]()
+            finally:
+                self.finished(host, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            hosts = [host.snapshot() for host in self.hosts]
+            return {"hosts": hosts, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                    "failovers": self.failovers, "sticky": len(self.sticky)}
+
+
+class RoutedResult:
+    """A successful attempt; call finish() when its stream is done to release the host"""
+
+    def __init__(self, pool, host, value, close, seconds):
+        self.pool = pool
+        self.host = host
+        self.value = value
+        self.close = close
+        self.seconds = seconds
+        self._finished = False
+
+    def finish(self, error=None):
+        if not self._finished:
+            self._finished = True
+            self.pool.finished(self.host, None if error is not None else self.seconds, error=error)
+
+
+def load_host_config(path=HOSTS_FILE, default_url=None):
+    """Hosts and hedge setting from ollama_hosts.json, OLLAMA_HOSTS, or the single default host"""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return [Host(h["url"], h.get("models")) for h in config.get("hosts", [])], config.get("hedge_after_seconds")
+    urls = [u.strip() for u in os.environ.get("OLLAMA_HOSTS", "").split(",") if u.strip()]
+    hedge = os.environ.get("OLLAMA_HEDGE_AFTER_SECONDS")
+    return [Host(u) for u in urls or [default_url]], float(hedge) if hedge else None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_host_pool(default_url):
+    """The process-wide host pool, built from the configuration on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            hosts, hedge_after_seconds = load_host_config(default_url=default_url)
+            _pool = HostPool(hosts, hedge_after_seconds)
+            _pool.start_health_checks()
+        return _pool
+
+
+def set_host_pool(pool):
+    """Replace the process-wide pool (stand-in servers, benchmarks)"""
+    global _pool
+    with _pool_lock:
+        _pool = pool
@@ -0,0 +1,128 @@
+"""Parsed-document cache: page texts of uploaded files, keyed by content hash.
+
+Parsing (pypdf in particular) is usually the slowest step of ingestion, and
+its output does not depend on the embedding model or chunk settings. Each
+parsed file is stored once as gzip-compressed JSON holding its normalized page
+texts and metadata, so re-uploading the same file skips the loader entirely.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+from langchain.schema import Document
+
+PARSED_CACHE_DIR = "./parsed_cache"
+PARSED_CACHE_FORMAT = 1
+# Least recently used entries are evicted above this size
+PARSED_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+TRAILING_SPACE = re.compile(r"[ \t]+\n")
+BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def bytes_hash(data):
+    """SHA-256 hex digest of file content"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path):
+    """SHA-256 hex digest of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize_page_text(text):
+    """Normalize loader output: NFC, Unix newlines, no trailing spaces or runs of blank lines"""
+    text = unicodedata.normalize("NFC", text).replace("\x00", "")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = TRAILING_SPACE.sub("\n", text)
+    return BLANK_LINES.sub("\n\n", text).strip()
+
+
+def _entry_path(cache_dir, key):
+    # Two-character fan-out keeps directories small for large libraries
+    return os.path.join(cache_dir, key[:2], f"{key}.json.gz")
+
+
+def read_parsed(key, source_name=None, cache_dir=PARSED_CACHE_DIR):
+    """Return the cached Documents for a content hash, or None on a miss"""
+    path = _entry_path(cache_dir, key)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError, EOFError):
+        return None
+    if entry.get("format") != PARSED_CACHE_FORMAT:
+        return None
+
+    # Touch the entry so eviction keeps recently used files
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    documents = []
+    for page in entry["pages"]:
+        metadata = dict(page["metadata"])
+        metadata["source"] = source_name or entry.get("source", "")
+        documents.append(Document(page_content=page["text"], metadata=metadata))
+    return documents
+
+
+def write_parsed(key, documents, cache_dir=PARSED_CACHE_DIR, max_bytes=PARSED_CACHE_MAX_BYTES):
+    """Store parsed Documents under their content hash
+
+    The "source" metadata is not stored; read_parsed fills in the name of
+    the current upload instead.
+    """
+    path = _entry_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    entry = {
+        "format": PARSED_CACHE_FORMAT,
+        "source": documents[0].metadata.get("source", "") if documents else "",
+        "pages": [
+            {"text": doc.page_content,
+             "metadata": {k: v for k, v in doc.metadata.items() if k != "source"}}
+            for doc in documents
+        ],
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump(entry, f, ensure_ascii=False, separators=(",", ":"), default=str)
+    os.replace(tmp_path, path)
+
+    if max_bytes:
+        prune_parsed_cache(cache_dir, max_bytes)
+
+
+def prune_parsed_cache(cache_dir=PARSED_CACHE_DIR, max_bytes=PARSED_CACHE_MAX_BYTES):
+    """Evict least recently used entries until the cache fits in max_bytes"""
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if name.endswith(".json.gz"):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
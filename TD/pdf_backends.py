@@ -0,0 +1,131 @@
+"""Pluggable PDF text extraction for Reading Q&A.
+
+pypdf (through PyPDFLoader) is always available but is pure Python and slow
+on large, image-heavy books. Faster optional backends are tried first when
+they are installed:
+    pymupdf    pip install pymupdf
+    pypdfium2  pip install pypdfium2
+
+Each file goes through the preferred backends in order. A backend that
+raises, returns no text, or runs longer than the timeout is skipped in
+favour of the next one, ending with pypdf. pypdf, the last resort, runs
+without a timeout: a large book that it can read slowly is still read.
+"""
+import importlib
+import threading
+
+from langchain.schema import Document
+from langchain_community.document_loaders import PyPDFLoader
+
+# Seconds an optional backend may spend on one file before the next backend is tried
+PDF_TIMEOUT_SECONDS = 120
+
+
+def _pymupdf_pages(path):
+    import pymupdf
+    with pymupdf.open(path) as pdf:
+        return [page.get_text("text") for page in pdf]
+
+
+def _pypdfium2_pages(path):
+    import pypdfium2
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        pages = []
+        for page in pdf:
+            text_page = page.get_textpage()
+            pages.append(text_page.get_text_range())
+            text_page.close()
+            page.close()
+        return pages
+    finally:
+        pdf.close()
+
+
+def _pypdf_pages(path):
+    return [doc.page_content for doc in PyPDFLoader(path).load()]
+
+
+# Backend name -> (module that must be importable, page extractor), most preferred first
+PDF_BACKENDS = {
+    "pymupdf": ("pymupdf", _pymupdf_pages),
+    "pypdfium2": ("pypdfium2", _pypdfium2_pages),
+    "pypdf": ("pypdf", _pypdf_pages),
+}
+DEFAULT_PDF_BACKEND = "pypdf"
+
+
+def available_backends():
+    """Names of the installed backends, in order of preference"""
+    names = []
+    for name, (module, _) in PDF_BACKENDS.items():
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def _run_with_timeout(function, path, timeout):
+    """Run function(path) on a daemon thread; raise TimeoutError if it does not finish"""
+    result = {}
+
+    def target():
+        try:
+            result["pages"] = function(path)
+        except Exception as e:
+            result["error"] = e
+
+    worker = threading.Thread(target=target, name="pdf-extract", daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if worker.is_alive():
+        # The thread cannot be killed; it is abandoned and exits when the backend returns
+        raise TimeoutError(f"extraction took longer than {timeout}s")
+    if "error" in result:
+        raise result["error"]
+    return result["pages"]
+
+
+def extract_pages(path, backends=None, timeout=PDF_TIMEOUT_SECONDS):
+    """Return (page texts, backend name) from the first backend that succeeds
+
+    timeout applies to every backend but the last, which has nothing to
+    fall back to. Raises the last backend's error if none succeeds.
+    """
+    candidates = backends or available_backends()
+    if DEFAULT_PDF_BACKEND not in candidates:
+        candidates = list(candidates) + [DEFAULT_PDF_BACKEND]
+
+    error = None
+    for name in candidates:
+        try:
+            if name == candidates[-1]:
+                pages = PDF_BACKENDS[name][1](path)
+            else:
+                pages = _run_with_timeout(PDF_BACKENDS[name][1], path, timeout)
+        except Exception as e:
+            error = e
+            continue
+        # Some backends return empty text for PDFs another can read
+        if any(page.strip() for page in pages) or name == candidates[-1]:
+            return pages, name
+    raise error or ValueError(f"No PDF backend could read {path}")
+
+
+class AutoPDFLoader:
+    """Drop-in replacement for PyPDFLoader that picks the fastest working backend"""
+
+    def __init__(self, file_path, backends=None, timeout=PDF_TIMEOUT_SECONDS):
+        self.file_path = file_path
+        self.backends = backends
+        self.timeout = timeout
+
+    def load(self):
+        pages, backend = extract_pages(self.file_path, self.backends, self.timeout)
+        # Same metadata as PyPDFLoader (0-based page), plus the backend used
+        return [
+            Document(page_content=text, metadata={"source": self.file_path, "page": i, "extractor": backend})
+            for i, text in enumerate(pages)
+        ]
@@ -0,0 +1,223 @@
+"""Columnar on-disk chunk table for Reading Q&A: texts, metadata columns and vectors.
+
+A chunk table is a set of files in one directory, all memory-mappable:
+    texts.bin            UTF-8 chunk texts, concatenated
+    text_offsets.npy     int64 offsets into texts.bin (n_chunks + 1)
+    col_<name>.npy       one metadata field per file: int64 values, or int32
+                         codes into the distinct values listed in columns.json
+    refs_codes.npy       int32 codes of the scripture references cited by each chunk
+    refs_offsets.npy     int64 offsets into refs_codes.npy (n_chunks + 1)
+    vectors.npy          optional float32 embeddings
+    columns.json         column kinds, distinct values and row count
+
+Index bundles store their chunks as a chunk table, so an index can be
+rebuilt, re-quantized or re-embedded from the table alone, and analytics can
+read one column without deserializing every chunk's metadata.
+"""
+import json
+import mmap
+import os
+import re
+
+import numpy as np
+from langchain.schema import Document
+
+TEXTS_FILE = "texts.bin"
+TEXT_OFFSETS_FILE = "text_offsets.npy"
+REFS_CODES_FILE = "refs_codes.npy"
+REFS_OFFSETS_FILE = "refs_offsets.npy"
+VECTORS_FILE = "vectors.npy"
+COLUMNS_FILE = "columns.json"
+
+# Canonical book name for every accepted spelling or abbreviation
+BIBLE_BOOKS = {
+    "Genesis": ["Gen", "Gn"], "Exodus": ["Exod", "Ex"], "Leviticus": ["Lev"], "Numbers": ["Num"],
+    "Deuteronomy": ["Deut", "Dt"], "Joshua": ["Josh"], "Judges": ["Judg"], "Ruth": [],
+    "1 Samuel": ["1 Sam"], "2 Samuel": ["2 Sam"], "1 Kings": ["1 Kgs"], "2 Kings": ["2 Kgs"],
+    "1 Chronicles": ["1 Chr"], "2 Chronicles": ["2 Chr"], "Ezra": [], "Nehemiah": ["Neh"],
+    "Esther": ["Esth"], "Job": [], "Psalms": ["Psalm", "Ps", "Psa"], "Proverbs": ["Prov"],
+    "Ecclesiastes": ["Eccl", "Eccles"], "Song of Songs": ["Song"], "Isaiah": ["Isa"],
+    "Jeremiah": ["Jer"], "Lamentations": ["Lam"], "Ezekiel": ["Ezek"], "Daniel": ["Dan"],
+    "Hosea": ["Hos"], "Joel": [], "Amos": [], "Obadiah": ["Obad"], "Jonah": [], "Micah": ["Mic"],
+    "Nahum": ["Nah"], "Habakkuk": ["Hab"], "Zephaniah": ["Zeph"], "Haggai": ["Hag"],
+    "Zechariah": ["Zech"], "Malachi": ["Mal"], "Matthew": ["Matt", "Mt"], "Mark": ["Mk"],
+    "Luke": ["Lk"], "John": ["Jn"], "Acts": [], "Romans": ["Rom"], "1 Corinthians": ["1 Cor"],
+    "2 Corinthians": ["2 Cor"], "Galatians": ["Gal"], "Ephesians": ["Eph"],
+    "Philippians": ["Phil"], "Colossians": ["Col"], "1 Thessalonians": ["1 Thess"],
+    "2 Thessalonians": ["2 Thess"], "1 Timothy": ["1 Tim"], "2 Timothy": ["2 Tim"], "Titus": [],
+    "Philemon": ["Phlm"], "Hebrews": ["Heb"], "James": ["Jas"], "1 Peter": ["1 Pet"],
+    "2 Peter": ["2 Pet"], "1 John": ["1 Jn"], "2 John": ["2 Jn"], "3 John": ["3 Jn"], "Jude": [],
+    "Revelation": ["Rev"],
+}
+_BOOK_NAMES = {
+    re.sub(r"\s+", "", name).lower(): book
+    for book, abbreviations in BIBLE_BOOKS.items()
+    for name in [book] + abbreviations
+}
+# Book names without their "1 "/"2 "/"3 " prefix; the prefix is matched separately
+_BOOK_STEMS = sorted(
+    {name.split(" ", 1)[1] if name[0].isdigit() else name
+     for book, abbreviations in BIBLE_BOOKS.items() for name in [book] + abbreviations},
+    key=len, reverse=True
+)
+# "John 3:16", "Rom. 8:28-30", "1 Cor 13:4–7"; a verse is required to avoid matching names
+SCRIPTURE_REF = re.compile(
+    r"\b((?:[1-3]\s?)?(?:" + "|".join(map(re.escape, _BOOK_STEMS)) + r"))\.?\s+(\d{1,3}):(\d{1,3})"
+    r"(?:\s?[-–]\s?(\d{1,3}))?\b"
+)
+
+
+def find_scripture_refs(text):
+    """Return the distinct normalized scripture references in text, in order of appearance"""
+    refs = []
+    for match in SCRIPTURE_REF.finditer(text):
+        book = _BOOK_NAMES.get(re.sub(r"\s+", "", match.group(1)).lower())
+        if not book:
+            continue
+        ref = f"{book} {match.group(2)}:{match.group(3)}"
+        if match.group(4):
+            ref += f"-{match.group(4)}"
+        if ref not in refs:
+            refs.append(ref)
+    return refs
+
+
+def write_blob(directory, data_name, offsets_name, items):
+    """Concatenate encoded items into one file plus an offsets array"""
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    with open(os.path.join(directory, data_name), "wb") as f:
+        for i, item in enumerate(items):
+            encoded = item.encode("utf-8")
+            f.write(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+    np.save(os.path.join(directory, offsets_name), offsets)
+
+
+def _column_file(name):
+    return f"col_{re.sub(r'[^0-9A-Za-z_]', '_', name)}.npy"
+
+
+def write_columns(directory, chunks, vectors=None, embedding_model=None):
+    """Write chunk Documents (and optionally their vectors) as a chunk table in directory"""
+    os.makedirs(directory, exist_ok=True)
+    write_blob(directory, TEXTS_FILE, TEXT_OFFSETS_FILE, [c.page_content for c in chunks])
+
+    columns = {}
+    names = list(dict.fromkeys(key for chunk in chunks for key in chunk.metadata))
+    for name in names:
+        values = [chunk.metadata.get(name) for chunk in chunks]
+        if all(type(v) is int for v in values):
+            np.save(os.path.join(directory, _column_file(name)), np.asarray(values, dtype=np.int64))
+            columns[name] = {"kind": "int", "file": _column_file(name)}
+            continue
+        distinct = {}
+        codes = np.full(len(chunks), -1, dtype=np.int32)
+        for i, chunk in enumerate(chunks):
+            if name in chunk.metadata:
+                value = json.dumps(chunk.metadata[name], ensure_ascii=False, sort_keys=True, default=str)
+                codes[i] = distinct.setdefault(value, len(distinct))
+        np.save(os.path.join(directory, _column_file(name)), codes)
+        columns[name] = {"kind": "coded", "file": _column_file(name),
+                         "values": [json.loads(v) for v in distinct]}
+
+    # Scripture references are derived from the text once, at write time
+    ref_values = {}
+    ref_codes = []
+    ref_offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    for i, chunk in enumerate(chunks):
+        refs = find_scripture_refs(chunk.page_content)
+        ref_codes.extend(ref_values.setdefault(ref, len(ref_values)) for ref in refs)
+        ref_offsets[i + 1] = ref_offsets[i] + len(refs)
+    np.save(os.path.join(directory, REFS_CODES_FILE), np.asarray(ref_codes, dtype=np.int32))
+    np.save(os.path.join(directory, REFS_OFFSETS_FILE), ref_offsets)
+
+    table = {"n_rows": len(chunks), "columns": columns, "scripture_refs": list(ref_values)}
+    if vectors is not None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        np.save(os.path.join(directory, VECTORS_FILE), vectors)
+        table["vectors"] = {"dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+                            "embedding_model": embedding_model}
+    with open(os.path.join(directory, COLUMNS_FILE), "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, indent=2)
+
+
+def has_columns(directory):
+    return os.path.isfile(os.path.join(directory, COLUMNS_FILE))
+
+
+class ColumnReader:
+    """Read-only, memory-mapped access to a chunk table"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, COLUMNS_FILE), "r", encoding="utf-8") as f:
+            self.table = json.load(f)
+        self._texts_file = open(os.path.join(directory, TEXTS_FILE), "rb")
+        # mmap refuses zero-length files
+        if os.fstat(self._texts_file.fileno()).st_size == 0:
+            self._texts = b""
+        else:
+            self._texts = mmap.mmap(self._texts_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._text_offsets = self._load(TEXT_OFFSETS_FILE)
+        self._columns = {name: self._load(spec["file"]) for name, spec in self.table["columns"].items()}
+        self._ref_codes = self._load(REFS_CODES_FILE)
+        self._ref_offsets = self._load(REFS_OFFSETS_FILE)
+
+    def _load(self, name):
+        return np.load(os.path.join(self.directory, name), mmap_mode="r")
+
+    def __len__(self):
+        return self.table["n_rows"]
+
+    @property
+    def column_names(self):
+        return list(self.table["columns"])
+
+    def column(self, name):
+        """The raw column array: int64 values, or int32 codes into values(name) (-1 = missing)"""
+        return self._columns[name]
+
+    def values(self, name):
+        """Distinct values of a coded column, or None for an int column"""
+        return self.table["columns"][name].get("values")
+
+    def text(self, i):
+        start, end = int(self._text_offsets[i]), int(self._text_offsets[i + 1])
+        return self._texts[start:end].decode("utf-8")
+
+    def metadata(self, i):
+        metadata = {}
+        for name, spec in self.table["columns"].items():
+            value = self._columns[name][i]
+            if spec["kind"] == "int":
+                metadata[name] = int(value)
+            elif value >= 0:
+                metadata[name] = spec["values"][value]
+        return metadata
+
+    def scripture_refs(self, i):
+        start, end = int(self._ref_offsets[i]), int(self._ref_offsets[i + 1])
+        return [self.table["scripture_refs"][code] for code in self._ref_codes[start:end]]
+
+    def rows_citing(self, ref_prefix):
+        """Chunk positions citing a reference that starts with ref_prefix, e.g. "Romans 8" """
+        wanted = [code for code, ref in enumerate(self.table["scripture_refs"]) if ref.startswith(ref_prefix)]
+        positions = np.flatnonzero(np.isin(self._ref_codes, wanted))
+        return np.unique(np.searchsorted(self._ref_offsets, positions, side="right") - 1)
+
+    def get(self, i):
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    def documents(self):
+        for i in range(len(self)):
+            yield self.get(i)
+
+    def vectors(self):
+        """Memory-mapped float32 embeddings, or None if the table has none"""
+        path = os.path.join(self.directory, VECTORS_FILE)
+        return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+    def close(self):
+        if isinstance(self._texts, mmap.mmap):
+            self._texts.close()
+        self._texts_file.close()
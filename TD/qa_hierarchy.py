@@ -0,0 +1,124 @@
+"""Coarse-to-fine retrieval layers for large Reading Q&A libraries.
+
+Chunks are grouped into sections of consecutive chunks from the same
+document. Each section and each document gets a summary vector: the
+normalized mean of its chunk embeddings. Queries score the sections
+(blended with their document's score), keep the best few, and rank only
+those sections' chunks. This replaces a search over every chunk in the
+library with one over a few hundred.
+"""
+import os
+
+import numpy as np
+
+# Consecutive chunks per section (about 16,000 characters with the default chunk size)
+SECTION_CHUNKS = 16
+# Sections whose chunks are searched in the fine stage
+TOP_SECTIONS = 16
+# Share of the document score in a section's coarse score
+DOCUMENT_WEIGHT = 0.5
+
+SECTION_RANGES_FILE = "sections.npy"
+SECTION_VECTORS_FILE = "section_vectors.npy"
+SECTION_DOCUMENTS_FILE = "section_documents.npy"
+DOCUMENT_VECTORS_FILE = "document_vectors.npy"
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class Hierarchy:
+    """Section ranges and summary vectors over the chunk positions of one index"""
+
+    __slots__ = ("section_ranges", "section_vectors", "section_documents", "document_vectors")
+
+    def __init__(self, section_ranges, section_vectors, section_documents, document_vectors):
+        self.section_ranges = section_ranges
+        self.section_vectors = section_vectors
+        self.section_documents = section_documents
+        self.document_vectors = document_vectors
+
+    def __len__(self):
+        return len(self.section_ranges)
+
+    def top_sections(self, query_vector, n=TOP_SECTIONS, document_weight=DOCUMENT_WEIGHT):
+        """Indexes of the n sections that best match the query, best first"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.section_vectors @ query
+        if document_weight:
+            scores = scores + document_weight * (self.document_vectors @ query)[self.section_documents]
+        n = min(n, len(scores))
+        top = np.argpartition(-scores, n - 1)[:n]
+        return top[np.argsort(-scores[top])]
+
+    def chunk_ids(self, sections):
+        """Chunk positions covered by the given sections"""
+        return np.concatenate([np.arange(*self.section_ranges[s]) for s in sections]) \
+            if len(sections) else np.empty(0, dtype=np.int64)
+
+
+def build_hierarchy(sources, vectors, section_chunks=SECTION_CHUNKS):
+    """Group chunks into sections and compute section and document summary vectors
+
+    sources gives each chunk's document; a section never spans two documents.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    ranges = []
+    section_sources = []
+    start = 0
+    for i in range(1, len(sources) + 1):
+        if i == len(sources) or sources[i] != sources[start] or i - start == section_chunks:
+            ranges.append((start, i))
+            section_sources.append(sources[start])
+            start = i
+
+    section_ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    # Sum per section with one reduceat; sections cover every chunk in order
+    sums = np.add.reduceat(vectors, section_ranges[:, 0], axis=0) if len(ranges) else \
+        np.zeros((0, vectors.shape[1] if vectors.ndim == 2 else 0), dtype=np.float32)
+
+    document_ids = {}
+    section_documents = np.asarray(
+        [document_ids.setdefault(source, len(document_ids)) for source in section_sources], dtype=np.int32
+    )
+    document_sums = np.zeros((len(document_ids), sums.shape[1]), dtype=np.float32)
+    np.add.at(document_sums, section_documents, sums)
+
+    return Hierarchy(section_ranges, _normalize_rows(sums), section_documents, _normalize_rows(document_sums))
+
+
+def save_hierarchy(directory, hierarchy):
+    np.save(os.path.join(directory, SECTION_RANGES_FILE), hierarchy.section_ranges)
+    np.save(os.path.join(directory, SECTION_VECTORS_FILE), hierarchy.section_vectors)
+    np.save(os.path.join(directory, SECTION_DOCUMENTS_FILE), hierarchy.section_documents)
+    np.save(os.path.join(directory, DOCUMENT_VECTORS_FILE), hierarchy.document_vectors)
+
+
+def load_hierarchy(directory):
+    """Memory-map the hierarchy saved in a bundle directory, or None if it has none"""
+    if not os.path.exists(os.path.join(directory, SECTION_RANGES_FILE)):
+        return None
+    return Hierarchy(*(
+        np.load(os.path.join(directory, name), mmap_mode="r")
+        for name in (SECTION_RANGES_FILE, SECTION_VECTORS_FILE, SECTION_DOCUMENTS_FILE, DOCUMENT_VECTORS_FILE)
+    ))
+
+
+def fine_search(index, query_vector, ids, k):
+    """Rank the chunks at positions ids by L2 distance; returns (ids, vectors) of the best k
+
+    Vectors come from index.reconstruct_batch, so only the candidate rows
+    are read, even from a memory-mapped index.
+    """
+    if len(ids) == 0:
+        return ids, np.empty((0, index.d), dtype=np.float32)
+    vectors = index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+    query = np.asarray(query_vector, dtype=np.float32)
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    k = min(k, len(ids))
+    top = np.argpartition(distances, k - 1)[:k]
+    top = top[np.argsort(distances[top])]
+    return np.asarray(ids)[top], vectors[top]
@@ -0,0 +1,154 @@
+"""FAISS index construction for Reading Q&A, with compressed index modes for large libraries."""
+import math
+
+import faiss
+import numpy as np
+from langchain.docstore.base import Docstore
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from index_bundle import PositionalIds
+
+# Selectable index types. "auto" picks one from the corpus size.
+INDEX_TYPES = ["flat", "fp16", "sq8", "hnsw", "ivf", "ivfpq"]
+
+# Corpus-size thresholds (number of chunks) used by choose_index_type
+FLAT_MAX_VECTORS = 5_000
+FP16_MAX_VECTORS = 25_000
+IVF_MAX_VECTORS = 200_000
+
+# IVF search breadth as a fraction of the number of lists
+IVF_NPROBE_FRACTION = 1 / 16
+
+# Upper bound on vectors used to train IVF / PQ / SQ quantizers
+MAX_TRAINING_VECTORS = 50_000
+
+
+def choose_index_type(n_vectors):
+    """Pick an index type for a corpus of n_vectors chunks
+
+    Small corpora stay exact. Mid-sized ones halve memory with float16 storage,
+    and large libraries move to inverted lists, with product quantization once
+    even 8-bit vectors would not fit comfortably in RAM.
+    """
+    if n_vectors <= FLAT_MAX_VECTORS:
+        return "flat"
+    if n_vectors <= FP16_MAX_VECTORS:
+        return "fp16"
+    if n_vectors <= IVF_MAX_VECTORS:
+        return "ivf"
+    return "ivfpq"
+
+
+def _ivf_lists(n_vectors):
+    """Number of inverted lists, keeping at least ~39 training points per list"""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def _pq_subquantizers(dim):
+    """Largest sub-quantizer count <= 64 that divides dim with at least 8 dims each"""
+    for m in range(min(64, dim // 8), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def index_factory_string(index_type, n_vectors, dim):
+    """Return the faiss.index_factory description for an index type"""
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "fp16":
+        return "SQfp16"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "hnsw":
+        return "HNSW32"
+    if index_type == "ivf":
+        return f"IVF{_ivf_lists(n_vectors)},Flat"
+    if index_type == "ivfpq":
+        return f"IVF{_ivf_lists(n_vectors)},PQ{_pq_subquantizers(dim)}x8"
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+def build_index(vectors, index_type="auto"):
+    """Build a FAISS index over vectors and return it with its metadata
+
+    The metadata records the chosen type and factory string so persisted
+    indexes can be reopened and benchmarked consistently.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dim = vectors.shape
+
+    if index_type == "auto":
+        index_type = choose_index_type(n_vectors)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+    # Quantizers need enough points to train; fall back to simpler indexes
+    if index_type == "ivfpq" and n_vectors < 256 * 39:
+        index_type = "ivf"
+    if index_type == "ivf" and n_vectors < 2 * 39:
+        index_type = "flat"
+
+    factory = index_factory_string(index_type, n_vectors, dim)
+    index = faiss.index_factory(dim, factory, faiss.METRIC_L2)
+
+    if not index.is_trained:
+        # A random sample is enough to train the coarse and product quantizers
+        if n_vectors > MAX_TRAINING_VECTORS:
+            sample = np.random.default_rng(0).choice(n_vectors, MAX_TRAINING_VECTORS, replace=False)
+            index.train(vectors[np.sort(sample)])
+        else:
+            index.train(vectors)
+    index.add(vectors)
+
+    info = {
+        "index_type": index_type,
+        "factory": factory,
+        "n_vectors": int(n_vectors),
+        "dim": int(dim),
+    }
+
+    if index_type in ("ivf", "ivfpq"):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = max(1, int(ivf.nlist * IVF_NPROBE_FRACTION))
+        # Needed so retrieval post-processing can reconstruct candidate vectors
+        ivf.make_direct_map()
+        info["nlist"] = int(ivf.nlist)
+        info["nprobe"] = int(ivf.nprobe)
+    elif index_type == "hnsw":
+        index.hnsw.efSearch = 64
+        info["ef_search"] = 64
+
+    return index, info
+
+
+def build_vectorstore(chunks, embeddings, index_type="auto", vectors=None):
+    """Embed chunks and wrap a (possibly compressed) FAISS index in a LangChain vectorstore
+
+    Drop-in replacement for FAISS.from_documents that returns (vectorstore, index_info).
+    Pass vectors to reuse embeddings computed earlier instead of embedding again.
+    chunks may also be a positional docstore such as a ChunkStore, which is
+    then used as the vectorstore's docstore directly.
+    """
+    positional = isinstance(chunks, Docstore)
+    if vectors is None:
+        texts = [chunks.get(i).page_content for i in range(len(chunks))] if positional else \
+            [chunk.page_content for chunk in chunks]
+        vectors = embeddings.embed_documents(texts)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    index, info = build_index(vectors, index_type=index_type)
+
+    if positional:
+        return FAISS(embeddings, index, chunks, PositionalIds(len(chunks))), info
+
+    docstore_ids = [str(i) for i in range(len(chunks))]
+    docstore = InMemoryDocstore(dict(zip(docstore_ids, chunks)))
+    index_to_docstore_id = dict(enumerate(docstore_ids))
+
+    vectorstore = FAISS(embeddings, index, docstore, index_to_docstore_id)
+    return vectorstore, info
+
+
+def index_memory_bytes(index):
+    """Approximate resident size of an index (its serialized size)"""
+    return int(faiss.serialize_index(index).nbytes)
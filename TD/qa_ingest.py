@@ -0,0 +1,97 @@
+"""Headless document loading and chunking for Reading Q&A (no Streamlit dependency)."""
+import os
+
+from langchain_community.document_loaders import Docx2txtLoader, TextLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from boilerplate import strip_boilerplate
+from pdf_backends import AutoPDFLoader
+from parsed_cache import file_hash, normalize_page_text, read_parsed, write_parsed
+
+# Loader class for each supported file extension
+LOADERS = {
+    "pdf": AutoPDFLoader,
+    "docx": Docx2txtLoader,
+    "doc": Docx2txtLoader,
+    "txt": TextLoader,
+    "md": TextLoader,
+}
+SUPPORTED_EXTENSIONS = sorted(LOADERS)
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+
+
+class UnsupportedFileError(ValueError):
+    """Raised for files whose extension has no loader"""
+
+
+def file_extension(filename):
+    """Lower-case extension without the dot"""
+    return filename.split('.')[-1].lower() if '.' in filename else ""
+
+
+def load_file(path, source_name=None, cache_dir=None, key=None):
+    """Load a document file into LangChain Documents
+
+    source_name replaces the loader's "source" metadata, e.g. with the original
+    upload name instead of a temporary file path. With cache_dir, parsed pages
+    are looked up by content hash (key, computed if not given) and the loader
+    only runs on a miss.
+    """
+    extension = file_extension(path)
+    if extension not in LOADERS:
+        raise UnsupportedFileError(f"Unsupported file format: {extension}")
+
+    if cache_dir:
+        key = key or file_hash(path)
+        documents = read_parsed(key, source_name=source_name, cache_dir=cache_dir)
+        if documents is not None:
+            return documents
+
+    documents = LOADERS[extension](path).load()
+    for doc in documents:
+        doc.page_content = normalize_page_text(doc.page_content)
+        if source_name:
+            doc.metadata["source"] = source_name
+
+    if cache_dir:
+        write_parsed(key, documents, cache_dir=cache_dir)
+    return documents
+
+
+def split_documents(documents, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Split documents into retrieval chunks
+
+    Each chunk's metadata gets "start_index", its character offset in the page.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True
+    )
+    return text_splitter.split_documents(documents)
+
+
+def clean_documents(documents, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Strip running headers, footers and page numbers from one file's pages
+
+    Returns (cleaned documents, stats); stats includes the characters and
+    chunks removed.
+    """
+    cleaned, stats = strip_boilerplate(documents)
+    stats["chars_removed"] = stats["chars_before"] - stats["chars_after"]
+    stats["chunks_before"] = len(split_documents(documents, chunk_size, chunk_overlap))
+    stats["chunks_after"] = len(split_documents(cleaned, chunk_size, chunk_overlap))
+    stats["chunks_removed"] = stats["chunks_before"] - stats["chunks_after"]
+    return cleaned, stats
+
+
+def find_document_files(folder):
+    """Recursively list supported files under folder, sorted for stable ordering"""
+    found = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if file_extension(name) in LOADERS and not name.startswith("."):
+                found.append(os.path.join(root, name))
+    return sorted(found)
@@ -0,0 +1,357 @@
+"""Retrieval post-processing for Reading Q&A: MMR selection, dedup, compression and token budgets."""
+import re
+from typing import Any, Dict
+
+import numpy as np
+from langchain.schema import BaseRetriever, Document
+from langchain_community.vectorstores import FAISS
+
+from index_bundle import PositionalIds
+from qa_hierarchy import TOP_SECTIONS, fine_search, load_hierarchy
+from query_embedding import get_query_embedding_service
+
+# Approximate context budget (in tokens) handed to the answer prompt for each model.
+# Local 24B-32B models pay seconds of prefill per extra 1,000 tokens, so keep them tight.
+CONTEXT_TOKEN_BUDGETS = {
+    "llama3.3": 3000,
+    "deepseek-r1:32b": 1500,
+    "qwq": 1500,
+    "openthinker:32b": 1500,
+    "mistral-small:24b": 2500,
+    "gemma3:27b": 2000,
+    "gpt-4o": 6000,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = 2000
+
+# Roughly four characters per token for English prose
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in a text without loading a tokenizer"""
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def get_context_budget(model):
+    """Return the context token budget for a model name"""
+    return CONTEXT_TOKEN_BUDGETS.get(model, DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+
+def _normalize_rows(vectors):
+    """L2-normalize each row so dot products become cosine similarities"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def mmr_select(query_vector, candidate_vectors, k, lambda_mult=0.6):
+    """Select k candidate indices by maximal marginal relevance
+
+    lambda_mult trades relevance (1.0) against diversity (0.0).
+    """
+    if len(candidate_vectors) == 0 or k <= 0:
+        return []
+
+    query = _normalize_rows(np.asarray(query_vector).reshape(1, -1))[0]
+    candidates = _normalize_rows(candidate_vectors)
+
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything already selected
+    max_sim_to_selected = pairwise[selected[0]].copy()
+
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_sim_to_selected
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        max_sim_to_selected = np.maximum(max_sim_to_selected, pairwise[best])
+
+    return selected
+
+
+def _shingles(text, size=5):
+    """Return the set of word n-grams used for near-duplicate detection"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _strip_shared_prefix(previous_text, text, min_overlap=20):
+    """Remove the part of text that repeats the tail of previous_text (splitter overlap)"""
+    max_overlap = min(len(previous_text), len(text))
+    for size in range(max_overlap, min_overlap - 1, -1):
+        if previous_text.endswith(text[:size]):
+            return text[size:].lstrip()
+    return text
+
+
+def dedup_chunks(documents, threshold=0.8):
+    """Drop near-duplicate chunks and trim the overlap shared by neighbouring chunks"""
+    kept = []
+    kept_shingles = []
+
+    for doc in documents:
+        shingles = _shingles(doc.page_content)
+        is_duplicate = False
+        for other in kept_shingles:
+            if not shingles or not other:
+                continue
+            # Containment catches a short chunk that sits entirely inside a longer one
+            overlap = len(shingles & other) / min(len(shingles), len(other))
+            if overlap >= threshold:
+                is_duplicate = True
+                break
+        if is_duplicate:
+            continue
+
+        content = doc.page_content
+        for previous in kept:
+            if previous.metadata.get("source") == doc.metadata.get("source"):
+                content = _strip_shared_prefix(previous.page_content, content)
+        if content != doc.page_content:
+            doc = Document(page_content=content, metadata=dict(doc.metadata))
+
+        kept.append(doc)
+        kept_shingles.append(shingles)
+
+    return kept
+
+
+def pack_to_budget(documents, budget_tokens):
+    """Keep documents in order until the token budget is exhausted"""
+    packed = []
+    used = 0
+    for doc in documents:
+        tokens = estimate_tokens(doc.page_content)
+        if used + tokens > budget_tokens:
+            remaining_chars = (budget_tokens - used) * CHARS_PER_TOKEN
+            # Only truncate when a meaningful piece of the passage still fits
+            if remaining_chars >= 200:
+                cut = doc.page_content[:remaining_chars].rsplit(" ", 1)[0]
+                packed.append(Document(page_content=cut + " ...", metadata=dict(doc.metadata)))
+                used += estimate_tokens(cut)
+            break
+        packed.append(doc)
+        used += tokens
+    return packed, used
+
+
+# Split after sentence punctuation when the next sentence starts like a sentence
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?;])\s+(?=["\'“‘(\[]?[A-Z0-9])')
+
+
+def split_sentences(text):
+    """Split a chunk into sentences, dropping empty fragments"""
+    text = re.sub(r"\s+", " ", text).strip()
+    if not text:
+        return []
+    return [s for s in SENTENCE_BOUNDARY.split(text) if s.strip()]
+
+
+def compress_documents(query_vector, documents, embed_documents, max_sentences=3):
+    """Keep only the sentences of each chunk that best match the query
+
+    All sentences are embedded in one batch and scored with a single matrix
+    product. Kept sentences stay in their original order and the chunk keeps
+    its citation metadata (source, page).
+    """
+    sentences = []
+    owners = []
+    for doc_index, doc in enumerate(documents):
+        for sentence in split_sentences(doc.page_content):
+            sentences.append(sentence)
+            owners.append(doc_index)
+
+    if not sentences:
+        return list(documents)
+
+    query = _normalize_rows(np.asarray(query_vector).reshape(1, -1))[0]
+    scores = _normalize_rows(embed_documents(sentences)) @ query
+    owners = np.asarray(owners)
+
+    # Rank sentences within each chunk: sort by (chunk, -score), then offset from group start
+    order = np.lexsort((-scores, owners))
+    sorted_owners = owners[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_owners, sorted_owners, side="left")
+    keep = np.zeros(len(sentences), dtype=bool)
+    keep[order[rank < max_sentences]] = True
+
+    compressed = []
+    for doc_index, doc in enumerate(documents):
+        positions = np.flatnonzero((owners == doc_index) & keep)
+        if len(positions) == 0:
+            continue
+        kept_sentences = []
+        previous = None
+        for position in positions:
+            # Mark gaps so the model doesn't read two distant sentences as one argument
+            if previous is not None and position != previous + 1:
+                kept_sentences.append("...")
+            kept_sentences.append(sentences[position])
+            previous = position
+
+        metadata = dict(doc.metadata)
+        metadata["sentence_scores"] = [round(float(scores[p]), 3) for p in positions]
+        compressed.append(Document(page_content=" ".join(kept_sentences), metadata=metadata))
+
+    return compressed
+
+
+def select_context(query_vector, documents, vectors, budget_tokens, k=8, lambda_mult=0.6,
+                   embed_documents=None, max_sentences=3):
+    """Run MMR, dedup, optional sentence compression and budget packing over candidates
+
+    Returns the packed documents and a stats dict describing the selection.
+    """
+    order = mmr_select(query_vector, vectors, k, lambda_mult=lambda_mult)
+    selected = dedup_chunks([documents[i] for i in order])
+    after_dedup = len(selected)
+    tokens_in = sum(estimate_tokens(doc.page_content) for doc in selected)
+
+    if embed_documents is not None:
+        selected = compress_documents(query_vector, selected, embed_documents, max_sentences=max_sentences)
+    tokens_out = sum(estimate_tokens(doc.page_content) for doc in selected)
+
+    packed, used = pack_to_budget(selected, budget_tokens)
+
+    stats = {
+        "candidates": len(documents),
+        "selected": len(order),
+        "after_dedup": after_dedup,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "packed": len(packed),
+        "context_tokens": used,
+        "budget_tokens": budget_tokens,
+    }
+    return packed, stats
+
+
+def fetch_candidates(vectorstore, query_vector, fetch_k, search_params=None):
+    """Fetch the nearest chunks and their stored vectors from a LangChain FAISS store
+
+    search_params (faiss.SearchParameters) restricts the search inside the
+    index, e.g. to one course namespace of a shared library.
+    """
+    query = np.asarray([query_vector], dtype=np.float32)
+    if search_params is not None:
+        _, indices = vectorstore.index.search(query, fetch_k, params=search_params)
+    else:
+        _, indices = vectorstore.index.search(query, fetch_k)
+
+    documents = []
+    vectors = []
+    for i in indices[0]:
+        if i == -1:
+            continue
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(i)])
+        if not isinstance(doc, Document):
+            continue
+        documents.append(doc)
+        vectors.append(vectorstore.index.reconstruct(int(i)))
+
+    return documents, np.asarray(vectors, dtype=np.float32)
+
+
+class ContextBudgetRetriever(BaseRetriever):
+    """Retriever that returns a diverse, deduplicated set of chunks within a token budget"""
+
+    vectorstore: Any
+    # Optional in-index filter for vectorstore (see course_library.namespace_search_params)
+    search_params: Any = None
+    # Optional second vectorstore searched together with the first (private uploads)
+    overlay: Any = None
+    # Optional index_bundle.LiveBundle; vectorstore follows its published generations
+    live_bundle: Any = None
+    budget_tokens: int = DEFAULT_CONTEXT_TOKEN_BUDGET
+    k: int = 8
+    fetch_k: int = 24
+    lambda_mult: float = 0.6
+    # Extractive sentence compression before the answer prompt
+    compress: bool = True
+    max_sentences: int = 3
+    # Stats for the most recent query, read by the UI after each answer
+    last_stats: Dict[str, Any] = {}
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _current_vectorstore(self):
+        """Swap to the live bundle's newest generation, if it changed since the last query"""
+        if self.live_bundle is not None:
+            index, store, _ = self.live_bundle.snapshot()
+            if index is not self.vectorstore.index:
+                self.vectorstore = FAISS(self.vectorstore.embeddings, index, store, PositionalIds(index.ntotal))
+        return self.vectorstore
+
+    def _fetch_candidates(self, query_vector):
+        """Candidate chunks and vectors from the main vectorstore"""
+        return fetch_candidates(self.vectorstore, query_vector, self.fetch_k, self.search_params)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        self._current_vectorstore()
+        # Cached and micro-batched with the other sessions' questions
+        query_vector = get_query_embedding_service(self.vectorstore.embeddings).embed_query(query)
+        documents, vectors = self._fetch_candidates(query_vector)
+        if self.overlay is not None:
+            overlay_documents, overlay_vectors = fetch_candidates(self.overlay, query_vector, self.fetch_k)
+            if overlay_documents:
+                documents = documents + overlay_documents
+                vectors = np.vstack([vectors, overlay_vectors]) if len(vectors) else overlay_vectors
+        if not documents:
+            self.last_stats = {"candidates": 0, "packed": 0, "tokens_in": 0, "tokens_out": 0,
+                               "context_tokens": 0, "budget_tokens": self.budget_tokens}
+            return []
+
+        packed, stats = select_context(
+            query_vector, documents, vectors, self.budget_tokens,
+            k=self.k, lambda_mult=self.lambda_mult,
+            embed_documents=self.vectorstore.embeddings.embed_documents if self.compress else None,
+            max_sentences=self.max_sentences
+        )
+        self.last_stats = stats
+        return packed
+
+
+class HierarchicalRetriever(ContextBudgetRetriever):
+    """ContextBudgetRetriever whose candidates come from a coarse-to-fine search
+
+    The best sections are picked from their summary vectors first, then only
+    their chunks are ranked (see qa_hierarchy). Without a hierarchy, or
+    inside a course namespace, it falls back to the flat search.
+    """
+
+    hierarchy: Any = None
+    top_sections: int = TOP_SECTIONS
+    # Index the hierarchy belongs to, so a live-bundle swap reloads it
+    hierarchy_index: Any = None
+
+    def _current_vectorstore(self):
+        vectorstore = super()._current_vectorstore()
+        if self.live_bundle is not None and self.hierarchy_index is not vectorstore.index:
+            self.hierarchy = load_hierarchy(vectorstore.docstore.path)
+            self.hierarchy_index = vectorstore.index
+        return vectorstore
+
+    def _fetch_candidates(self, query_vector):
+        if self.hierarchy is None or self.search_params is not None:
+            return super()._fetch_candidates(query_vector)
+
+        sections = self.hierarchy.top_sections(query_vector, self.top_sections)
+        ids, vectors = fine_search(self.vectorstore.index, query_vector,
+                                   self.hierarchy.chunk_ids(sections), self.fetch_k)
+        documents = []
+        kept = []
+        for row, i in enumerate(ids):
+            doc = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[int(i)])
+            if isinstance(doc, Document):
+                documents.append(doc)
+                kept.append(row)
+        return documents, np.asarray(vectors[kept], dtype=np.float32)
@@ -0,0 +1,216 @@
+"""Shared query-embedding service for concurrent Reading Q&A sessions.
+
+Every Reading Q&A question used to embed its query with its own HTTP call
+to Ollama. The service is shared by every session in the process and keeps
+an LRU cache of query vectors, so a repeated question costs nothing. Queries
+that arrive within a few milliseconds of each other are collected into one
+micro-batch: identical questions in a batch are embedded once, and the
+batch is dispatched together with bounded concurrency so a classroom of
+students doesn't open dozens of simultaneous requests.
+
+Queue wait and batch size are recorded as histograms (see stats()).
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Queue
+
+# Query vectors kept per embedding model
+CACHE_SIZE = 1024
+# Largest batch and longest time the first query in a batch waits for others
+MAX_BATCH = 32
+MAX_WAIT_MS = 5
+# Embedding requests in flight per batch
+MAX_CONCURRENCY = 4
+
+QUEUE_WAIT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+def normalize_query(text):
+    """Collapse whitespace so trivially different copies of a question share a cache entry"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class Histogram:
+    """Counts of observations per bucket; bucket i holds values up to bounds[i]"""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+
+    def buckets(self):
+        """(label, count) pairs, e.g. ("≤5", 12) and (">1000", 0)"""
+        labels = [f"≤{b:g}" for b in self.bounds] + [f">{self.bounds[-1]:g}"]
+        return list(zip(labels, self.counts))
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class QueryEmbeddingService:
+    """LRU-cached, micro-batched embed_query for one embeddings model"""
+
+    def __init__(self, embeddings, cache_size=CACHE_SIZE, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS,
+                 max_concurrency=MAX_CONCURRENCY):
+        self.embeddings = embeddings
+        self.cache_size = cache_size
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="query-embed")
+        self._worker = None
+
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_BUCKETS_MS)
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.requests = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.embedded = 0
+        self.errors = 0
+
+    def _cached(self, key):
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def embed_query(self, text):
+        """Embedding of a query, as embeddings.embed_query(normalize_query(text))"""
+        key = normalize_query(text)
+        with self._lock:
+            self.requests += 1
+        vector = self._cached(key)
+        if vector is not None:
+            with self._lock:
+                self.cache_hits += 1
+            return list(vector)
+
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((key, future, time.perf_counter()))
+        return list(future.result())
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="query-embed-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        """Block for the first query, then take whatever else arrives within max_wait"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            waiters = OrderedDict()
+            for key, future, enqueued in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000)
+                waiters.setdefault(key, []).append(future)
+            self.batch_sizes.observe(len(batch))
+            self.coalesced += len(batch) - len(waiters)
+            self._embed_batch(waiters)
+
+    def _embed_batch(self, waiters):
+        keys = []
+        for key, futures in waiters.items():
+            # Another batch may have embedded it while this one was collecting
+            vector = self._cached(key)
+            if vector is not None:
+                with self._lock:
+                    self.cache_hits += len(futures)
+                for future in futures:
+                    future.set_result(vector)
+            else:
+                keys.append(key)
+
+        futures = {key: self._pool.submit(self.embeddings.embed_query, key) for key in keys}
+        for key, request in futures.items():
+            try:
+                vector = tuple(request.result())
+            except Exception as e:
+                self.errors += 1
+                for future in waiters[key]:
+                    future.set_exception(e)
+                continue
+            self.embedded += 1
+            self._remember(key, vector)
+            for future in waiters[key]:
+                future.set_result(vector)
+
+    def stats(self):
+        with self._lock:
+            cached = len(self._cache)
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "hit_rate": self.cache_hits / self.requests if self.requests else 0.0,
+            "coalesced": self.coalesced,
+            "embedded": self.embedded,
+            "errors": self.errors,
+            "cached": cached,
+            "batches": self.batch_sizes.count,
+            "mean_batch_size": self.batch_sizes.mean(),
+            "mean_queue_wait_ms": self.queue_wait_ms.mean(),
+            "batch_sizes": self.batch_sizes.buckets(),
+            "queue_wait_ms": self.queue_wait_ms.buckets(),
+        }
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def _embeddings_key(embeddings):
+    return (type(embeddings).__name__, getattr(embeddings, "model", None), getattr(embeddings, "base_url", None))
+
+
+def get_query_embedding_service(embeddings):
+    """The process-wide service for an embeddings model, shared by every session"""
+    key = _embeddings_key(embeddings)
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = _services[key] = QueryEmbeddingService(embeddings)
+        return service
+
+
+def all_query_embedding_stats():
+    """{model name: stats} for every service created in this process"""
+    with _services_lock:
+        services = dict(_services)
+    return {key[1] or key[0]: service.stats() for key, service in services.items()}
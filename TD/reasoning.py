@@ -0,0 +1,150 @@
+"""Separate the <think> reasoning of reasoning models from their answers.
+
+deepseek-r1, qwq and openthinker write a long <think>...</think> section
+before the answer. Shown as part of the answer it buries the reply, and kept
+in ConversationBufferMemory it is sent back with every later turn, often
+thousands of tokens each time. ThinkStreamParser splits a token stream into
+reasoning and answer text, including tags split across tokens.
+AnswerOnlyMemory keeps only the answers in chat history, and strip_think()
+cleans finished text before it is saved.
+"""
+import re
+
+from langchain.memory import ConversationBufferMemory
+from langchain.schema import get_buffer_string
+
+from qa_retrieval import estimate_tokens
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+REASONING_MODELS = ("deepseek-r1", "qwq", "openthinker")
+# Tokens allowed for reasoning on top of a capped answer (see length_control)
+THINK_TOKEN_ALLOWANCE = 4000
+# Characters of untagged output held back in case a </think> follows
+HOLD_CHARS = 200
+THINK_BLOCK = re.compile(r"<think>.*?(?:</think>|$)", re.DOTALL)
+
+
+def is_reasoning_model(model):
+    return any(name in (model or "") for name in REASONING_MODELS)
+
+
+def split_think(text):
+    """(reasoning, answer) of a finished completion
+
+    Also handles an unclosed block (the answer never started) and a closing
+    tag without an opening one, which some templates produce by putting
+    <think> in the prompt.
+    """
+    if THINK_CLOSE in text and THINK_OPEN not in text.split(THINK_CLOSE, 1)[0]:
+        reasoning, answer = text.split(THINK_CLOSE, 1)
+        return reasoning.strip(), strip_think(answer)
+    reasoning = "\n".join(block[len(THINK_OPEN):].replace(THINK_CLOSE, "").strip()
+                          for block in THINK_BLOCK.findall(text))
+    return reasoning.strip(), THINK_BLOCK.sub("", text).strip()
+
+
+def strip_think(text):
+    """The completion without its reasoning"""
+    return split_think(text)[1]
+
+
+class ThinkStreamParser:
+    """Routes streamed tokens to reasoning or answer, holding back partial tags
+
+    Like split_think, a </think> before any <think> makes everything before
+    it reasoning. Text before the first tag is held back for HOLD_CHARS
+    characters in case that happens. If the closing tag comes later than
+    that, the answer streamed so far moves to the reasoning, so display
+    from the reasoning and answer attributes rather than the returned pieces.
+    """
+
+    def __init__(self):
+        self.thinking = False
+        self.reasoning = ""
+        self.answer = ""
+        self._seen_tag = False
+        self._held = ""
+        self._pending = ""
+
+    def _tags(self):
+        if self.thinking:
+            return (THINK_CLOSE,)
+        return (THINK_OPEN,) if self._seen_tag else (THINK_OPEN, THINK_CLOSE)
+
+    def feed(self, token):
+        """Add a token; returns the (reasoning, answer) text it completed"""
+        text = self._pending + token
+        self._pending = ""
+        reasoning, answer = "", ""
+        while text:
+            tags = self._tags()
+            found = [(text.find(tag), tag) for tag in tags if tag in text]
+            if found:
+                index, tag = min(found)
+                emitted, text = text[:index], text[index + len(tag):]
+            else:
+                # Keep back an ending that could be the start of a tag
+                keep = max(next((n for n in range(min(len(tag) - 1, len(text)), 0, -1)
+                                 if tag.startswith(text[-n:])), 0) for tag in tags)
+                emitted, self._pending = text[:len(text) - keep], text[len(text) - keep:]
+                tag, text = None, ""
+            if self.thinking:
+                reasoning += emitted
+            elif self._seen_tag:
+                answer += emitted
+            else:
+                self._held += emitted
+            if tag is None:
+                continue
+            if tag == THINK_CLOSE and not self.thinking:
+                # The block was opened in the prompt: everything so far was reasoning
+                reasoning += self.answer + answer + self._held
+                self.answer, answer = "", ""
+            else:
+                answer += self._held
+                self.thinking = not self.thinking
+            self._held = ""
+            self._seen_tag = True
+        if not self._seen_tag and len(self._held) >= HOLD_CHARS:
+            answer += self._held
+            self._held = ""
+        # Models put blank lines after </think>; don't start the answer with them
+        if not self.answer:
+            answer = answer.lstrip()
+        self.reasoning += reasoning
+        self.answer += answer
+        return reasoning, answer
+
+    def flush(self):
+        """Emit anything held back at the end of the stream"""
+        pending = self._held + self._pending
+        self._held, self._pending = "", ""
+        if self.thinking:
+            self.reasoning += pending
+            return pending, ""
+        if not self.answer:
+            pending = pending.lstrip()
+        self.answer += pending
+        return "", pending
+
+
+class AnswerOnlyMemory(ConversationBufferMemory):
+    """ConversationBufferMemory that stores replies without their <think> reasoning
+
+    reasoning_tokens counts the tokens left out, so the prompt size can be
+    compared with what the plain memory would send.
+    """
+
+    reasoning_tokens: int = 0
+
+    def save_context(self, inputs, outputs):
+        output_key = self.output_key or next(iter(outputs))
+        reasoning, answer = split_think(outputs[output_key])
+        self.reasoning_tokens += estimate_tokens(reasoning)
+        super().save_context(inputs, {**outputs, output_key: answer})
+
+    def prompt_tokens(self, question):
+        """(tokens with reasoning kept, tokens sent) for the history plus the next question"""
+        sent = estimate_tokens(get_buffer_string(self.chat_memory.messages)) + estimate_tokens(question)
+        return sent + self.reasoning_tokens, sent
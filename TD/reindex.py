@@ -0,0 +1,106 @@
+"""Rebuild a saved index bundle from its chunk table, without re-parsing any document.
+
+Usage:
+    python reindex.py indexes/systematic_theology --index-type ivfpq    # re-quantize stored vectors
+    python reindex.py indexes/systematic_theology --reembed --model nomic-embed-text
+    python reindex.py library --refs "Romans 8"                         # chunks citing a passage
+
+Re-quantizing reads the stored vectors.npy column. Re-embedding reads only
+the texts column. Either way, the rebuilt bundle replaces the old one; a
+versioned bundle gets a new generation.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from backend_client import ollama_embeddings
+from index_bundle import (
+    is_versioned_bundle, publish_bundle_generation, read_bundle_manifest, resolve_bundle_path,
+    save_index_bundle,
+)
+from qa_columns import ColumnReader, has_columns
+from qa_index import INDEX_TYPES, build_index
+
+# Manifest keys that describe the old build rather than the bundle's contents
+REBUILT_KEYS = ("format_version", "n_chunks", "index", "generation")
+
+
+def open_chunk_table(path):
+    """ColumnReader over the live generation of a bundle"""
+    path = resolve_bundle_path(path)
+    if not has_columns(path):
+        raise ValueError(f"{path} is a format 1 bundle without a chunk table; re-save it first")
+    return ColumnReader(path)
+
+
+def reindex_bundle(path, index_type="auto", embeddings=None, embedding_model=None, batch_size=32, log=print):
+    """Rebuild a bundle's FAISS index from its chunk table; re-embed when embeddings is given
+
+    Returns the rebuilt index info.
+    """
+    manifest = read_bundle_manifest(path)
+    table = open_chunk_table(path)
+    chunks = list(table.documents())
+
+    start = time.perf_counter()
+    if embeddings is not None:
+        texts = [chunk.page_content for chunk in chunks]
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            vectors.extend(embeddings.embed_documents(texts[i:i + batch_size]))
+        vectors = np.asarray(vectors, dtype=np.float32)
+        log(f"Re-embedded {len(chunks)} chunks with {embedding_model} in {time.perf_counter() - start:.1f}s")
+    else:
+        vectors = table.vectors()
+        if vectors is None:
+            raise ValueError("Bundle has no stored vectors; use --reembed")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        embedding_model = manifest.get("index", {}).get("embedding_model")
+    table.close()
+
+    start = time.perf_counter()
+    index, info = build_index(vectors, index_type=index_type)
+    info["embedding_model"] = embedding_model
+    log(f"Built {info['index_type']} index over {info['n_vectors']} vectors in {time.perf_counter() - start:.1f}s")
+
+    extra = {key: value for key, value in manifest.items() if key not in REBUILT_KEYS}
+    if "embedding_model" in extra:
+        extra["embedding_model"] = embedding_model
+    if is_versioned_bundle(path):
+        publish_bundle_generation(path, index, chunks, info, extra=extra, vectors=vectors)
+    else:
+        save_index_bundle(path, index, chunks, info, extra=extra, vectors=vectors)
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("bundle", help="Bundle directory, e.g. indexes/<name> or library")
+    parser.add_argument("--index-type", default="auto", choices=["auto"] + INDEX_TYPES)
+    parser.add_argument("--reembed", action="store_true", help="Re-embed the stored texts")
+    parser.add_argument("--model", default="llama3.3", help="Ollama embedding model for --reembed")
+    parser.add_argument("--refs", help="List the chunks citing a scripture reference instead of rebuilding")
+    args = parser.parse_args()
+
+    try:
+        if args.refs:
+            table = open_chunk_table(args.bundle)
+            sources = table.values("source") or []
+            source_codes = table.column("source") if "source" in table.column_names else None
+            for row in table.rows_citing(args.refs):
+                source = sources[source_codes[row]] if source_codes is not None and source_codes[row] >= 0 else ""
+                print(f"{row:>7}  {source}  {', '.join(table.scripture_refs(row))}")
+            return
+
+        reindex_bundle(
+            args.bundle, index_type=args.index_type,
+            embeddings=ollama_embeddings(args.model) if args.reembed else None,
+            embedding_model=args.model if args.reembed else None
+        )
+    except ValueError as e:
+        print(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
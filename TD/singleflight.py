@@ -0,0 +1,206 @@
+"""Coalesce identical in-flight requests into one backend call.
+
+When a class is asked the same question, many sessions send the same prompt
+within seconds. A request whose key (model, parameters and prompt) matches
+one that is still running does not start its own generation: it attaches
+to the running one. Streams are read by one producer thread into a shared
+buffer; each attached reader replays what has arrived so far and then
+follows new lines as they come, so late joiners still get every token.
+
+Only requests that overlap in time are coalesced. Once a call finishes, the
+next identical request starts a new one (repeats over time are the
+completion cache's job). When the last reader of a stream stops reading,
+the functions the producer registered with on_abandon run at once (they
+close the backend stream, so the server stops generating), and the producer
+stops.
+"""
+import hashlib
+import json
+import threading
+
+from llm_cancel import POLL_INTERVAL
+
+
+def request_key(*parts):
+    """Stable hash of JSON-serialisable request parts"""
+    data = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.readers = 0
+        self.abandoned = False
+        self.closers = []
+        self.changed = threading.Condition()
+
+    def on_abandon(self, close):
+        """Run close() when the last reader leaves before the stream ends (now, if it already has)"""
+        with self.changed:
+            if not self.abandoned:
+                self.closers.append(close)
+                return
+        close()
+
+
+class SingleFlight:
+    """Shares one in-flight call among identical concurrent requests"""
+
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def _join(self, key):
+        """The running flight for key with this reader attached, or a new one; returns (flight, leader)"""
+        with self._lock:
+            self.requests += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                with flight.changed:
+                    if not flight.abandoned:
+                        flight.readers += 1
+                        self.coalesced += 1
+                        return flight, False
+            flight = _Flight()
+            flight.readers = 1
+            self._flights[key] = flight
+            return flight, True
+
+    def _land(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stream(self, key, produce, poll=None):
+        """Iterate the items of produce(on_abandon), shared with identical concurrent streams
+
+        poll() is called every POLL_INTERVAL while waiting and after each item;
+        it raises to stop reading (see llm_cancel).
+        """
+        flight, leader = self._join(key)
+        if leader:
+            threading.Thread(target=self._produce, args=(key, flight, produce),
+                             name=f"{self.name}-stream", daemon=True).start()
+        return self._follow(flight, poll)
+
+    def _produce(self, key, flight, produce):
+        items = None
+        try:
+            items = produce(flight.on_abandon)
+            for item in items:
+                with flight.changed:
+                    flight.items.append(item)
+                    flight.changed.notify_all()
+                    if flight.abandoned:
+                        # Nobody is reading any more: stop the generation
+                        break
+        except Exception as e:
+            with flight.changed:
+                flight.error = e
+        finally:
+            self._land(key, flight)
+            if items is not None and hasattr(items, "close"):
+                items.close()
+            with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+    def _follow(self, flight, poll=None):
+        position = 0
+        try:
+            while True:
+                if poll is not None:
+                    poll()
+                with flight.changed:
+                    if position >= len(flight.items) and not flight.done:
+                        flight.changed.wait(POLL_INTERVAL if poll is not None else None)
+                    available = flight.items[position:]
+                    done, error = flight.done, flight.error
+                position += len(available)
+                yield from available
+                if done and position >= len(flight.items):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            with flight.changed:
+                flight.readers -= 1
+                abandon = flight.readers == 0 and not flight.done and not flight.abandoned
+                closers = []
+                if abandon:
+                    flight.abandoned = True
+                    closers, flight.closers = flight.closers, []
+            if abandon:
+                with self._lock:
+                    self.abandoned += 1
+                # Close the stream now rather than when the next line arrives:
+                # a model still reading a long prompt may not send one for minutes
+                for close in closers:
+                    try:
+                        close()
+                    except Exception:
+                        pass
+
+    def call(self, key, fn):
+        """fn(), shared with identical concurrent calls"""
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                result = fn()
+            except Exception as e:
+                with flight.changed:
+                    flight.error = e
+                raise
+            else:
+                with flight.changed:
+                    flight.items.append(result)
+            finally:
+                self._land(key, flight)
+                with flight.changed:
+                    flight.done = True
+                    flight.readers -= 1
+                    flight.changed.notify_all()
+            return result
+
+        with flight.changed:
+            while not flight.done:
+                flight.changed.wait()
+            flight.readers -= 1
+        if flight.error is not None:
+            raise flight.error
+        return flight.items[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "abandoned": self.abandoned,
+                "hit_rate": self.coalesced / self.requests if self.requests else 0.0,
+                "in_flight": len(self._flights),
+            }
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+def get_singleflight(name):
+    """The process-wide coalescing group for one kind of request"""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def singleflight_stats():
+    with _groups_lock:
+        groups = dict(_groups)
+    return {name: group.stats() for name, group in groups.items()}
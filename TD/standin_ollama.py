@@ -0,0 +1,183 @@
+"""A stand-in Ollama server for exercising routing, scheduling and streaming without a GPU.
+
+Usage:
+    python standin_ollama.py --port 11501 --models llama3.3 qwq
+    python standin_ollama.py --port 11502 --first-token 2.0 --fail-rate 0.2
+
+Serves /api/tags, /api/ps, /api/chat, /api/generate and /api/embeddings with
+the response shapes of the real server. Replies are canned text streamed
+word by word after a configurable first-token delay, with the response
+headers held back until the first token as the real server does; embeddings are
+deterministic hashes of the prompt. start_standin() runs one in-process.
+"""
+import argparse
+import hashlib
+import json
+import random
+import select
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ("Grace is the unmerited favour of God toward humanity, given freely and received by faith "
+         "rather than earned by works.")
+EMBEDDING_DIM = 64
+
+
+def fake_embedding(text, dim=EMBEDDING_DIM):
+    """Deterministic vector for a text"""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    rng = random.Random(digest)
+    return [rng.uniform(-1, 1) for _ in range(dim)]
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, obj, status=200):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _failing(self):
+        server = self.server
+        server.requests += 1
+        if server.down or random.random() < server.fail_rate:
+            server.failed += 1
+            self._reply({"error": "stand-in failure"}, status=500)
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            if self.server.down:
+                return self._reply({"error": "down"}, status=503)
+            return self._reply({"models": [{"name": m, "model": m} for m in self.server.models]})
+        if self.path == "/api/ps":
+            return self._reply({"models": [{"name": m, "model": m, "size": 0, "size_vram": 0,
+                                            "expires_at": "2318-08-27T12:00:00-07:00"} for m in self.server.loaded]})
+        self._reply({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self._failing():
+            return
+        model = body.get("model", "")
+        if self.path == "/api/embeddings":
+            time.sleep(self.server.embed_delay)
+            return self._reply({"embedding": fake_embedding(body.get("prompt", ""))})
+        if self.path not in ("/api/chat", "/api/generate"):
+            return self._reply({"error": "not found"}, status=404)
+        if self.server.models and model not in self.server.models and f"{model}:latest" not in self.server.models:
+            return self._reply({"error": f"model '{model}' not found"}, status=404)
+
+        self.server.loaded.add(model)
+        if self.path == "/api/generate" and not body.get("prompt"):
+            return self._reply({"model": model, "done": True, "load_duration": 0})
+        self._stream(model, body)
+
+    def _stream(self, model, body):
+        chat = self.path == "/api/chat"
+        words = REPLY.split(" ")
+        if body.get("options", {}).get("num_predict"):
+            words = (words * 100)[:body["options"]["num_predict"]]
+        self.server.active += 1
+        try:
+            # Like Ollama, send the headers with the first token, after the prompt is read
+            self._read_prompt(float(self.server.first_token))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, word in enumerate(words):
+                token = word if i == 0 else " " + word
+                part = {"model": model, "done": False}
+                part.update({"message": {"role": "assistant", "content": token}} if chat else {"response": token})
+                self._chunk(json.dumps(part) + "\n")
+                time.sleep(self.server.token_delay)
+            final = {"model": model, "done": True, "prompt_eval_count": len(json.dumps(body)) // 4,
+                     "eval_count": len(words), "total_duration": 0, "load_duration": 0}
+            final.update({"message": {"role": "assistant", "content": ""}} if chat else {"response": ""})
+            self._chunk(json.dumps(final) + "\n")
+            self._chunk("")
+            self.server.completed += 1
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream: stop generating, as Ollama does
+            self.server.cancelled += 1
+        finally:
+            self.server.active -= 1
+
+    def _read_prompt(self, seconds):
+        """Wait out the prompt evaluation, stopping early if the client goes away"""
+        deadline = time.perf_counter() + seconds
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            readable, _, _ = select.select([self.connection], [], [], min(remaining, 0.05))
+            if readable and not self.connection.recv(1, socket.MSG_PEEK):
+                raise ConnectionResetError("client closed the request during prompt evaluation")
+
+    def _chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, models=(), first_token=0.05, token_delay=0.01, embed_delay=0.002, fail_rate=0.0):
+        super().__init__(address, StandinHandler)
+        self.models = list(models)
+        self.first_token = first_token
+        self.token_delay = token_delay
+        self.embed_delay = embed_delay
+        self.fail_rate = fail_rate
+        self.down = False
+        self.loaded = set()
+        self.requests = 0
+        self.failed = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.active = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+def start_standin(port=0, **options):
+    """Run a stand-in server on a background thread; returns the server (see .url)"""
+    server = StandinServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11501)
+    parser.add_argument("--models", nargs="*", default=["llama3.3"])
+    parser.add_argument("--first-token", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between tokens")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    args = parser.parse_args()
+
+    server = StandinServer(("127.0.0.1", args.port), models=args.models, first_token=args.first_token,
+                           token_delay=args.token_delay, fail_rate=args.fail_rate)
+    print(f"Stand-in Ollama serving {', '.join(args.models) or 'any model'} on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""Per-call telemetry for LLM and embedding requests.
+
+Every chat model made by backend_client.chat_model() carries
+TelemetryCallbackHandler, which times each call from start to first token
+to end and reads the token counts the backend reports: Ollama's
+prompt_eval_count/eval_count, or OpenAI's token_usage. Where a backend
+reports none, the counts are estimated from the text. The app says what a
+call is for (mode, operation, queue wait) with telemetry_context() around
+the call.
+
+A call cancelled part way (see llm_cancel) is recorded as cancelled, with
+an estimate of the generation time saved. The estimate is the tokens the call
+would still have produced, taken from its num_predict or the median of recent
+calls for the same model and operation, divided by its generation rate.
+
+One JSON record per call goes to a rotating JSONL file (TELEMETRY_PATH,
+rotated at TELEMETRY_MAX_BYTES with TELEMETRY_BACKUPS old files kept), so
+every app process writes to the same log and load_records() sees them all.
+"""
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+import numpy as np
+from langchain.callbacks.base import BaseCallbackHandler
+
+from llm_cancel import is_cancellation
+from qa_retrieval import estimate_tokens
+
+TELEMETRY_PATH = os.environ.get("LLM_TELEMETRY_PATH", "./telemetry/llm_calls.jsonl")
+TELEMETRY_MAX_BYTES = 10 * 1024 * 1024
+TELEMETRY_BACKUPS = 5
+# Timings summarised per group on the dashboard
+SUMMARY_FIELDS = ("ttft_s", "tokens_per_s", "queue_wait_s", "duration_s")
+# Completed calls per model and operation remembered for estimating what a cancellation saved
+HISTORY_SIZE = 200
+
+_logger = None
+_logger_lock = threading.Lock()
+_context = threading.local()
+
+
+def _telemetry_logger():
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            os.makedirs(os.path.dirname(TELEMETRY_PATH) or ".", exist_ok=True)
+            handler = RotatingFileHandler(TELEMETRY_PATH, maxBytes=TELEMETRY_MAX_BYTES,
+                                          backupCount=TELEMETRY_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _logger = logging.getLogger("llm_telemetry")
+            _logger.setLevel(logging.INFO)
+            _logger.propagate = False
+            _logger.addHandler(handler)
+        return _logger
+
+
+def record_call(**fields):
+    """Append one call record to the telemetry log"""
+    record = {"time": datetime.datetime.now().isoformat(timespec="milliseconds")}
+    record.update(fields)
+    _telemetry_logger().info(json.dumps(record, default=str))
+    return record
+
+
+@contextmanager
+def telemetry_context(**fields):
+    """Label the LLM calls made in this thread inside the block (mode, operation, queue_wait_s, ...)"""
+    previous = getattr(_context, "fields", {})
+    _context.fields = {**previous, **fields}
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+def current_context():
+    return dict(getattr(_context, "fields", {}))
+
+
+class _Call:
+    def __init__(self, model, prompt_text, context, num_predict=None):
+        self.model = model
+        self.num_predict = num_predict
+        self.prompt_text = prompt_text
+        self.context = context
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.streamed_tokens = 0
+
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    """Records prompt/completion tokens, time to first token, generation rate and errors for each LLM call"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        # (model, operation) -> recent (completion tokens, tokens/s) of completed calls
+        self._history = {}
+        self.cancelled = 0
+        self.saved_seconds = 0.0
+
+    def on_llm_start(self, serialized, prompts, *, run_id, invocation_params=None, **kwargs):
+        params = invocation_params or {}
+        model = params.get("model") or params.get("model_name") or "unknown"
+        num_predict = (params.get("options") or {}).get("num_predict") or params.get("max_tokens")
+        with self._lock:
+            self._calls[run_id] = _Call(model, "\n".join(prompts), current_context(), num_predict)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        call = self._calls.get(run_id)
+        if call is None:
+            return
+        if call.first_token is None:
+            call.first_token = time.perf_counter()
+        call.streamed_tokens += 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        info = (generation.generation_info or {}) if generation is not None else {}
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        text = generation.text if generation is not None else ""
+
+        prompt_tokens = info.get("prompt_eval_count") or usage.get("prompt_tokens") or estimate_tokens(call.prompt_text)
+        completion_tokens = (info.get("eval_count") or usage.get("completion_tokens")
+                             or call.streamed_tokens or estimate_tokens(text))
+        end = time.perf_counter()
+        if info.get("eval_duration"):
+            # Ollama reports its own generation time, free of network and queueing
+            tokens_per_s = completion_tokens / (info["eval_duration"] / 1e9)
+        else:
+            generating = end - (call.first_token or call.start)
+            tokens_per_s = completion_tokens / generating if generating > 0 else None
+        if tokens_per_s:
+            with self._lock:
+                key = (call.model, call.context.get("operation"))
+                self._history.setdefault(key, deque(maxlen=HISTORY_SIZE)).append((completion_tokens, tokens_per_s))
+        self._record(call, end, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                     tokens_per_s=tokens_per_s)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        end = time.perf_counter()
+        fields = {"prompt_tokens": estimate_tokens(call.prompt_text), "completion_tokens": call.streamed_tokens}
+        if not is_cancellation(error):
+            self._record(call, end, error=f"{type(error).__name__}: {error}", **fields)
+            return
+        saved = self._saved_seconds(call, end)
+        with self._lock:
+            self.cancelled += 1
+            self.saved_seconds += saved or 0.0
+        self._record(call, end, cancelled=True, saved_s=saved, **fields)
+
+    def _saved_seconds(self, call, end):
+        """Estimated generation seconds the server did not spend because the call was cancelled"""
+        with self._lock:
+            history = list(self._history.get((call.model, call.context.get("operation")), ()))
+        expected = call.num_predict if call.num_predict and call.num_predict > 0 else None
+        if expected is None and history:
+            expected = float(np.median([tokens for tokens, _ in history]))
+        if call.first_token is not None and call.streamed_tokens > 1 and end > call.first_token:
+            rate = call.streamed_tokens / (end - call.first_token)
+        elif history:
+            rate = float(np.median([rate for _, rate in history]))
+        else:
+            rate = None
+        if expected is None or not rate:
+            return None
+        return max(expected - call.streamed_tokens, 0) / rate
+
+    def cancellation_stats(self):
+        with self._lock:
+            return {"cancelled": self.cancelled, "saved_seconds": self.saved_seconds}
+
+    def _record(self, call, end, **fields):
+        record_call(
+            kind="llm",
+            model=call.model,
+            ttft_s=call.first_token - call.start if call.first_token is not None else None,
+            duration_s=end - call.start,
+            **call.context,
+            **fields,
+        )
+
+
+telemetry_handler = TelemetryCallbackHandler()
+
+
+def load_records(path=TELEMETRY_PATH, limit=20000):
+    """The most recent records from the log and its rotated files, oldest first"""
+    files = [f"{path}.{n}" for n in range(TELEMETRY_BACKUPS, 0, -1)] + [path]
+    records = []
+    for name in files:
+        if not os.path.exists(name):
+            continue
+        with open(name, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records[-limit:]
+
+
+def summarize(records, by):
+    """Per-group call and error counts, mean tokens, and p50/p95 of each timing in SUMMARY_FIELDS"""
+    groups = {}
+    for record in records:
+        groups.setdefault(record.get(by) or "other", []).append(record)
+    rows = []
+    for name, group in sorted(groups.items()):
+        row = {by: name, "calls": len(group), "errors": sum(1 for r in group if r.get("error")),
+               "cancelled": sum(1 for r in group if r.get("cancelled")),
+               "saved_s": sum(r.get("saved_s") or 0.0 for r in group)}
+        for field in ("prompt_tokens", "completion_tokens"):
+            values = [r[field] for r in group if r.get(field) is not None]
+            row[f"mean {field}"] = round(float(np.mean(values))) if values else None
+        for field in SUMMARY_FIELDS:
+            values = [r[field] for r in group
+                      if r.get(field) is not None and not r.get("error") and not r.get("cancelled")]
+            p50, p95 = np.percentile(values, [50, 95]) if values else (None, None)
+            row[f"{field} p50"] = p50
+            row[f"{field} p95"] = p95
+        rows.append(row)
+    return rows
@@ -0,0 +1,21 @@
+from langchain.schema import Document
+
+from boilerplate import strip_boilerplate
+
+
+def page(text, n):
+    return Document(page_content=text, metadata={"source": "book.pdf", "page": n})
+
+
+def test_page_numbers_are_removed_and_one_word_lines_kept():
+    documents = [
+        page("xii\nThe Peace of Westphalia ended the wars of religion.\nCivil", 0),
+        page("Page 13\nA treaty, in the end, that nobody wanted.\nI", 1),
+        page("- xiv -\nThe princes chose the faith of their lands.\nVivid", 2),
+        page("15\nAnd the settlement held for a century.\ndid", 3),
+    ]
+    cleaned, stats = strip_boilerplate(documents)
+    lines = [line for doc in cleaned for line in doc.page_content.split("\n")]
+    assert not {"xii", "Page 13", "- xiv -", "15"} & set(lines)
+    assert {"Civil", "I", "Vivid", "did"} <= set(lines)
+    assert stats["lines_removed"] == 4
@@ -0,0 +1,27 @@
+import hashlib
+
+import numpy as np
+from langchain.schema import Document
+
+from course_library import ingest_course, list_courses, remove_course
+
+
+class HashEmbeddings:
+    def embed_documents(self, texts):
+        return [np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest(), dtype=np.uint8)[:16] / 255.0
+                for text in texts]
+
+
+def course_chunks(course_id, n):
+    return [Document(page_content=f"{course_id} reading {i}", metadata={"source": f"{course_id}.pdf"})
+            for i in range(n)]
+
+
+def test_ingesting_courses_keeps_the_others(tmp_path):
+    library = str(tmp_path / "library")
+    for course_id, n in (("A", 12), ("B", 15), ("C", 20)):
+        ingest_course(course_id, course_chunks(course_id, n), HashEmbeddings(), "test", library_path=library)
+    assert list_courses(library) == {"A": 12, "B": 15, "C": 20}
+
+    remove_course("B", library_path=library)
+    assert list_courses(library) == {"A": 12, "C": 20}
@@ -0,0 +1,34 @@
+import threading
+
+import library_watcher
+from library_watcher import LibraryWatcher
+
+
+def test_failed_update_is_retried(tmp_path, monkeypatch):
+    folder = tmp_path / "readings"
+    folder.mkdir()
+    (folder / "week1.txt").write_text("Grace and nature")
+    attempts = []
+    indexed = threading.Event()
+
+    def index_folder(*args, keys=None, **kwargs):
+        attempts.append(keys)
+        if len(attempts) == 1:
+            raise RuntimeError("embedding backend unavailable")
+        indexed.set()
+        return {"generation_path": "gen-2", "index": {"n_vectors": 1}, "embeddings": 1}
+
+    monkeypatch.setattr(library_watcher, "index_folder", index_folder)
+    watcher = LibraryWatcher(str(folder), str(tmp_path / "bundle"), None, "test", log=lambda message: None)
+    watcher._worker.start()
+    try:
+        previous = None
+        for _ in range(50):
+            previous = watcher.poll_once(previous)
+            if indexed.wait(0.05):
+                break
+    finally:
+        watcher.stop()
+    assert len(attempts) == 2
+    assert attempts[0] == attempts[1]
+    assert watcher._published == attempts[1]
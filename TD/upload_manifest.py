@@ -0,0 +1,44 @@
+"""Upload manifest for Reading Q&A: detect exactly which uploaded files changed between reruns.
+
+Each upload is identified by the SHA-256 of its content, so swapping one file
+for another is detected even when the number of files stays the same, and a
+file that is still in the uploader is never processed again.
+"""
+from parsed_cache import bytes_hash
+
+
+def manifest_entry(uploaded_file, previous=None):
+    """Return {file_id, name, size, hash} for a Streamlit UploadedFile
+
+    The content is only hashed the first time an upload is seen; later reruns
+    reuse the hash recorded for the same file_id and size.
+    """
+    file_id = getattr(uploaded_file, "file_id", None) or getattr(uploaded_file, "id", None)
+    for entry in (previous or {}).values():
+        if file_id is not None and entry["file_id"] == file_id and entry["size"] == uploaded_file.size:
+            return dict(entry, name=uploaded_file.name)
+    return {
+        "file_id": file_id,
+        "name": uploaded_file.name,
+        "size": uploaded_file.size,
+        "hash": bytes_hash(uploaded_file.getvalue()),
+    }
+
+
+def build_manifest(uploaded_files, previous=None):
+    """Return {hash: entry} for the current uploads, in upload order
+
+    Duplicate uploads of the same content collapse into one entry.
+    """
+    manifest = {}
+    for uploaded_file in uploaded_files or []:
+        entry = manifest_entry(uploaded_file, previous)
+        manifest.setdefault(entry["hash"], entry)
+    return manifest
+
+
+def diff_manifests(old, new):
+    """Return (added, removed) content hashes between two manifests"""
+    added = [key for key in new if key not in old]
+    removed = [key for key in old if key not in new]
+    return added, removed